@@ -1,19 +1,45 @@
 import logging
 
+from bisect import bisect_left, insort
 from queue import Empty
+from time import monotonic, monotonic_ns
 
 import numpy as np
 
+from app import latency
+
 logger = logging.getLogger(__name__)
 
+# batch modes: one item at a time, drain the queue and publish every book,
+# or drain the queue and publish the last book of each symbol
+OFF = 'off'
+LOSSLESS = 'lossless'
+CONFLATE = 'conflate'
+BATCH_MODES = (OFF, LOSSLESS, CONFLATE)
+# below this many live entries a full sort is cheaper than partial selection
+SELECT_MIN_ENTRIES = 256
+# key of the outbound items carrying a symbol's provider names,
+# (time, PROVIDERS, (symbol, names)), sent before books using new codes
+PROVIDERS = '__providers__'
+# book provider columns hold codes into the symbol's provider names
+PROVIDER_DTYPE = 'uint16'
+
 
 class BookBuilder():
+    # pylint: disable=R0902,R0913
     def __init__(self,
                  inbound_queue,      # inbound work (from pricefeed)
                  outbound_queue,     # outbound work (to filewriter)
                  shutdown_event,     # publisher shutdown?
                  shutdown_consumer,  # shutdown consumer?
-                 max_levels=10):
+                 max_levels=10,
+                 incremental_sort=True,
+                 batch=OFF,
+                 max_batch=1024,
+                 suppress_unchanged=False,
+                 ignore_level_times=False,
+                 stats_interval=60,  # seconds between stats
+                 tracer=None):       # a latency.LatencyTracer, items carry stamps
         logger.info('Initialising Book Builder')
         # queues
         self.inbound_queue = inbound_queue
@@ -25,7 +51,28 @@ class BookBuilder():
         assert max_levels > 0
         self.max_levels = max_levels
         self.schema = np.zeros(1, dtype=create_schema(max_levels))
-        # internal state
+        self.views = create_views(self.schema, max_levels)
+        # keep quotes sorted as they change rather than sorting every book
+        self.incremental_sort = incremental_sort
+        # drain up to max_batch items at a time, see BATCH_MODES
+        assert batch in BATCH_MODES
+        assert max_batch > 0
+        self.batch = batch
+        self.max_batch = max_batch
+        # skip books whose levels match the symbol's last published book,
+        # comparing prices, sizes, providers and (unless ignored) level times
+        self.suppress_unchanged = suppress_unchanged
+        self.compare_ranges = compare_ranges(self.schema, max_levels, ignore_level_times)
+        self.last_published = {}
+        self.stats_interval = stats_interval
+        self.reset_stats()
+        # conflated books have no single item to take the stamps of
+        assert tracer is None or batch != CONFLATE
+        self.tracer = tracer
+        # internal state, provider codes are per symbol so that each file
+        # has its own dictionary of names
+        self.providers = {}
+        self.published_providers = {}  # names sent per symbol
         self.quotes = {}
 
     def run(self):
@@ -36,7 +83,10 @@ class BookBuilder():
                 item = self.inbound_queue.get(block=True, timeout=1)
             except Empty:
                 continue
-            self.process_item(item)
+            if self.batch == OFF:
+                self.process_item(item)
+            else:
+                self.process_batch(self.drain(item))
         self.shutdown()
 
     def shutdown(self):
@@ -48,15 +98,95 @@ class BookBuilder():
                 item = self.inbound_queue.get(block=False)
             except Empty:
                 break
-            self.process_item(item)
+            if self.batch == OFF:
+                self.process_item(item)
+            else:
+                self.process_batch(self.drain(item))
+        if self.batch != OFF or self.suppress_unchanged:
+            self.log_stats()
+        if self.tracer is not None:
+            self.tracer.dump()
         self.inbound_queue.close()
         self.inbound_queue.join_thread()
         logger.info('Triggering shutdown of consumer')
         self.shutdown_consumer.set()
         logger.info('Shutdown complete!')
 
+    def drain(self, item):
+        """item and whatever else is waiting, up to max_batch items"""
+        items = [item]
+        while len(items) < self.max_batch:
+            try:
+                items.append(self.inbound_queue.get(block=False))
+            except Empty:
+                break
+        return items
+
+    def process_batch(self, items):
+        """Apply items in order, publishing a book for each or, when
+        conflating, one book per symbol with the time of its last update,
+        in order of those times"""
+        if self.batch == CONFLATE:
+            latest = {}
+            for item in items:
+                time, symbol = self.apply_item(item)
+                # moved to the end, so ties keep the order of last updates
+                latest.pop(symbol, None)
+                latest[symbol] = time
+            # a batch spanning midnight must not publish the new day first
+            for symbol, time in sorted(latest.items(), key=lambda latest: latest[1]):
+                self.publish(time, symbol)
+            self.conflated += len(items) - len(latest)
+        else:
+            for item in items:
+                self.process_item(item)
+        # stats
+        self.batches += 1
+        self.batch_items += len(items)
+        self.max_batch_items = max(self.max_batch_items, len(items))
+        if monotonic() - self.stats_time >= self.stats_interval:
+            self.log_stats()
+
+    def log_stats(self):
+        if self.batch != OFF:
+            logger.info('%i batches of %.1f items on average (largest %i), '
+                        '%i updates conflated',
+                        self.batches, self.batch_items / max(1, self.batches),
+                        self.max_batch_items, self.conflated)
+        if self.suppress_unchanged:
+            logger.info('%i of %i books unchanged and suppressed',
+                        self.suppressed, self.books)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.batches = 0
+        self.batch_items = 0
+        self.max_batch_items = 0
+        self.conflated = 0
+        self.books = 0
+        self.suppressed = 0
+        self.stats_time = monotonic()
+
     def process_item(self, item):
         """Update quotes and publish a book"""
+        if self.tracer is not None:
+            return self.process_traced(item)
+        time, symbol = self.apply_item(item)
+        return self.publish(time, symbol)
+
+    def process_traced(self, item):
+        """process_item of an item carrying the pricefeed's stamps, which
+        are passed on with the book, along with our own"""
+        entered = monotonic_ns()
+        received, queued = item[4]
+        time, symbol = self.apply_item(item[:4])
+        self.tracer.record_since(latency.INBOUND, symbol, queued, entered)
+        book = self.publish(time, symbol, (received, queued, entered))
+        self.tracer.tick()
+        return book
+
+    def apply_item(self, item):
+        """Update quotes of a symbol, returns the item's time and symbol"""
         time, symbol, new_quotes, snapshot = item
         logger.debug('Processing %i new quote(s) for %s @ %s (snapshot: %r)',
                      len(new_quotes), symbol, time, snapshot)
@@ -64,118 +194,379 @@ class BookBuilder():
         current_quotes = self.quotes.get(symbol)
         if current_quotes is None:
             logger.debug('First quote of the session for %s', symbol)
-            current_quotes = {}
+            current_quotes = QuoteState(self.providers_of(symbol), ordered=self.incremental_sort)
         if snapshot:
             previous_quotes = current_quotes
-            current_quotes = {}
+            current_quotes = QuoteState(current_quotes.providers, ordered=self.incremental_sort)
         # apply updates
         updated_quotes = update_quotes(time, current_quotes, new_quotes)
         # restore previous quote time if snapshot is not changing quote values
         if snapshot:
-            for key, new in updated_quotes.items():
-                old = previous_quotes.get(key)
-                if old and (old["price"] == new["price"] and
-                            old["size"] == new["size"] and
-                            old["provider"] == new["provider"]):
-                    new["time"] = old["time"]
+            updated_quotes.restore_times(previous_quotes)
         self.quotes[symbol] = updated_quotes
-        # build new book
-        book = build_book(time, updated_quotes.values(), np.copy(self.schema), self.max_levels)
+        return time, symbol
+
+    def providers_of(self, symbol):
+        providers = self.providers.get(symbol)
+        if providers is None:
+            providers = Providers()
+            self.providers[symbol] = providers
+        return providers
+
+    def publish(self, time, symbol, stamps=None):
+        """Build a symbol's book and put it on the outbound queue, unless
+        suppressing unchanged books and it is one"""
+        book = build_book(time, self.quotes[symbol], self.schema, self.max_levels, self.views)
+        if self.suppress_unchanged:
+            if self.batch == OFF and monotonic() - self.stats_time >= self.stats_interval:
+                self.log_stats()
+            self.books += 1
+            levels = book_levels(book, self.compare_ranges)
+            if self.last_published.get(symbol) == levels:
+                self.suppressed += 1
+                return None
+            self.last_published[symbol] = levels
+        # names first, so the consumer can decode every code in the book
+        names = self.quotes[symbol].providers.names
+        if self.published_providers.get(symbol, 0) != len(names):
+            self.outbound_queue.put((time, PROVIDERS, (symbol, tuple(names))))
+            self.published_providers[symbol] = len(names)
+        # the row is reused, but the queue pickles in a background thread
+        book = book.copy()
         # push book to outbound queue
-        self.outbound_queue.put((time, symbol, book))
+        if stamps is None:
+            self.outbound_queue.put((time, symbol, book))
+        else:
+            built = monotonic_ns()
+            self.tracer.record_since(latency.BUILD, symbol, stamps[latency.ENTERED], built)
+            self.outbound_queue.put((time, symbol, book, stamps + (built,)))
         # return book to aid testing
         return book
 
 
+class Providers():
+    """Interns provider names to small integer codes, 0 is no provider. Codes
+    are never reused, so names only grow."""
+    def __init__(self):
+        self.codes = {'': 0}
+        self.names = ['']
+
+    def code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = len(self.names)
+            if code > np.iinfo(PROVIDER_DTYPE).max:
+                raise ValueError('Too many providers for %s codes' % PROVIDER_DTYPE)
+            logger.info('New provider %r (%i)', name, code)
+            self.codes[name] = code
+            self.names.append(name)
+        return code
+
+
+class QuoteSide():
+    """One side of a symbol's quotes held in preallocated arrays, indexed by
+    a QuoteEntryID to slot map. Free slots have zero size.
+
+    When ordered, live (size > 0) slots are also kept in price order, best
+    price first, so the top of the book is a slice rather than a sort.
+
+    Entries on the same price are ordered by arrival sequence, the earliest
+    first on the ask side and the latest first on the bid side. The
+    dict-based quotes left ties in whatever order an unstable argsort gave."""
+    def __init__(self, capacity=16, descending=False, ordered=False):
+        self.slots = {}
+        self.free = list(range(capacity - 1, -1, -1))
+        # time, price and size share one array, laid out like a book side
+        # (bid_time0..N, bid_px0..N, bid_size0..N) so one take copies all three
+        self.values = np.zeros((3, capacity), dtype='uint64')
+        self.bind()
+        self.provider = np.zeros(capacity, dtype=PROVIDER_DTYPE)
+        # arrival order of entries, breaks ties on price
+        self.sequence = np.zeros(capacity, dtype='uint64')
+        self.next_sequence = 0
+        # sorted (price, sequence, slot) keys and each slot's current key
+        self.descending = descending
+        self.ordered = ordered
+        self.order = []
+        self.keys = [None] * capacity
+
+    def __len__(self):
+        return len(self.slots)
+
+    def bind(self):
+        """Point time, price and size at their rows of values"""
+        self.time = self.values[0]
+        self.price = self.values[1].view('float64')
+        self.size = self.values[2].view('float64')
+
+    def allocate(self, entry_id):
+        """Assign a slot to a new entry, growing the arrays if needed"""
+        if not self.free:
+            capacity = len(self.price)
+            logger.debug('Growing quote side to %i entries', 2 * capacity)
+            for name in ('values', 'provider', 'sequence'):
+                column = getattr(self, name)
+                grown = np.zeros(column.shape[:-1] + (2 * capacity,), dtype=column.dtype)
+                grown[..., :capacity] = column
+                setattr(self, name, grown)
+            self.bind()
+            self.keys.extend([None] * capacity)
+            self.free = list(range(2 * capacity - 1, capacity - 1, -1))
+        slot = self.free.pop()
+        self.slots[entry_id] = slot
+        self.sequence[slot] = self.next_sequence
+        self.next_sequence += 1
+        return slot
+
+    def release(self, entry_id):
+        slot = self.slots.pop(entry_id)
+        self.price[slot] = 0
+        self.size[slot] = 0
+        self.time[slot] = 0
+        self.provider[slot] = 0
+        if self.ordered:
+            self.reorder(slot)
+        self.free.append(slot)
+
+    def reorder(self, slot):
+        """Move slot to its sorted position after its price or size changed"""
+        old_key = self.keys[slot]
+        new_key = None
+        if self.size[slot] > 0:
+            price = float(self.price[slot])
+            sequence = int(self.sequence[slot])
+            if self.descending:
+                new_key = (-price, -sequence, slot)
+            else:
+                new_key = (price, sequence, slot)
+        if new_key == old_key:
+            return
+        if old_key is not None:
+            del self.order[bisect_left(self.order, old_key)]
+        if new_key is not None:
+            insort(self.order, new_key)
+        self.keys[slot] = new_key
+
+    def top(self, number_of_levels):
+        """Slots of the best number_of_levels live entries"""
+        return [key[2] for key in self.order[:number_of_levels]]
+
+
+class QuoteState():
+    """Bid and offer quotes of a single symbol"""
+    def __init__(self, providers, capacity=16, ordered=True):
+        self.providers = providers
+        self.ordered = ordered
+        self.sides = (QuoteSide(capacity, descending=True, ordered=ordered),
+                      QuoteSide(capacity, descending=False, ordered=ordered))
+
+    def __len__(self):
+        return len(self.sides[0]) + len(self.sides[1])
+
+    def restore_times(self, previous):
+        """Keep time of entries whose price, size and provider are unchanged"""
+        for side, previous_side in zip(self.sides, previous.sides):
+            for entry_id, slot in side.slots.items():
+                old = previous_side.slots.get(entry_id)
+                if old is not None and (side.price[slot] == previous_side.price[old] and
+                                        side.size[slot] == previous_side.size[old] and
+                                        side.provider[slot] == previous_side.provider[old]):
+                    side.time[slot] = previous_side.time[old]
+
+    def to_dict(self):
+        """Quotes as {'B' + entry_id: {...}, 'S' + entry_id: {...}}"""
+        quotes = {}
+        for entry_type, prefix in enumerate('BS'):
+            side = self.sides[entry_type]
+            for entry_id, slot in side.slots.items():
+                quotes[prefix + entry_id] = {
+                    'entry_type': entry_type,
+                    'price': float(side.price[slot]),
+                    'size': float(side.size[slot]),
+                    'provider': self.providers.names[side.provider[slot]],
+                    'time': int(side.time[slot]),
+                }
+        return quotes
+
+    @classmethod
+    def from_dict(cls, quotes, providers, ordered=True):
+        """Inverse of to_dict, entries are added in dict order"""
+        state = cls(providers, ordered=ordered)
+        for key, quote in quotes.items():
+            side = state.sides[quote['entry_type']]
+            slot = side.allocate(key[1:])
+            side.price[slot] = quote['price']
+            side.size[slot] = quote['size']
+            side.time[slot] = quote['time']
+            side.provider[slot] = providers.code(quote['provider'])
+            if side.ordered:
+                side.reorder(slot)
+        return state
+
+
 def update_quotes(time, current_quotes, quotes):
     """Process quote updates"""
+    bids, asks = current_quotes.sides
+    providers = current_quotes.providers
     for quote in quotes:
         entry_id, bid_size, ask_size, bid_price, ask_price, bid_provider, ask_provider = quote
         # bid
         if bid_size is not None or bid_price is not None:
-            entry_key = 'B' + entry_id
-            bid_entry = update_entry(current_quotes.get(entry_key), 0,
-                                     time, bid_size, bid_price, bid_provider)
-            if bid_entry:
-                current_quotes[entry_key] = bid_entry
-            else:
-                del current_quotes[entry_key]
+            update_entry(bids, providers, entry_id, time, bid_size, bid_price, bid_provider)
         # ask
         if ask_size is not None or ask_price is not None:
-            entry_key = 'S' + entry_id
-            ask_entry = update_entry(current_quotes.get(entry_key), 1,
-                                     time, ask_size, ask_price, ask_provider)
-            if ask_entry:
-                current_quotes[entry_key] = ask_entry
-            else:
-                del current_quotes[entry_key]
+            update_entry(asks, providers, entry_id, time, ask_size, ask_price, ask_provider)
     return current_quotes
 
 
-def update_entry(quote_entry, entry_type, time, size, price, provider):
-    """Helper function to create/update individual quote entry"""
-    logger.debug('%r %r %r %r %r', entry_type, time, size, price, provider)
-    if quote_entry is None:
-        quote_entry = {'entry_type': entry_type}
+def update_entry(side, providers, entry_id, time, size, price, provider):
+    """Helper function to create/update/delete individual quote entry"""
+    logger.debug('%r %r %r %r %r', entry_id, time, size, price, provider)
+    slot = side.slots.get(entry_id)
+    if size == -1:
+        if slot is not None:
+            side.release(entry_id)
+        return
+    if slot is None:
+        slot = side.allocate(entry_id)
+        if provider is None:
+            logger.warning('No provider for quote entry %r, defaulting to ""', entry_id)
     if price is not None:
-        quote_entry['price'] = price
+        side.price[slot] = price
     if size is not None:
-        if size == -1:
-            # fast exit
-            return None
-        quote_entry['size'] = size
+        side.size[slot] = size
     if provider is not None:
-        quote_entry['provider'] = provider
-    if 'provider' not in quote_entry:
-        logger.warning('No provider for quote entry %r, defaulting to ""', quote_entry)
-        quote_entry['provider'] = ''
-    quote_entry['time'] = time
-    return quote_entry
+        side.provider[slot] = providers.code(provider)
+    side.time[slot] = time
+    if side.ordered:
+        side.reorder(slot)
 
 
-def flip_quotes(quotes, entry_type, descending):
-    """Filter and transpose list of dicts into list of sorted lists"""
-    # NOTE: does NOT sort on qty/time in the event of a tie on price
-    # filter based on entry_type, discard prices with zero qty
-    filtered = list(filter(lambda x: x['entry_type'] == entry_type and x['size'] > 0, quotes))
-    # pull out rows into columns
-    entries = [[d[k] for d in filtered] for k in ['time', 'price', 'size', 'provider']]
-    times = entries[0]
-    prices = entries[1]
-    sizes = entries[2]
-    providers = entries[3]
+def sorted_slots(side, descending):
+    """Slots of live entries sorted by price, ties ordered by arrival
+    sequence, earliest first (latest first when descending)"""
+    # discard free slots and prices with zero qty
+    live = np.flatnonzero(side.size > 0)
     # index to sort ascending/descending
-    sort_idx = np.argsort(prices)[::-1 if descending else 1]
+    sort_idx = live[np.lexsort((side.sequence[live], side.price[live]))]
+    if descending:
+        sort_idx = sort_idx[::-1]
+    return sort_idx
+
+
+def select_slots(side, descending, number_of_levels, min_entries=SELECT_MIN_ENTRIES):
+    """Same as sorted_slots(side, descending)[:number_of_levels], but only
+    sorts the entries priced at or better than the number_of_levels-th best
+    price, found by partial selection. Keeping every entry tied with that
+    price orders ties by arrival sequence, as sorted_slots does. Sides with fewer than min_entries
+    live entries are fully sorted."""
+    live = np.flatnonzero(side.size > 0)
+    if len(live) <= max(number_of_levels, min_entries):
+        return sorted_slots(side, descending)[:number_of_levels]
+    prices = side.price[live]
+    if descending:
+        kth = len(live) - number_of_levels
+        candidates = live[prices >= prices[np.argpartition(prices, kth)[kth]]]
+    else:
+        kth = number_of_levels - 1
+        candidates = live[prices <= prices[np.argpartition(prices, kth)[kth]]]
+    sort_idx = candidates[np.lexsort((side.sequence[candidates], side.price[candidates]))]
+    if descending:
+        sort_idx = sort_idx[::-1]
+    return sort_idx[:number_of_levels]
+
+
+def flip_quotes(quotes, entry_type, descending):
+    """Filter and transpose a side of quotes into sorted lists"""
+    # NOTE: does NOT sort on qty/time in the event of a tie on price,
+    # ties are ordered by arrival sequence (latest first when descending)
+    side = quotes.sides[entry_type]
+    sort_idx = sorted_slots(side, descending)
     # apply sorting
-    return ([times[x] for x in sort_idx],
-            [prices[x] for x in sort_idx],
-            [sizes[x] for x in sort_idx],
-            [providers[x] for x in sort_idx])
-
-
-def build_book(time, quotes, schema, number_of_levels=10):
-    """Constructs a book based on list of quotes"""
-    bid_times, bid_prices, bid_sizes, bid_providers = flip_quotes(quotes, 0, True)
-    ask_times, ask_prices, ask_sizes, ask_providers = flip_quotes(quotes, 1, False)
-    # create schema-like structure
-    row = [time] + \
-        bid_times[:min(number_of_levels, len(bid_times))] + \
-        [0] * (number_of_levels - min(number_of_levels, len(bid_times))) + \
-        bid_prices[:min(number_of_levels, len(bid_prices))] + \
-        [0] * (number_of_levels - min(number_of_levels, len(bid_prices))) + \
-        bid_sizes[:min(number_of_levels, len(bid_sizes))] + \
-        [0] * (number_of_levels - min(number_of_levels, len(bid_sizes))) + \
-        bid_providers[:min(number_of_levels, len(bid_providers))] + \
-        [''] * (number_of_levels - min(number_of_levels, len(bid_providers))) + \
-        ask_times[:min(number_of_levels, len(ask_times))] + \
-        [0] * (number_of_levels - min(number_of_levels, len(ask_times))) + \
-        ask_prices[:min(number_of_levels, len(ask_prices))] + \
-        [0] * (number_of_levels - min(number_of_levels, len(ask_prices))) + \
-        ask_sizes[:min(number_of_levels, len(ask_sizes))] + \
-        [0] * (number_of_levels - min(number_of_levels, len(ask_sizes))) + \
-        ask_providers[:min(number_of_levels, len(ask_providers))] + \
-        [''] * (number_of_levels - min(number_of_levels, len(ask_providers)))
-    schema[0] = tuple(row)
+    names = quotes.providers.names
+    return (side.time[sort_idx].tolist(),
+            side.price[sort_idx].tolist(),
+            side.size[sort_idx].tolist(),
+            [names[x] for x in side.provider[sort_idx]])
+
+
+def top_quotes(quotes, entry_type, number_of_levels):
+    """Transpose the best number_of_levels entries of an ordered side into lists"""
+    side = quotes.sides[entry_type]
+    idx = side.top(number_of_levels)
+    names = quotes.providers.names
+    return (side.time[idx].tolist(),
+            side.price[idx].tolist(),
+            side.size[idx].tolist(),
+            [names[x] for x in side.provider[idx]])
+
+
+def create_views(book, number_of_levels):
+    """Views of the time field and of each side of a one row book, a side
+    being its time/px/size blocks (e.g. bid_time0..N, bid_px0..N,
+    bid_size0..N) as one 3 x number_of_levels array plus its provider block"""
+    sides = []
+    for prefix in ('bid_', 'ask_'):
+        offset = book.dtype.fields[prefix + 'time0'][1]
+        for i, column in enumerate(('time', 'px', 'size')):
+            for level in range(number_of_levels):
+                dtype, field_offset = book.dtype.fields[prefix + column + str(level)][:2]
+                if dtype.itemsize != 8 or \
+                        field_offset != offset + 8 * (i * number_of_levels + level):
+                    raise ValueError('%s%s%i is not where expected' % (prefix, column, level))
+        values = np.ndarray((3, number_of_levels), dtype='uint64', buffer=book, offset=offset)
+        dtype, offset = book.dtype.fields[prefix + 'provider0'][:2]
+        providers = np.ndarray(number_of_levels, dtype=dtype, buffer=book, offset=offset)
+        sides.append((values, providers))
+    return (book['time'], sides[0], sides[1])
+
+
+def write_side(quotes, entry_type, descending, views):
+    """Write the best entries of a side into its blocks, zero the rest"""
+    values, providers = views
+    number_of_levels = len(providers)
+    side = quotes.sides[entry_type]
+    if quotes.ordered:
+        slots = np.array(side.top(number_of_levels), dtype=np.intp)
+    else:
+        slots = select_slots(side, descending, number_of_levels)
+    count = len(slots)
+    if count:
+        # slots are always in range, clip skips the bounds check
+        np.take(side.values, slots, axis=1, out=values[:, :count], mode='clip')
+        np.take(side.provider, slots, out=providers[:count], mode='clip')
+    if count < number_of_levels:
+        values[:, count:] = 0
+        providers[count:] = 0
+
+
+def compare_ranges(book, number_of_levels, ignore_level_times=False):
+    """Byte ranges of a one row book holding its levels, per side from the
+    first level time (or price) to the last provider"""
+    ranges = []
+    for prefix in ('bid_', 'ask_'):
+        first = prefix + ('px0' if ignore_level_times else 'time0')
+        last = prefix + 'provider' + str(number_of_levels - 1)
+        dtype, offset = book.dtype.fields[last][:2]
+        ranges.append((book.dtype.fields[first][1], offset + dtype.itemsize))
+    return ranges
+
+
+def book_levels(book, ranges):
+    """Bytes of the levels of a one row book, for comparing books"""
+    raw = book.view('uint8')
+    return b''.join(raw[start:end].tobytes() for start, end in ranges)
+
+
+def build_book(time, quotes, schema, number_of_levels=10, views=None):
+    """Constructs a book based on a symbol's QuoteState, writing in place
+    into the one row schema array. Pass views from create_views to reuse"""
+    if views is None:
+        views = create_views(schema, number_of_levels)
+    book_time, bid_views, ask_views = views
+    book_time[0] = time
+    write_side(quotes, 0, True, bid_views)
+    write_side(quotes, 1, False, ask_views)
     return schema
 
 
@@ -187,11 +578,11 @@ def create_schema(levels):
         ('bid_time', 'uint64'),
         ('bid_px', 'float64'),
         ('bid_size', 'float64'),
-        ('bid_provider', 'S1'),
+        ('bid_provider', PROVIDER_DTYPE),
         ('ask_time', 'uint64'),
         ('ask_px', 'float64'),
         ('ask_size', 'float64'),
-        ('ask_provider', 'S1')
+        ('ask_provider', PROVIDER_DTYPE)
         ]
     for column, datatype in column_datetype:
         for i in range(levels):
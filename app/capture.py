@@ -0,0 +1,230 @@
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from itertools import chain
+from queue import Empty
+from threading import Event
+from time import perf_counter_ns
+
+import numpy as np
+
+from app.bookbuilder import PROVIDERS, BookBuilder
+from app.filewriter import FileWriter
+from app.pipeline import LocalQueue
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PFCAPT01'
+# records start with their type, a string is defined once and then referred
+# to by its code, codes count up from 0 in order of definition
+STRING = b'S'
+ITEM = b'I'
+# string length, then its utf-8 bytes
+STRING_HEADER = struct.Struct('<H')
+# time_ns() of capture, time, snapshot, symbol code, number of entries
+ITEM_HEADER = struct.Struct('<qQ?HH')
+ENTRY = 'HddddHH'  # entry_id, bid/ask size, bid/ask price, bid/ask provider codes
+NONE = 0xFFFF      # code of a missing provider, NaN stands in for missing numbers
+NAN = float('nan')
+MAX_CODES = NONE
+
+
+class CaptureQueue():
+    """Writes the (time, symbol, entries, snapshot) items put on a queue to a
+    capture file, then puts them on the queue. Lives in the producer's
+    process, call close() once it is done."""
+    def __init__(self, queue, filename, buffer_size=1 << 20):
+        logger.info('Capturing items to %s', filename)
+        self.queue = queue
+        self.file = open(filename, 'wb', buffering=buffer_size)
+        self.file.write(MAGIC)
+        self.codes = {}
+        self.entries = {}  # precompiled struct per number of entries
+        self.items = 0
+
+    def put(self, item, block=True, timeout=None):
+        self.write(item)
+        self.queue.put(item, block, timeout)
+
+    def write(self, item, captured=None):
+        """Append an item, defining any strings it uses first, captured now
+        unless given a time_ns()"""
+        exch_time, symbol, entries, snapshot = item[:4]  # traced items carry stamps
+        values = []
+        extend = values.extend
+        code = self.code
+        for entry_id, bid_size, ask_size, bid_price, ask_price, bid_provider, ask_provider \
+                in entries:
+            extend((
+                code(entry_id),
+                NAN if bid_size is None else bid_size,
+                NAN if ask_size is None else ask_size,
+                NAN if bid_price is None else bid_price,
+                NAN if ask_price is None else ask_price,
+                NONE if bid_provider is None else code(bid_provider),
+                NONE if ask_provider is None else code(ask_provider),
+            ))
+        entry_struct = self.entries.get(len(entries))
+        if entry_struct is None:
+            entry_struct = struct.Struct('<' + ENTRY * len(entries))
+            self.entries[len(entries)] = entry_struct
+        if captured is None:
+            captured = time.time_ns()
+        self.file.write(ITEM + ITEM_HEADER.pack(captured, exch_time, snapshot,
+                                                code(symbol), len(entries)) +
+                        entry_struct.pack(*values))
+        self.items += 1
+
+    def code(self, string):
+        """Code of a string, defining it if new"""
+        code = self.codes.get(string)
+        if code is None:
+            code = len(self.codes)
+            if code >= MAX_CODES:
+                raise ValueError('More than %i distinct strings' % MAX_CODES)
+            encoded = string.encode()
+            self.file.write(STRING + STRING_HEADER.pack(len(encoded)) + encoded)
+            self.codes[string] = code
+        return code
+
+    def close(self):
+        logger.info('Captured %i items', self.items)
+        self.file.close()
+
+
+def read_capture(filename):
+    """Yield (captured, item) for each item of a capture file, captured being
+    the time_ns() of its capture. A record cut short, as by the capturing
+    process being killed, ends the capture."""
+    with open(filename, 'rb') as capture:
+        if os.fstat(capture.fileno()).st_size < len(MAGIC):
+            raise ValueError('%s is not a capture file' % filename)
+        # mapped rather than read, captures can span days
+        with mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from read_records(data, filename)
+
+
+def read_records(data, filename):
+    """Yield (captured, item) for each record of a capture's bytes"""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not a capture file' % filename)
+    strings = []
+    entry_structs = {}
+    offset = len(MAGIC)
+    try:
+        while offset < len(data):
+            kind = data[offset:offset + 1]
+            offset += 1
+            if kind == STRING:
+                length, = STRING_HEADER.unpack_from(data, offset)
+                offset += STRING_HEADER.size
+                if offset + length > len(data):
+                    raise struct.error('string cut short')
+                strings.append(data[offset:offset + length].decode())
+                offset += length
+            elif kind == ITEM:
+                captured, exch_time, snapshot, symbol, count = \
+                    ITEM_HEADER.unpack_from(data, offset)
+                offset += ITEM_HEADER.size
+                entry_struct = entry_structs.get(count)
+                if entry_struct is None:
+                    entry_struct = struct.Struct('<' + ENTRY * count)
+                    entry_structs[count] = entry_struct
+                values = entry_struct.unpack_from(data, offset)
+                offset += entry_struct.size
+                yield captured, (exch_time, strings[symbol], unflatten(values, strings),
+                                 snapshot)
+            else:
+                raise ValueError('Unknown record %r at offset %i of %s' %
+                                 (kind, offset - 1, filename))
+    except struct.error:
+        logger.warning('%s ends with a partial record', filename)
+
+
+def unflatten(values, strings):
+    """Entries of struct values, NAN/NONE become None"""
+    entries = []
+    fields = iter(values)
+    # pylint: disable=R0124
+    for entry_id, bid_size, ask_size, bid_price, ask_price, bid_provider, ask_provider \
+            in zip(fields, fields, fields, fields, fields, fields, fields):
+        entries.append([
+            strings[entry_id],
+            bid_size if bid_size == bid_size else None,
+            ask_size if ask_size == ask_size else None,
+            bid_price if bid_price == bid_price else None,
+            ask_price if ask_price == ask_price else None,
+            None if bid_provider == NONE else strings[bid_provider],
+            None if ask_provider == NONE else strings[ask_provider],
+        ])
+    return entries
+
+
+class Checksums():
+    """CRC32 of the books and provider names published for each symbol, in
+    order, to tell whether two runs produced the same output"""
+    def __init__(self):
+        self.checksums = {}
+        self.books = {}
+
+    def update(self, item):
+        key, entry = item[1], item[2]
+        if key == PROVIDERS:
+            symbol, names = entry
+            data = '\n'.join(names).encode()
+        else:
+            symbol = key
+            data = entry.tobytes()
+            self.books[symbol] = self.books.get(symbol, 0) + 1
+        self.checksums[symbol] = zlib.crc32(data, self.checksums.get(symbol, 0))
+
+    def total(self):
+        """One checksum of every symbol's"""
+        total = 0
+        for symbol in sorted(self.checksums):
+            total = zlib.crc32(b'%s=%08x' % (symbol.encode(), self.checksums[symbol]), total)
+        return total
+
+
+def replay(filenames, builder_options=None, writer_options=None, speed=None):
+    """Feed a capture, or captures one after the other, through a BookBuilder
+    and FileWriter in this process, as fast as possible or, with speed, at
+    that multiple of its original pace.
+
+    Returns the number of items, the seconds taken, each item's latency in
+    nanoseconds (building its book and handing it to the file writer,
+    flushes included) and the Checksums of the books."""
+    books = LocalQueue()
+    writer = FileWriter(books, Event(), **(writer_options or {}))
+    builder = BookBuilder(LocalQueue(), books, Event(), Event(), **(builder_options or {}))
+    checksums = Checksums()
+    latencies = []
+    first = None
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    start = time.monotonic()
+    for captured, item in chain.from_iterable(map(read_capture, filenames)):
+        if speed is not None:
+            if first is None:
+                first = captured
+            due = start + (captured - first) / 1e9 / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        fed = perf_counter_ns()
+        builder.process_item(item)
+        while True:
+            try:
+                book = books.get_nowait()
+            except Empty:
+                break
+            checksums.update(book)
+            writer.process_item(book)
+        latencies.append(perf_counter_ns() - fed)
+    writer.shutdown()
+    duration = time.monotonic() - start
+    return len(latencies), duration, np.array(latencies, dtype=np.int64), checksums
@@ -1,26 +1,66 @@
 import logging
 import os
-from queue import Empty
+from collections import OrderedDict, deque
+from queue import Empty, Full, Queue
+from threading import Thread
+from time import monotonic, monotonic_ns, perf_counter, sleep
 import datetime
 
 import h5py
 import numpy as np
 
+from app import latency
+from app.bookbuilder import PROVIDER_DTYPE, PROVIDERS
+from app.rawfile import RawFile, open_books, read_header
+
 logger = logging.getLogger(__name__)
 
+# on-disk layouts, a dataset per column or one compound dataset of rows in
+# HDF5, or rows appended to a memory-mapped raw file
+COLUMNS = 'columns'
+COMPOUND = 'compound'
+RAW = 'raw'
+LAYOUTS = (COLUMNS, COMPOUND, RAW)
+EXTENSIONS = {COLUMNS: '.h5', COMPOUND: '.h5', RAW: '.bin'}
+# name of the dataset in a compound layout file
+BOOK = 'book'
+# compression filters for new datasets
+COMPRESSIONS = ('none', 'gzip', 'lzf')
+# file attribute holding the number of rows written
+ROWS = 'rows'
+# file attribute holding the provider names the provider codes index into
+PROVIDER_NAMES = 'providers'
+# prefixes of the book columns holding provider codes
+PROVIDER_COLUMNS = ('bid_provider', 'ask_provider')
+# tells a FlushWorker the day is over
+ROLLOVER = 'rollover'
+# key of inbound items that only carry the time, (time, CLOCK, None), so
+# that a writer rolls over to a new day without a book of its own
+CLOCK = '__clock__'
+
 
 class FileWriter():
-    # pylint: disable=R0913
+    # pylint: disable=R0902,R0913
     def __init__(self,
                  inbound_queue,
                  shutdown_event,
                  cache_size=1024,
                  block_size=32768,
-                 file_path='/dev/shm/book/'
+                 file_path='/dev/shm/book/',
+                 max_open_files=64,
+                 layout=COLUMNS,
+                 flush_threads=0,     # 0 flushes inline
+                 max_backlog=64,      # full caches waiting per flush thread
+                 options=None,        # h5py create_dataset options, see dataset_options
+                 chunk_cache_size=None,
+                 name='filewriter',   # tells shards apart in the logs
+                 stats_interval=60,   # seconds between throughput reports
+                 tracer=None          # a latency.LatencyTracer, books carry stamps
                  ):
-        logger.info('Initialising File Writer')
+        logger.info('Initialising File Writer %s', name)
         # sanity
         assert block_size % cache_size == 0
+        assert layout in LAYOUTS
         # queues
         self.inbound_queue = inbound_queue
         # events
@@ -31,18 +71,47 @@ class FileWriter():
         self.file_path = file_path
         if not os.path.isdir(self.file_path):
             logger.info('Creating %s', self.file_path)
-            os.makedirs(self.file_path)
-        self.file_offset = {}
+            # other shards may be creating it too
+            os.makedirs(self.file_path, exist_ok=True)
         self.file_date = datetime.date(1970, 1, 1)  # as good as any
-        # cache and configuration
+        self.layout = layout
+        # cache and configuration, a preallocated buffer per symbol
+        # filled up to its cursor, with the date of the books it holds
         self.cache = {}
+        self.cache_cursor = {}
+        self.cache_date = {}
         self.file_block_size = block_size
         self.max_cache_size = cache_size
+        # provider names of each symbol, from the bookbuilder
+        self.providers = {}
+        # writes inline, or hands full caches to flush threads, each symbol
+        # always going to the same thread so its writes stay in order
+        self.flusher = Flusher(block_size, max_open_files, layout, options, chunk_cache_size)
+        self.spare = {}  # buffers given back by flush threads, per symbol
+        self.workers = [FlushWorker('flush-%i' % i, self.spare, max_backlog,
+                                    Flusher(block_size, max_open_files, layout, options,
+                                            chunk_cache_size))
+                        for i in range(flush_threads)]
+        for worker in self.workers:
+            worker.start()
+        # metrics
+        self.name = name
+        self.stats_interval = stats_interval
+        self.books = 0
+        self.metrics_time = monotonic()
+        self.max_backlog = max_backlog
+        self.max_waiting = 0  # largest flush thread backlog since the last report
+        # latency tracing, (received, arrived) stamps of each cached row
+        self.tracer = tracer
+        self.stamps = {}
 
     def run(self):
         """Consume queue until told to stop"""
         logger.debug('Starting consumption of work queue')
         while not self.shutdown_event.is_set():
+            if monotonic() - self.metrics_time >= self.stats_interval:
+                self.log_metrics()
+            self.check_workers()
             try:
                 item = self.inbound_queue.get(block=True, timeout=1)
             except Empty:
@@ -65,10 +134,21 @@ class FileWriter():
         self.inbound_queue.join_thread()
         # complete writedown
         self.flush_cache_all()
+        for worker in self.workers:
+            self.hand_off(worker, None)
+        for worker in self.workers:
+            worker.join()
+        self.log_metrics()
+        self.check_workers()
+        if self.tracer is not None:
+            self.tracer.dump()
         logger.info('Shutdown complete!')
 
     def process_item(self, item):
         """Update cache and write to disk when full"""
+        if len(item) == 4:
+            self.process_traced(item)
+            return
         time, key, entry = item
         book_date = datetime.datetime.utcfromtimestamp(time / 1000000).date()
         if book_date > self.file_date:
@@ -76,92 +156,543 @@ class FileWriter():
             self.flush_cache_all()
             # update file date
             self.file_date = book_date
+        if key == CLOCK:
+            return
+        if key == PROVIDERS:
+            symbol, names = entry
+            self.providers[symbol] = names
+            return
+        self.books += 1
 
         # update cache
-        cache = add_cache_entry(self.cache.get(key), entry)
-        if cache.size == self.max_cache_size:
-            filename = self.get_filename(key)
-            offset = self.file_offset.get(key)
+        cache = self.cache.get(key)
+        if cache is None:
+            cache = np.zeros(self.max_cache_size, dtype=entry.dtype)
+            self.cache[key] = cache
+            self.cache_cursor[key] = 0
+            self.spare[key] = deque()
+        elif book_date != self.cache_date[key]:
+            # a book of the previous day from a producer behind the others
+            # (or the first book after it) goes to its own day's file
+            if book_date < self.file_date:
+                logger.warning('Late book of %s for %s', key, book_date)
+            if self.cache_cursor[key]:
+                self.flush(key, self.cache_cursor[key])
+                self.cache_cursor[key] = 0
+            cache = self.cache[key]
+        self.cache_date[key] = book_date
+        cursor = add_cache_entry(cache, self.cache_cursor[key], entry)
+        if cursor == self.max_cache_size:
             # flush to disk
-            new_offset = flush_cache(cache, filename, offset)
-            # update offset
-            self.file_offset[key] = new_offset
-            self.cache[key] = None
+            self.flush(key, cursor)
+            cursor = 0
+        self.cache_cursor[key] = cursor
+
+    def process_traced(self, item):
+        """process_item of a book carrying the stamps of the earlier stages,
+        its receipt stamp is kept, in cache order, until its row is flushed"""
+        arrived = monotonic_ns()
+        time, key, entry, stamps = item
+        if self.tracer is not None:
+            self.tracer.record_since(latency.OUTBOUND, key, stamps[latency.BUILT], arrived)
+            self.stamps.setdefault(key, []).append((stamps[latency.RECEIVED], arrived))
+        self.process_item((time, key, entry))
+        if self.tracer is not None:
+            self.tracer.tick()
+
+    def flush(self, key, cursor):
+        """Write the first cursor rows of key's cache, or hand them to its
+        flush thread and carry on in a spare buffer"""
+        cache = self.cache[key]
+        filename = self.get_filename(key, self.cache_date[key])
+        providers = self.providers.get(key)
+        if not self.workers:
+            self.flusher.flush(key, filename, cache[:cursor], providers)
         else:
-            self.cache[key] = cache
+            worker = self.workers[hash(key) % len(self.workers)]
+            self.hand_off(worker, (key, filename, cache, cursor, providers))
+            spare = self.spare[key]
+            self.cache[key] = spare.pop() if spare else np.zeros_like(cache)
+        if self.tracer is not None:
+            self.trace_flush(key, cursor)
+        # run() reports while idle, this while busy or driven by process_item
+        if monotonic() - self.metrics_time >= self.stats_interval:
+            self.log_metrics()
+
+    def trace_flush(self, key, cursor):
+        """Count how long the rows just flushed, or handed to a flush thread,
+        spent in the cache and since their message was received"""
+        stamps = self.stamps.get(key)
+        if not stamps:
+            return
+        now = monotonic_ns()
+        flushed = np.array(stamps[:cursor], dtype=np.int64)
+        del stamps[:cursor]
+        self.tracer.record_all(latency.FLUSH, key, (now - flushed[:, 1]) // 1000)
+        self.tracer.record_all(latency.TOTAL, key, (now - flushed[:, 0]) // 1000)
 
     def flush_cache_all(self):
-        for key, cache in self.cache.items():
-            if cache is not None:
-                logger.info('Flushing %s, %i', key, len(cache))
-                filename = self.get_filename(key)
-                offset = self.file_offset.get(key)
-                flush_cache(cache, filename, offset, self.file_block_size)
-                self.cache[key] = None
-            # reset file offset
-            self.file_offset[key] = None
-
-    def get_filename(self, symbol):
-        """Helper function to generate hdf5 filename"""
-        # add date, provider?
-        return self.file_path + str(self.file_date) + '/' + symbol + '.h5'
-
-
-def flush_cache(cache, filename, offset, file_block_size=32758):
+        for key, cursor in self.cache_cursor.items():
+            if cursor:
+                logger.info('Flushing %s, %i', key, cursor)
+                self.flush(key, cursor)
+                self.cache_cursor[key] = 0
+        # queued behind the flushes above, so they still go to today's files
+        if self.workers:
+            for worker in self.workers:
+                self.hand_off(worker, ROLLOVER)
+        else:
+            self.flusher.rollover()
+        self.log_metrics()
+
+    def hand_off(self, worker, item):
+        """Queue item for a flush thread, failing if it has given up rather
+        than waiting on it forever"""
+        while True:
+            self.check_workers()
+            try:
+                worker.handoff.put(item, timeout=1)
+                break
+            except Full:
+                continue
+        self.max_waiting = max(self.max_waiting, worker.handoff.qsize())
+
+    def check_workers(self):
+        """Raise the error of a flush thread that failed to write its rows"""
+        for worker in self.workers:
+            if worker.error is not None:
+                raise RuntimeError('%s of %s failed to flush' % (worker.name, self.name)) \
+                    from worker.error
+
+    def log_metrics(self):
+        now = monotonic()
+        logger.info('%s took %i books in %.0fs (%.0f/s)', self.name, self.books,
+                    now - self.metrics_time, self.books / max(now - self.metrics_time, 1e-9))
+        self.books = 0
+        self.metrics_time = now
+        flushers = [worker.flusher for worker in self.workers] or [self.flusher]
+        logger.info('%s flushed %i caches in %.3fs (slowest %.3fs), %i waiting '
+                    '(most %i of %i per thread)', self.name,
+                    sum(flusher.flushes for flusher in flushers),
+                    sum(flusher.flush_time for flusher in flushers),
+                    max(flusher.max_flush_time for flusher in flushers),
+                    sum(worker.handoff.qsize() for worker in self.workers),
+                    self.max_waiting, self.max_backlog)
+        self.max_waiting = 0
+
+    def get_filename(self, symbol, date=None):
+        """Helper function to generate hdf5 (or raw) filename, for the
+        current file date by default"""
+        if date is None:
+            date = self.file_date
+        return self.file_path + str(date) + '/' + symbol + EXTENSIONS[self.layout]
+
+
+class Flusher():
+    """Writes caches to their files, tracking the offset of each file and
+    keeping files open in a FilePool"""
+    # pylint: disable=R0913
+    def __init__(self, block_size=32768, max_open_files=64, layout=COLUMNS, options=None,
+                 chunk_cache_size=None):
+        self.file_block_size = block_size
+        self.layout = layout
+        self.options = options
+        self.files = FilePool(max_open_files, chunk_cache_size)
+        self.file_offset = {}
+        # metrics
+        self.flushes = 0
+        self.flush_time = 0.0
+        self.max_flush_time = 0.0
+
+    def flush(self, key, filename, cache, providers=None):
+        start = perf_counter()
+        offset = flush_cache(cache, filename, self.file_offset.get(filename),
+                             file_block_size=self.file_block_size,
+                             files=self.files, layout=self.layout,
+                             options=self.options, providers=providers)
+        self.file_offset[filename] = offset
+        duration = perf_counter() - start
+        self.flushes += 1
+        self.flush_time += duration
+        self.max_flush_time = max(self.max_flush_time, duration)
+        logger.debug('Flushed %i entries of %s in %.3fs', cache.size, key, duration)
+
+    def rollover(self):
+        """Forget offsets and close files, they belong to the previous day"""
+        self.file_offset.clear()
+        self.files.close_all()
+
+
+class FlushWorker(Thread):
+    """Flushes caches handed off by FileWriter, then gives their buffers back.
+    Takes (key, filename, buffer, rows, providers), ROLLOVER or None to stop.
+
+    A failed flush is retried, a failed write leaves the file's offset where
+    it was so the retry writes the same rows to the same place. Once out of
+    retries the worker stops with error set, keeping the rows it could not
+    write and everything behind them, for FileWriter to fail on."""
+    # pylint: disable=R0913
+    def __init__(self, name, spare, max_backlog, flusher, retries=3, retry_delay=1.0):
+        # never keep the process alive after FileWriter itself died
+        super().__init__(name=name, daemon=True)
+        self.handoff = Queue(max_backlog)
+        self.spare = spare
+        self.flusher = flusher
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.error = None
+
+    def run(self):
+        while True:
+            item = self.handoff.get()
+            if item is None:
+                break
+            if item is ROLLOVER:
+                self.flusher.rollover()
+                continue
+            key, filename, buffer, rows, providers = item
+            if not self.flush(key, filename, buffer[:rows], providers):
+                break
+            # only reused once its rows are on disk
+            self.spare[key].append(buffer)
+        self.flusher.rollover()
+
+    def flush(self, key, filename, rows, providers):
+        """Flush rows, retrying, returns whether they were written"""
+        for attempt in range(self.retries + 1):
+            try:
+                self.flusher.flush(key, filename, rows, providers)
+                return True
+            except Exception as exception:  # pylint: disable=W0703
+                if attempt == self.retries:
+                    logger.exception('Failed to flush %i entries of %s, giving up',
+                                     len(rows), key)
+                    self.error = exception
+                    return False
+                logger.warning('Failed to flush %i entries of %s (%s), retrying',
+                               len(rows), key, exception)
+                sleep(self.retry_delay)
+        return False
+
+
+class FilePool():
+    """Least recently used h5py files, and their datasets, kept open between
+    flushes. Opening a file means parsing its metadata and every dataset's
+    B-tree again, for each flush."""
+    def __init__(self, max_open_files=64, chunk_cache_size=None):
+        assert max_open_files > 0
+        self.max_open_files = max_open_files
+        # bytes of HDF5 chunk cache per open file, None for the default
+        self.kwargs = {} if chunk_cache_size is None else {'rdcc_nbytes': chunk_cache_size}
+        self.files = OrderedDict()  # filename => (h5py.File, {name: dataset})
+
+    def __len__(self):
+        return len(self.files)
+
+    def get(self, filename):
+        """Datasets of filename by name, opening the file if needed"""
+        handle = self.files.get(filename)
+        if handle is not None:
+            self.files.move_to_end(filename)
+            return handle[1]
+        if len(self.files) >= self.max_open_files:
+            self.close(next(iter(self.files)))
+        logger.debug('Opening %s', filename)
+        dataset_file = h5py.File(filename, 'a', **self.kwargs)
+        datasets = {name: dataset_file[name] for name in dataset_file}
+        self.files[filename] = (dataset_file, datasets)
+        return datasets
+
+    def get_raw(self, filename, dtype, block_size=32768):
+        """RawFile of filename, opening or creating it if needed"""
+        handle = self.files.get(filename)
+        if handle is not None:
+            self.files.move_to_end(filename)
+            return handle[1]
+        if len(self.files) >= self.max_open_files:
+            self.close(next(iter(self.files)))
+        raw_file = open_raw_file(filename, dtype, block_size)
+        self.files[filename] = (raw_file, raw_file)
+        return raw_file
+
+    def attrs(self, filename):
+        """Attributes of an open file"""
+        return self.files[filename][0].attrs
+
+    def close(self, filename):
+        logger.debug('Closing %s', filename)
+        dataset_file, _ = self.files.pop(filename)
+        dataset_file.close()
+
+    def close_all(self):
+        for filename in list(self.files):
+            self.close(filename)
+
+
+# pylint: disable=R0913
+def flush_cache(cache, filename, offset, file_block_size=32758, files=None, layout=COLUMNS,
+                options=None, providers=None):
     """Writes cache to filename at offset, if filename does not exist, then it
-    will be created. If offset is None it will be determined from the file."""
+    will be created with the given layout and dataset options. If offset is None it will be
+    determined from the file. Existing files are written through files (a
+    FilePool) when given, whatever their layout. Raw files keep their own
+    offset. Provider names, when given, are stored with the rows."""
+    if layout == RAW:
+        return write_to_raw_file(cache, filename, file_block_size, files, providers=providers)
     if offset is None:
         if not os.path.exists(filename):
             # write new file and return
-            return write_to_new_dataset_file(cache, filename, file_block_size)
-        # otherwise determine offset from 'time' column
+            if layout == COMPOUND:
+                return write_to_new_compound_file(cache, filename, file_block_size, options,
+                                                  providers=providers)
+            return write_to_new_dataset_file(cache, filename, file_block_size, options,
+                                             providers=providers)
+        # otherwise read offset from the file
         offset = get_file_offset(filename, 'time')
         logger.debug("File offset is %i for %s", offset, filename)
-    return write_to_existing_dataset_file(cache, filename, offset, file_block_size)
+    if files is not None:
+        logger.info('Writing %i entries to %s', cache.size, filename)
+        datasets = files.get(filename)
+        return write_to_datasets(cache, datasets, offset, file_block_size, files.attrs(filename),
+                                 providers=providers)
+    return write_to_existing_dataset_file(cache, filename, offset, file_block_size,
+                                          providers=providers)
+
 
+def dataset_options(compression='none', level=None, shuffle=False, chunk_rows=None):
+    """h5py create_dataset options for new datasets, chunk_rows of None lets
+    h5py choose the chunk size"""
+    if compression not in COMPRESSIONS:
+        raise ValueError('Unknown compression %r' % compression)
+    if chunk_rows is not None and chunk_rows < 1:
+        raise ValueError('Chunk rows must be at least 1')
+    # can only resize if chunked
+    options = {'chunks': True if chunk_rows is None else (chunk_rows,)}
+    if compression != 'none':
+        options['compression'] = compression
+    if level is not None:
+        if compression != 'gzip':
+            raise ValueError('Compression level only applies to gzip')
+        if not 0 <= level <= 9:
+            raise ValueError('Gzip compression level must be 0-9')
+        options['compression_opts'] = level
+    if shuffle:
+        options['shuffle'] = True
+    return options
 
-def write_to_new_dataset_file(dataset, filename, initial_block_size=32768):
+
+def write_to_new_dataset_file(dataset, filename, initial_block_size=32768, options=None,
+                              providers=None):
+    if options is None:
+        options = dataset_options()
     dirname = os.path.dirname(filename)
     if not os.path.exists(dirname):
         logger.debug('Creating directory %s', dirname)
-        os.makedirs(dirname)
+        os.makedirs(dirname, exist_ok=True)
 
     logger.info('Initialising new dataset %s', filename)
     with h5py.File(filename, 'w') as dataset_file:
         for name in dataset.dtype.names:
             dataset_file.create_dataset(name,
                                         data=dataset[name],
-                                        chunks=True,       # can only resize if chunked
-                                        maxshape=(None,))  # can only resize if no max size
+                                        maxshape=(None,),  # can only resize if no max size
+                                        **options)
             # initialise first block
             dataset_file[name].resize(initial_block_size, axis=0)
+        # h5py lists datasets alphabetically, keep the row order
+        dataset_file.attrs[COLUMNS] = list(dataset.dtype.names)
+        dataset_file.attrs[ROWS] = dataset.size
+        if providers is not None:
+            dataset_file.attrs[PROVIDER_NAMES] = list(providers)
+    return dataset.size
+
+
+def write_to_new_compound_file(dataset, filename, initial_block_size=32768, options=None,
+                               providers=None):
+    """Like write_to_new_dataset_file, but rows go into one compound dataset"""
+    if options is None:
+        options = dataset_options()
+    dirname = os.path.dirname(filename)
+    if not os.path.exists(dirname):
+        logger.debug('Creating directory %s', dirname)
+        os.makedirs(dirname, exist_ok=True)
+
+    logger.info('Initialising new compound dataset %s', filename)
+    with h5py.File(filename, 'w') as dataset_file:
+        dataset_file.create_dataset(BOOK,
+                                    data=dataset,
+                                    maxshape=(None,),
+                                    **options)
+        dataset_file[BOOK].resize(initial_block_size, axis=0)
+        dataset_file.attrs[ROWS] = dataset.size
+        if providers is not None:
+            dataset_file.attrs[PROVIDER_NAMES] = list(providers)
     return dataset.size
 
 
-def write_to_existing_dataset_file(dataset, filename, offset, file_block_size=32768):
+def write_to_existing_dataset_file(dataset, filename, offset, file_block_size=32768,
+                                   providers=None):
     # sanity check
     assert offset is not None
     # store variable as we use it a few times
     dataset_length = dataset.size
     logger.info('Writing %i entries to %s', dataset_length, filename)
     with h5py.File(filename, 'a') as dataset_file:
-        need_resize = (offset + dataset_length) >= dataset_file['time'].len()
+        return write_to_datasets(dataset, dataset_file, offset, file_block_size,
+                                 dataset_file.attrs, providers=providers)
+
+
+def write_to_datasets(dataset, datasets, offset, file_block_size=32768, attrs=None,
+                      providers=None):
+    """Write each column of dataset into datasets (name => h5py dataset), or
+    all of it in one go into a compound layout's book dataset. The new row
+    count is committed to attrs once the rows are written, after any new
+    provider names."""
+    if attrs is not None and providers is not None:
+        stored = decode_names(attrs.get(PROVIDER_NAMES, ()))
+        providers, codes = merge_providers(stored, providers)
+        dataset = remap_providers(dataset, codes)
+    dataset_length = dataset.size
+    if BOOK in datasets:
+        book = datasets[BOOK]
+        if (offset + dataset_length) >= book.len():
+            book.resize(file_block_size + book.len(), axis=0)
+        book[offset:offset+dataset_length] = dataset
+    else:
+        need_resize = (offset + dataset_length) >= datasets['time'].len()
         for name in dataset.dtype.names:
             if need_resize:
-                dataset_file[name].resize(file_block_size + dataset_file[name].len(),
-                                          axis=0)
-            dataset_file[name][offset:offset+dataset_length] = dataset[name]
+                datasets[name].resize(file_block_size + datasets[name].len(), axis=0)
+            datasets[name][offset:offset+dataset_length] = dataset[name]
+    if attrs is not None:
+        if providers is not None and providers != stored:
+            attrs[PROVIDER_NAMES] = providers
+        attrs[ROWS] = offset + dataset_length
     return offset + dataset_length
 
 
-def add_cache_entry(cache, entry):
-    if cache is None:
-        return entry
-    return np.concatenate((cache, entry))
+def write_to_raw_file(dataset, filename, file_block_size=32768, files=None, providers=None):
+    """Append dataset to a raw file, through files (a FilePool) when given"""
+    logger.info('Writing %i entries to %s', dataset.size, filename)
+    if files is not None:
+        raw_file = files.get_raw(filename, dataset.dtype, file_block_size)
+        return append_to_raw_file(dataset, raw_file, providers)
+    raw_file = open_raw_file(filename, dataset.dtype, file_block_size)
+    try:
+        return append_to_raw_file(dataset, raw_file, providers)
+    finally:
+        raw_file.close()
+
+
+def append_to_raw_file(dataset, raw_file, providers=None):
+    """Append dataset to an open RawFile, its provider codes translated to
+    the file's provider names"""
+    if providers is not None:
+        providers, codes = merge_providers(raw_file.providers, providers)
+        dataset = remap_providers(dataset, codes)
+        raw_file.set_providers(providers)
+    return raw_file.append(dataset)
+
+
+def merge_providers(stored, names):
+    """Provider names of a file holding stored names once names are added,
+    and a lookup of the file's code for each of names' codes, None if they
+    already agree. Stored names keep their codes, whatever the order of names,
+    as a writer restarted during the day numbers its providers afresh."""
+    stored = list(stored)
+    names = list(names)
+    if names[:len(stored)] == stored:
+        return names, None
+    if stored[:len(names)] == names:
+        return stored, None
+    codes = {name: code for code, name in enumerate(stored)}
+    merged = stored + [name for name in names if name not in codes]
+    codes.update((name, code) for code, name in enumerate(merged))
+    return merged, np.array([codes[name] for name in names], dtype=PROVIDER_DTYPE)
+
+
+def remap_providers(dataset, codes):
+    """Copy of dataset with its provider codes looked up in codes"""
+    if codes is None:
+        return dataset
+    dataset = dataset.copy()
+    for name in dataset.dtype.names:
+        if name.startswith(PROVIDER_COLUMNS):
+            dataset[name] = codes[dataset[name]]
+    return dataset
+
+
+def decode_names(names):
+    """Provider names as stored in an HDF5 attribute, as a list of str"""
+    return [name.decode() if isinstance(name, bytes) else name for name in names]
+
+
+def open_raw_file(filename, dtype, block_size=32768):
+    """Open a raw file of dtype rows, creating it (and its directory) if needed"""
+    if not os.path.exists(filename):
+        dirname = os.path.dirname(filename)
+        if not os.path.exists(dirname):
+            logger.debug('Creating directory %s', dirname)
+            os.makedirs(dirname, exist_ok=True)
+        # directories are named after the day
+        date = os.path.basename(dirname)
+        return RawFile.create(filename, dtype, date, block_size)
+    raw_file = RawFile(filename, block_size)
+    if raw_file.dtype != dtype:
+        raw_file.close()
+        raise ValueError('%s holds rows of a different dtype' % filename)
+    return raw_file
+
+
+def add_cache_entry(cache, cursor, entry):
+    """Copy entry into cache at cursor, returns the new cursor"""
+    end = cursor + entry.size
+    cache[cursor:end] = entry
+    return end
 
 
 def get_file_offset(filename, column='time'):
-    logger.debug('Calculating offset for %s using %s', filename, column)
+    with h5py.File(filename, 'r') as dataset_file:
+        return count_rows(dataset_file, column)
+
+
+def count_rows(dataset_file, column='time'):
+    """Rows written to an open file of either layout, as recorded by the
+    writer or, for files without that, by scanning column for zeros"""
+    if ROWS in dataset_file.attrs:
+        return int(dataset_file.attrs[ROWS])
+    logger.debug('Calculating offset for %s using %s', dataset_file.filename, column)
     # we should not have gaps or zeros in time column.
+    if BOOK in dataset_file:
+        values = dataset_file[BOOK].fields(column)[:]
+    else:
+        values = np.asarray(dataset_file[column])
+    return len(values.nonzero()[0])
+
+
+def read_providers(filename):
+    """Provider names of a file of either layout, indexed by provider code"""
+    if filename.endswith(EXTENSIONS[RAW]):
+        return read_header(filename)['providers']
+    with h5py.File(filename, 'r') as dataset_file:
+        return decode_names(dataset_file.attrs.get(PROVIDER_NAMES, []))
+
+
+def read_books(filename, start=0, stop=None):
+    """Read rows [start, stop) of a file of either layout as a structured
+    array, stop defaults to the number of rows written. Raw files are
+    memory-mapped rather than read."""
+    if filename.endswith(EXTENSIONS[RAW]):
+        return open_books(filename)[start:stop]
     with h5py.File(filename, 'r') as dataset_file:
-        return len(np.asarray(dataset_file[column]).nonzero()[0])
+        if stop is None:
+            stop = count_rows(dataset_file)
+        if BOOK in dataset_file:
+            return dataset_file[BOOK][start:stop]
+        names = list(dataset_file.attrs.get(COLUMNS, list(dataset_file)))
+        columns = [dataset_file[name] for name in names]
+        books = np.empty(max(0, stop - start),
+                         dtype=[(name, column.dtype) for name, column in zip(names, columns)])
+        for name, column in zip(names, columns):
+            books[name] = column[start:stop]
+        return books
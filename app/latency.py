@@ -0,0 +1,108 @@
+import logging
+
+from time import monotonic
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# a log2 histogram, bucket b counts latencies below 2**b microseconds and
+# at least 2**(b-1), bucket 0 those below 1us (negative skews included)
+BUCKETS = 40
+# positions of the monotonic nanosecond stamps an item carries while traced,
+# from the pricefeed (RECEIVED, QUEUED) then the bookbuilder (ENTERED, BUILT)
+RECEIVED = 0
+QUEUED = 1
+ENTERED = 2
+BUILT = 3
+# stages, in pipeline order
+SKEW = 'skew'          # SendingTime to receipt, by the wall clock
+DECODE = 'decode'      # receipt to put on the bookbuilder queue
+INBOUND = 'inbound'    # pricefeed => bookbuilder queue
+BUILD = 'build'        # bookbuilder process_item, entry to exit
+OUTBOUND = 'outbound'  # bookbuilder => filewriter queue, into the cache
+FLUSH = 'flush'        # filewriter cache to flush
+TOTAL = 'total'        # receipt to flush
+STAGES = (SKEW, DECODE, INBOUND, BUILD, OUTBOUND, FLUSH, TOTAL)
+PERCENTILES = (50, 99, 99.9)
+
+
+class LatencyTracer():
+    """Histograms of the latency of each stage, per symbol, in one process.
+
+    Stamps come from time.monotonic_ns(), which on Linux reads a clock shared by
+    every process, so stamps taken by one stage can be compared by the next.
+    Logs a summary every interval seconds and the full histograms on dump()."""
+    def __init__(self, name, interval=60):
+        self.name = name
+        self.interval = interval
+        self.histograms = {}  # (stage, symbol) => counts per bucket
+        self.log_time = monotonic()
+
+    def record(self, stage, symbol, micros):
+        """Count one latency of micros microseconds"""
+        self.histogram(stage, symbol)[bucket(micros)] += 1
+
+    def record_since(self, stage, symbol, stamp, now):
+        """Count the latency between two nanosecond stamps"""
+        self.record(stage, symbol, (now - stamp) // 1000)
+
+    def record_all(self, stage, symbol, micros):
+        """Count an array of latencies in microseconds"""
+        buckets = np.minimum(np.ceil(np.log2(np.maximum(micros, 0) + 1)), BUCKETS - 1)
+        self.histogram(stage, symbol)[:] += np.bincount(buckets.astype(np.intp),
+                                                        minlength=BUCKETS)
+
+    def histogram(self, stage, symbol):
+        histogram = self.histograms.get((stage, symbol))
+        if histogram is None:
+            histogram = np.zeros(BUCKETS, dtype=np.int64)
+            self.histograms[(stage, symbol)] = histogram
+        return histogram
+
+    def tick(self):
+        """Log a summary if interval seconds have passed since the last"""
+        if monotonic() - self.log_time >= self.interval:
+            self.log()
+
+    def log(self):
+        for stage, symbol in sorted(self.histograms, key=order):
+            histogram = self.histograms[(stage, symbol)]
+            logger.info('%s %s %s: %i samples, %s', self.name, stage, symbol,
+                        histogram.sum(), ', '.join('p%g < %ius' % (q, upper_bound(b))
+                                                   for q, b in zip(PERCENTILES,
+                                                                   percentiles(histogram))))
+        self.log_time = monotonic()
+
+    def dump(self):
+        """Log every non-empty bucket of every histogram"""
+        logger.info('%s latency histograms, bucket upper bound in us: count', self.name)
+        for stage, symbol in sorted(self.histograms, key=order):
+            histogram = self.histograms[(stage, symbol)]
+            logger.info('%s %s %s: %s', self.name, stage, symbol,
+                        ' '.join('%i:%i' % (upper_bound(b), count)
+                                 for b, count in enumerate(histogram) if count))
+
+
+def bucket(micros):
+    """Histogram bucket of a latency in microseconds"""
+    if micros <= 0:
+        return 0
+    return min(int(micros).bit_length(), BUCKETS - 1)
+
+
+def upper_bound(index):
+    """Microseconds below which the latencies of bucket index lie"""
+    return 1 << index
+
+
+def percentiles(histogram, qs=PERCENTILES):
+    """Buckets holding each percentile of a histogram"""
+    cumulative = np.cumsum(histogram)
+    return [int(np.searchsorted(cumulative, cumulative[-1] * q / 100)) for q in qs]
+
+
+def order(key):
+    """Sort by stage in pipeline order, then symbol"""
+    stage, symbol = key
+    return (STAGES.index(stage) if stage in STAGES else len(STAGES), symbol)
@@ -0,0 +1,167 @@
+import datetime
+import logging
+import mmap
+import os
+import struct
+import time
+
+from queue import Empty, Full, Queue
+from threading import Thread
+
+import quickfix as fix
+
+logger = logging.getLogger(__name__)
+
+# quickfix message logs
+FILE = 'file'      # FileLogFactory, a text line per message, written as it is sent or received
+SCREEN = 'screen'  # ScreenLogFactory
+NONE = 'none'      # no quickfix log
+ASYNC = 'async'    # no quickfix log, the price feed's AsyncMessageLog instead
+LOGS = (FILE, SCREEN, NONE, ASYNC)
+# quickfix message stores, the messages sent are only kept with PersistMessages=Y
+MEMORY = 'memory'  # MemoryStoreFactory, sequence numbers are lost on restart
+NULL = 'null'      # NullStoreFactory
+STORES = (FILE, MEMORY, NULL)
+
+MAGIC = b'PFMLOG01'
+INCOMING = b'I'
+OUTGOING = b'O'
+# direction, time_ns() of the callback, length of the message
+RECORD_HEADER = struct.Struct('<cqI')
+
+
+def create_log_factory(name, settings):
+    """quickfix LogFactory of a LOGS name, None for no quickfix log"""
+    if name == FILE:
+        return fix.FileLogFactory(settings)
+    if name == SCREEN:
+        return fix.ScreenLogFactory(settings)
+    if name in (NONE, ASYNC):
+        return None
+    raise ValueError('Unknown log %s' % name)
+
+
+def create_store_factory(name, settings):
+    """quickfix MessageStoreFactory of a STORES name"""
+    if name == FILE:
+        return fix.FileStoreFactory(settings)
+    if name == MEMORY:
+        return fix.MemoryStoreFactory()
+    if name == NULL:
+        return fix.NullStoreFactory()
+    raise ValueError('Unknown store %s' % name)
+
+
+class AsyncMessageLog():
+    """Binary log of the FIX messages seen by the price feed's callbacks.
+    The callbacks only hand the message string to a bounded buffer, a
+    background thread encodes and writes them. Messages arriving while the
+    buffer is full are dropped and counted rather than holding up the
+    callback. Call close() once done."""
+    def __init__(self, filename, buffer_size=65536, file_buffer_size=1 << 20):
+        logger.info('Logging FIX messages to %s', filename)
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(filename, 'ab', buffering=file_buffer_size)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.buffer = Queue(maxsize=buffer_size)
+        self.logged = 0
+        self.dropped = 0
+        self.writer = Thread(target=self.run, name='messagelog', daemon=True)
+        self.writer.start()
+
+    def incoming(self, message):
+        self.log(INCOMING, message)
+
+    def outgoing(self, message):
+        self.log(OUTGOING, message)
+
+    def log(self, direction, message):
+        """Buffer a quickfix message, or its string, for the writer"""
+        if not isinstance(message, str):
+            message = message.toString()
+        try:
+            self.buffer.put_nowait((direction, time.time_ns(), message))
+        except Full:
+            self.dropped += 1
+
+    def run(self):
+        """Write buffered messages until close()"""
+        write = self.file.write
+        pack = RECORD_HEADER.pack
+        while True:
+            record = self.buffer.get()
+            records = [record]
+            # whatever else has built up, in one go
+            while record is not None:
+                try:
+                    record = self.buffer.get_nowait()
+                except Empty:
+                    break
+                records.append(record)
+            for record in records:
+                if record is None:
+                    self.file.flush()
+                    return
+                direction, stamp, message = record
+                encoded = message.encode()
+                write(pack(direction, stamp, len(encoded)) + encoded)
+                self.logged += 1
+
+    def close(self):
+        self.buffer.put(None)
+        self.writer.join()
+        self.file.close()
+        logger.info('Logged %i FIX messages', self.logged)
+        if self.dropped:
+            logger.warning('Dropped %i FIX messages, the message log buffer was full',
+                           self.dropped)
+
+
+def read_message_log(filename):
+    """Yield (direction, time_ns, message) for each message of a message log,
+    direction being INCOMING or OUTGOING. A record cut short, as by the
+    logging process being killed, ends the log."""
+    with open(filename, 'rb') as log:
+        if os.fstat(log.fileno()).st_size < len(MAGIC):
+            raise ValueError('%s is not a message log' % filename)
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from read_records(data, filename)
+
+
+def read_records(data, filename):
+    """Yield (direction, time_ns, message) for each record of a message log's bytes"""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not a message log' % filename)
+    offset = len(MAGIC)
+    while offset < len(data):
+        if offset + RECORD_HEADER.size > len(data):
+            logger.warning('%s ends with a partial record', filename)
+            return
+        direction, stamp, length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(data):
+            logger.warning('%s ends with a partial record', filename)
+            return
+        yield direction, stamp, data[offset:offset + length].decode()
+        offset += length
+
+
+def to_file_log(filename, file_log):
+    """Write a message log out as a quickfix FileLog messages log, as read by
+    rebuild.py. Returns the number of messages."""
+    messages = 0
+    with open(file_log, 'w', newline='') as out:
+        for _, stamp, message in read_message_log(filename):
+            out.write('%s : %s\n' % (file_log_time(stamp), message))
+            messages += 1
+    return messages
+
+
+def file_log_time(stamp):
+    """time_ns() as YYYYMMDD-HH:MM:SS.ffffff UTC, the FileLog's timestamps"""
+    seconds, nanos = divmod(stamp, 1000000000)
+    utc = datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+    return '%s.%06i' % (utc.strftime('%Y%m%d-%H:%M:%S'), nanos // 1000)
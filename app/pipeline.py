@@ -0,0 +1,52 @@
+import logging
+
+from queue import Queue
+from threading import Event, Thread
+
+from app.bookbuilder import BookBuilder
+from app.filewriter import FileWriter
+
+logger = logging.getLogger(__name__)
+
+
+class LocalQueue(Queue):
+    """queue.Queue with the close() and join_thread() of a
+    multiprocessing.Queue, for stages running as threads of one process"""
+    def close(self):
+        pass
+
+    def join_thread(self):
+        pass
+
+
+class SingleProcessPipeline():
+    """BookBuilder and FileWriter in the PriceFeed's process. PriceFeed puts
+    items here from its FIX callbacks and their books are built there and
+    then, without pickling, while a background thread writes them.
+
+    Shuts down like the separate processes do, the book builder once
+    shutdown_event is set and the file writer once the book builder is done."""
+    def __init__(self, shutdown_event, builder_options=None, writer_options=None):
+        logger.info('Initialising single process pipeline')
+        self.consumer_shutdown_event = Event()
+        self.books = LocalQueue()
+        self.file_writer = FileWriter(self.books, self.consumer_shutdown_event,
+                                      **(writer_options or {}))
+        # nothing is ever queued for the book builder, items are processed
+        # as they are put
+        self.book_builder = BookBuilder(LocalQueue(), self.books, shutdown_event,
+                                        self.consumer_shutdown_event,
+                                        **(builder_options or {}))
+        self.writer = Thread(target=self.file_writer.run, name='filewriter')
+
+    def start(self):
+        self.writer.start()
+
+    # pylint: disable=W0613
+    def put(self, item, block=True, timeout=None):
+        self.book_builder.process_item(item)
+
+    def shutdown(self):
+        """Stop the book builder, then wait for the file writer to finish"""
+        self.book_builder.shutdown()
+        self.writer.join()
@@ -2,16 +2,21 @@ import logging
 import datetime
 import time
 
+from time import monotonic_ns, time_ns
+
 import quickfix as fix
 import quickfix44 as fix44
 
 import app.pxm44 as pxm44
+from app import latency
 
 logger = logging.getLogger(__name__)
 
 
 class PriceFeed(fix.Application):
-    def __init__(self, message_queue, shutdown_event, subscriptions):
+    # pylint: disable=R0913
+    def __init__(self, message_queue, shutdown_event, subscriptions, raw_decoder=False,
+                 tracer=None, message_log=None):
         logger.info('Initialising Price Feed')
         # internal state
         self.fix_adapter = None
@@ -20,7 +25,14 @@ class PriceFeed(fix.Application):
         self.queue = message_queue
         self.shutdown_event = shutdown_event
         self.subscriptions = subscriptions
+        self.raw_decoder = raw_decoder
         self.active_subscriptions = {}
+        # latency tracing, items carry stamps of when their message was
+        # received and when they were queued
+        self.tracer = tracer
+        self.received = None  # (monotonic_ns, time_ns) of the current message
+        # AsyncMessageLog of the messages passing through the callbacks
+        self.message_log = message_log
         # message handlers
         self.handlers = {}
         self.handlers[fix.MsgType_MassQuote] = self.on_mass_quote
@@ -42,6 +54,11 @@ class PriceFeed(fix.Application):
         while not self.fix_adapter.isStopped() and not self.shutdown_event.is_set():
             time.sleep(0.1)
         self.shutdown()
+        # once, shutdown() also runs on logout
+        if self.tracer is not None:
+            self.tracer.dump()
+        if self.message_log is not None:
+            self.message_log.close()
 
     def shutdown(self):
         logger.info('Shutdown triggered!')
@@ -80,19 +97,27 @@ class PriceFeed(fix.Application):
                 message.getHeader().setField(553, session_settings.getString('Username'))
             if session_settings.has('Password'):
                 message.getHeader().setField(554, session_settings.getString('Password'))
+        if self.message_log is not None:
+            self.message_log.outgoing(message)
 
     # pylint: disable=R0201,W0613
-    def to_app(self, message, session_id):  # pragma: no cover
+    def to_app(self, message, session_id):
         """Notification of app message being sent to target."""
-        return
+        if self.message_log is not None:
+            self.message_log.outgoing(message)
 
     # pylint: disable=R0201, W0613
-    def from_admin(self, message, session_id):  # pragma: no cover
+    def from_admin(self, message, session_id):
         """Notification of admin message being received from target."""
-        return
+        if self.message_log is not None:
+            self.message_log.incoming(message)
 
     def from_app(self, message, session_id):
         """Notification of app message being received from target."""
+        if self.tracer is not None:
+            self.received = (monotonic_ns(), time_ns())
+        if self.message_log is not None:
+            self.message_log.incoming(message)
         logger.debug('Received: %s', soh_to_pipe(message))
         msg_type = message.getHeader().getField(fix.MsgType()).getString()
         handler = self.handlers.get(msg_type)
@@ -151,25 +176,50 @@ class PriceFeed(fix.Application):
                 quote_entry[6] = provider
             entries[entry_id] = quote_entry
         items = list(entries.values())
-        self.queue.put((exch_time, symbol, items, True))
+        if self.tracer is None:
+            self.queue.put((exch_time, symbol, items, True))
+        else:
+            self.put_traced((exch_time, symbol, items, True))
 
     def on_mass_quote(self, message, session_id):
         """Turn a MassQuote message into quotes"""
         exch_time = sending_time_to_timestamp(message.getHeader().getField(52))
+        if self.raw_decoder:
+            quote_sets = decode_mass_quote(message.toString())
+        else:
+            quote_sets = self.iter_quote_sets(message)
         # iterate over each quote set
-        for i in range(int(message.getField(296))):
-            message.getGroup(1+i, self.quote_set)
-            quote_set_id = self.quote_set.getField(302)
+        for quote_set_id, entries in quote_sets:
             symbol = self.active_subscriptions.get(quote_set_id)
             if symbol is None:
                 logger.error('%s not found in active_subscriptions', quote_set_id)
                 return
-            entries = process_quote_set(self.quote_set, self.quote_entry)
-            self.queue.put((exch_time, symbol, entries, False))
+            if self.tracer is None:
+                self.queue.put((exch_time, symbol, entries, False))
+            else:
+                self.put_traced((exch_time, symbol, entries, False))
 
         if message.isSetField(fix.QuoteID()):
             self.send_ack(message, session_id)
 
+    def iter_quote_sets(self, message):
+        """Yield (QuoteSetID, entries) for each quote set via quickfix groups"""
+        for i in range(int(message.getField(296))):
+            message.getGroup(1+i, self.quote_set)
+            yield (self.quote_set.getField(302),
+                   process_quote_set(self.quote_set, self.quote_entry))
+
+    def put_traced(self, item):
+        """Queue item with the stamps of its message's receipt and of now,
+        counting its SendingTime skew and decode latency"""
+        received, wall_clock = self.received
+        queued = monotonic_ns()
+        symbol = item[1]
+        self.tracer.record(latency.SKEW, symbol, wall_clock // 1000 - item[0])
+        self.tracer.record_since(latency.DECODE, symbol, received, queued)
+        self.queue.put(item + ((received, queued),))
+        self.tracer.tick()
+
     # outbound message handlers
     def send_subscriptions(self, session_id):
         """Send MarketDataRequest for all subscriptions"""
@@ -209,12 +259,59 @@ def drop_slash(symbol):
     return symbol.replace('/', '')
 
 
-def sending_time_to_timestamp(sending_time):
-    """Convert a FIX datetime to unix datetime"""
-    strp_format = '%Y%m%d-%H:%M:%S.%f' if len(sending_time) > 17 else '%Y%m%d-%H:%M:%S'
-    return int(1e6*datetime.datetime.strptime(sending_time, strp_format)
-               .replace(tzinfo=datetime.timezone.utc)
-               .timestamp())
+SECOND_WIDTH = len('YYYYMMDD-HH:MM:SS')
+# microseconds per unit of a fraction of so many digits
+FRACTION_SCALE = (None, 100000, 10000, 1000, 100, 10, 1)
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+class SendingTimeParser():
+    """Parses fixed width FIX UTCTimestamps, YYYYMMDD-HH:MM:SS[.fff[fff[fff]]],
+    into microseconds since the epoch, caching the epoch of the last date and
+    of the last second seen. Sub-microsecond digits are truncated."""
+    def __init__(self):
+        self.date = (None, 0)    # (YYYYMMDD, its epoch seconds)
+        self.second = (None, 0)  # (YYYYMMDD-HH:MM:SS, its epoch microseconds)
+
+    def to_timestamp(self, sending_time):
+        prefix, micros = self.second
+        if sending_time[:SECOND_WIDTH] != prefix:
+            prefix = sending_time[:SECOND_WIDTH]
+            micros = self.seconds(prefix) * 1000000
+            self.second = (prefix, micros)
+        digits = len(sending_time) - SECOND_WIDTH - 1
+        if digits < 0:
+            return micros
+        fraction = sending_time[SECOND_WIDTH + 1:]
+        # isdigit() alone lets through non-ASCII digits
+        if sending_time[SECOND_WIDTH] != '.' or not 0 < digits <= 9 \
+                or not fraction.isascii() or not fraction.isdigit():
+            raise ValueError('Invalid SendingTime %s' % sending_time)
+        if digits > 6:
+            return micros + int(fraction[:6])
+        return micros + int(fraction) * FRACTION_SCALE[digits]
+
+    def seconds(self, prefix):
+        """Epoch seconds of YYYYMMDD-HH:MM:SS"""
+        digits = prefix[:8] + prefix[9:11] + prefix[12:14] + prefix[15:17]
+        if len(prefix) != SECOND_WIDTH or prefix[8] != '-' or prefix[11] != ':' \
+                or prefix[14] != ':' or not digits.isascii() or not digits.isdigit():
+            raise ValueError('Invalid SendingTime %s' % prefix)
+        date, seconds = self.date
+        if prefix[:8] != date:
+            date = prefix[:8]
+            seconds = (datetime.date(int(date[:4]), int(date[4:6]), int(date[6:])).toordinal()
+                       - EPOCH_ORDINAL) * 86400
+            self.date = (date, seconds)
+        hours, minutes, secs = int(prefix[9:11]), int(prefix[12:14]), int(prefix[15:17])
+        if hours > 23 or minutes > 59 or secs > 59:
+            raise ValueError('Invalid SendingTime %s' % prefix)
+        return seconds + hours * 3600 + minutes * 60 + secs
+
+
+# the FIX callbacks run on one thread
+SENDING_TIMES = SendingTimeParser()
+sending_time_to_timestamp = SENDING_TIMES.to_timestamp  # pylint: disable=C0103
 
 
 def process_quote_set(quote_set, quote_entry):
@@ -239,3 +336,39 @@ def process_quote_set(quote_set, quote_entry):
             bid_provider, ask_provider
         ])
     return entries
+
+
+def decode_mass_quote(raw):
+    """Decode the quote sets of a raw MassQuote string in a single pass.
+
+    Returns a list of (QuoteSetID, entries) where entries match the output of
+    process_quote_set, but without copying each group out of the message."""
+    quote_sets = []
+    entries = None
+    entry = None
+    for field in raw.split('\x01'):
+        tag, _, value = field.partition('=')
+        if tag == '188':    # BidSpotRate
+            entry[3] = float(value)
+        elif tag == '190':  # OfferSpotRate
+            entry[4] = float(value)
+        elif tag == '134':  # BidSize
+            entry[1] = float(value)
+        elif tag == '135':  # OfferSize
+            entry[2] = float(value)
+        elif tag == '106':  # Issuer
+            entry[5] = value
+        elif tag == '299':  # QuoteEntryID, first field of an entry
+            entry = [value, None, None, None, None, None, None]
+            entries.append(entry)
+        elif tag == '302':  # QuoteSetID, first field of a quote set
+            entries = []
+            entry = None
+            quote_sets.append((value, entries))
+    # issuer only applies to the side(s) present in the entry
+    for _, entries in quote_sets:
+        for entry in entries:
+            provider = entry[5]
+            entry[5] = provider if ((entry[3] is not None) or (entry[1] is not None)) else None
+            entry[6] = provider if ((entry[4] is not None) or (entry[2] is not None)) else None
+    return quote_sets
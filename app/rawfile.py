@@ -0,0 +1,160 @@
+import ast
+import logging
+import os
+import struct
+
+import numpy as np
+from numpy.lib.format import descr_to_dtype, dtype_to_descr
+
+logger = logging.getLogger(__name__)
+
+# magic, header size, rows, date, length of the dtype description that
+# follows and of the provider names after that, one per line
+HEADER = struct.Struct('<8sQQ16sII')
+MAGIC = b'PFBOOKS2'
+HEADER_SIZE_OFFSET = 8
+ROWS_OFFSET = 16
+PROVIDERS_OFFSET = 44
+# room left in the header for provider names, the header grows by whole
+# pages if they outgrow it
+PROVIDERS_SIZE = 4096
+# rows start on a page boundary
+PAGE_SIZE = 4096
+
+
+class RawFile():
+    """Rows of a single dtype appended to a preallocated file through
+    np.memmap, after a small fixed header. The file grows a block at a time
+    and the header's row count is only updated once the rows are in place,
+    so readers never see a partial row."""
+    def __init__(self, filename, block_size=32768):
+        header = read_header(filename)
+        self.filename = filename
+        self.block_size = block_size
+        self.dtype = header['dtype']
+        self.header_size = header['header_size']
+        self.rows = header['rows']
+        self.date = header['date']
+        self.providers = header['providers']
+        self.providers_start = header['providers_start']
+        self.capacity = (os.path.getsize(filename) - self.header_size) // self.dtype.itemsize
+        self.header = np.memmap(filename, mode='r+', dtype='uint8', shape=(self.header_size,))
+        self.data = self.map()
+
+    @classmethod
+    def create(cls, filename, dtype, date='', block_size=32768):
+        """Create filename with room for block_size rows of dtype"""
+        dtype = np.dtype(dtype)
+        descr = repr(dtype_to_descr(dtype)).encode()
+        header_size = -(-(HEADER.size + len(descr) + PROVIDERS_SIZE) // PAGE_SIZE) * PAGE_SIZE
+        logger.info('Initialising new raw file %s', filename)
+        with open(filename, 'wb') as raw_file:
+            raw_file.write(HEADER.pack(MAGIC, header_size, 0, date.encode(), len(descr), 0))
+            raw_file.write(descr)
+            raw_file.truncate(header_size + block_size * dtype.itemsize)
+        return cls(filename, block_size)
+
+    def map(self):
+        return np.memmap(self.filename, mode='r+', dtype=self.dtype,
+                         offset=self.header_size, shape=(self.capacity,))
+
+    def set_providers(self, names):
+        """Store the provider names the rows' provider codes index into"""
+        names = list(names)
+        if names == self.providers:
+            return
+        if names[:len(self.providers)] != self.providers:
+            raise ValueError('%s already holds rows coded with providers %r'
+                             % (self.filename, self.providers))
+        # names only ever grow, so the committed length of the old names
+        # stays valid while the new ones are written
+        encoded = ''.join(name + '\n' for name in names).encode()
+        end = self.providers_start + len(encoded)
+        if end > self.header_size:
+            self.grow_header(end + PROVIDERS_SIZE)
+        self.header[self.providers_start:end] = np.frombuffer(encoded, dtype='uint8')
+        # commit
+        struct.pack_into('<I', self.header, PROVIDERS_OFFSET, len(encoded))
+        self.providers = names
+
+    def append(self, rows):
+        """Write rows after the last committed row, returns the row count"""
+        end = self.rows + rows.size
+        if end > self.capacity:
+            self.grow(end)
+        self.data[self.rows:end] = rows
+        # commit
+        struct.pack_into('<Q', self.header, ROWS_OFFSET, end)
+        self.rows = end
+        return end
+
+    def grow(self, rows):
+        """Extend the file by whole blocks to hold at least rows"""
+        capacity = -(-rows // self.block_size) * self.block_size
+        logger.debug('Growing %s to %i rows', self.filename, capacity)
+        self.data.flush()
+        self.data = None
+        with open(self.filename, 'r+b') as raw_file:
+            raw_file.truncate(self.header_size + capacity * self.dtype.itemsize)
+        self.capacity = capacity
+        self.data = self.map()
+
+    def grow_header(self, size):
+        """Move the rows back to make the header at least size bytes. The
+        file is rewritten alongside and swapped in, so readers of the old
+        file keep a consistent view of it."""
+        header_size = -(-size // PAGE_SIZE) * PAGE_SIZE
+        logger.info('Growing the header of %s to %i bytes', self.filename, header_size)
+        self.data.flush()
+        self.header.flush()
+        temporary = self.filename + '.tmp'
+        with open(temporary, 'wb') as raw_file:
+            header = bytearray(self.header)
+            struct.pack_into('<Q', header, HEADER_SIZE_OFFSET, header_size)
+            raw_file.write(header)
+            raw_file.truncate(header_size + self.capacity * self.dtype.itemsize)
+            raw_file.seek(header_size)
+            for start in range(0, self.rows, self.block_size):
+                raw_file.write(self.data[start:min(start + self.block_size, self.rows)]
+                               .tobytes())
+        self.data = None
+        self.header = None
+        os.replace(temporary, self.filename)
+        self.header_size = header_size
+        self.header = np.memmap(self.filename, mode='r+', dtype='uint8',
+                                shape=(self.header_size,))
+        self.data = self.map()
+
+    def close(self):
+        self.data.flush()
+        self.header.flush()
+        self.data = None
+        self.header = None
+
+
+def read_header(filename):
+    """Header of a raw file as a dict"""
+    with open(filename, 'rb') as raw_file:
+        magic, header_size, rows, date, length, providers_length = \
+            HEADER.unpack(raw_file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('%s is not a raw book file' % filename)
+        descr = ast.literal_eval(raw_file.read(length).decode())
+        providers = raw_file.read(providers_length).decode().split('\n')[:-1]
+    return {
+        'header_size': header_size,
+        'rows': rows,
+        'date': date.rstrip(b'\x00').decode(),
+        'dtype': descr_to_dtype(descr),
+        'providers': providers,
+        'providers_start': HEADER.size + length,
+    }
+
+
+def open_books(filename):
+    """Read-only np.memmap of the committed rows of a raw file, no copies"""
+    header = read_header(filename)
+    if header['rows'] == 0:
+        return np.zeros(0, dtype=header['dtype'])
+    return np.memmap(filename, mode='r', dtype=header['dtype'],
+                     offset=header['header_size'], shape=(header['rows'],))
@@ -0,0 +1,207 @@
+import glob
+import logging
+import os
+import re
+import shutil
+import tempfile
+
+from multiprocessing import Pool
+
+import quickfix as fix
+
+from app.capture import CaptureQueue, replay
+from app.pricefeed import PriceFeed, drop_slash
+
+logger = logging.getLogger(__name__)
+
+# quickfix FileLog lines are '<time> : <message>', time as YYYYMMDD-HH:MM:SS...
+SEPARATOR = b' : '
+DAY_WIDTH = 8
+# inbound messages the price feed decodes, and the requests naming quote sets
+DECODED = {b'\x0135=i\x01': fix.MsgType_MassQuote,
+           b'\x0135=W\x01': fix.MsgType_MarketDataSnapshotFullRefresh,
+           b'\x0135=Y\x01': fix.MsgType_MarketDataRequestReject}
+REQUEST = b'\x0135=V\x01'
+REJECT = b'\x0135=Y\x01'
+MD_REQ_ID = re.compile(rb'\x01262=([^\x01]*)\x01')
+SYMBOL = re.compile(rb'\x0155=([^\x01]*)\x01')
+CAPTURE_EXTENSION = '.cap'
+
+
+class LogFeed(PriceFeed):
+    """PriceFeed decoding messages read back from a log, never replying"""
+    def __init__(self, message_queue, subscriptions, data_dictionary):
+        super().__init__(message_queue, None, [], raw_decoder=True)
+        self.active_subscriptions = dict(subscriptions)
+        self.data_dictionary = data_dictionary
+
+    def send_ack(self, message, session_id):
+        return
+
+    def on_line(self, line):
+        """Decode a message log line, following our MarketDataRequests"""
+        if REQUEST in line:
+            md_req_id, symbol = subscription_of(line)
+            self.active_subscriptions[md_req_id] = drop_slash(symbol)
+            return
+        for tag, msg_type in DECODED.items():
+            if tag in line:
+                raw = line[line.index(SEPARATOR) + len(SEPARATOR):].rstrip(b'\r\n').decode()
+                self.handlers[msg_type](fix.Message(raw, self.data_dictionary), None)
+                return
+
+
+class SymbolCaptures():
+    """Queue writing each symbol's items to its own capture file"""
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.captures = {}
+
+    # pylint: disable=W0613
+    def put(self, item, block=True, timeout=None):
+        symbol = item[1]
+        capture = self.captures.get(symbol)
+        if capture is None:
+            path = os.path.join(self.directory, symbol)
+            os.makedirs(path, exist_ok=True)
+            capture = CaptureQueue(None, os.path.join(path, self.name + CAPTURE_EXTENSION))
+            self.captures[symbol] = capture
+        # stamped with the message's SendingTime
+        capture.write(item, item[0] * 1000)
+
+    def close(self):
+        for capture in self.captures.values():
+            capture.close()
+
+
+def find_logs(paths):
+    """quickfix message logs among paths, directories searched for them"""
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            logs.extend(sorted(glob.glob(os.path.join(path, '*.messages.current.log'))))
+        else:
+            logs.append(path)
+    return logs
+
+
+def scan_log(filename):
+    """Split a message log into a chunk per day of its lines, each chunk
+    (first line time, filename, start, end, subscriptions at start), the
+    subscriptions being MDReqID => symbol as requested so far"""
+    chunks = []
+    subscriptions = {}
+    day = None
+    offset = 0
+    with open(filename, 'rb') as log:
+        for line in log:
+            if line[:DAY_WIDTH] != day:
+                if chunks:
+                    chunks[-1][3] = offset
+                day = line[:DAY_WIDTH]
+                first = line[:line.find(SEPARATOR)].decode()
+                chunks.append([first, filename, offset, None, dict(subscriptions)])
+            if REQUEST in line:
+                md_req_id, symbol = subscription_of(line)
+                subscriptions[md_req_id] = symbol
+            elif REJECT in line:
+                match = MD_REQ_ID.search(line)
+                if match:
+                    subscriptions.pop(match.group(1).decode(), None)
+            offset += len(line)
+    if chunks:
+        chunks[-1][3] = offset
+    return [tuple(chunk) for chunk in chunks]
+
+
+def subscription_of(line):
+    """(MDReqID, symbol) of a MarketDataRequest log line"""
+    return MD_REQ_ID.search(line).group(1).decode(), SYMBOL.search(line).group(1).decode()
+
+
+def decode_chunk(args):
+    """Decode a chunk of a message log into a capture file per symbol, named
+    after the chunk's index so that they sort in order"""
+    index, (_, filename, start, end, subscriptions), directory, spec = args
+    data_dictionary = fix.DataDictionary()
+    data_dictionary.readFromURL(spec)
+    captures = SymbolCaptures(directory, '%08i' % index)
+    feed = LogFeed(captures, {md_req_id: drop_slash(symbol)
+                              for md_req_id, symbol in subscriptions.items()},
+                   data_dictionary)
+    lines = 0
+    with open(filename, 'rb') as log:
+        log.seek(start)
+        while log.tell() < end:
+            line = log.readline()
+            if not line:
+                break
+            feed.on_line(line)
+            lines += 1
+    captures.close()
+    return lines
+
+
+def build_symbol(args):
+    """Replay a symbol's captures, in order, into its book files. They are
+    written to a scratch directory beside the book files and then moved over
+    them, so existing files are regenerated rather than added to."""
+    symbol, captures, builder_options, writer_options = args
+    file_path = writer_options['file_path']
+    os.makedirs(file_path, exist_ok=True)
+    # on the same file system, so that the files can be moved into place
+    scratch = tempfile.mkdtemp(prefix='.rebuild-%s-' % symbol, dir=file_path)
+    try:
+        items, duration, _, checksums = replay(captures, builder_options,
+                                               dict(writer_options, file_path=scratch))
+        replace_files(scratch, file_path)
+    finally:
+        shutil.rmtree(scratch)
+    return symbol, items, sum(checksums.books.values()), duration
+
+
+def replace_files(source, destination):
+    """Move each file under source to the same place under destination,
+    replacing any file already there"""
+    for root, _, filenames in os.walk(source):
+        target = os.path.join(destination, os.path.relpath(root, source))
+        os.makedirs(target, exist_ok=True)
+        for filename in filenames:
+            os.replace(os.path.join(root, filename), os.path.join(target, filename))
+
+
+def rebuild(paths, builder_options=None, writer_options=None, processes=None,
+            work_dir=None, spec='spec/pxm44.xml'):
+    """Rebuild the books of message logs. Log days are decoded in parallel,
+    then the symbols are built in parallel, each in time order. Returns
+    symbol => (items, books). Book files already under the writer's
+    file_path are replaced by the rebuilt ones."""
+    if not writer_options or 'file_path' not in writer_options:
+        raise ValueError('Rebuilding needs a file_path to write to')
+    logs = find_logs(paths)
+    # chunks of every log, in time order
+    with Pool(processes) as pool:
+        chunks = sorted(chunk for log_chunks in pool.map(scan_log, logs)
+                        for chunk in log_chunks)
+        logger.info('Decoding %i day(s) of %i log(s)', len(chunks), len(logs))
+        results = {}
+        with tempfile.TemporaryDirectory(dir=work_dir) as directory:
+            decodes = [(i, chunk, directory, spec) for i, chunk in enumerate(chunks)]
+            lines = sum(pool.imap_unordered(decode_chunk, decodes))
+            logger.info('Decoded %i lines', lines)
+            work = []
+            for symbol in os.listdir(directory):
+                captures = sorted(glob.glob(os.path.join(directory, symbol,
+                                                         '*' + CAPTURE_EXTENSION)))
+                size = sum(os.path.getsize(capture) for capture in captures)
+                work.append((size, symbol, captures))
+            # largest first, so that no one symbol is left running on its own
+            work.sort(reverse=True)
+            for symbol, items, books, duration in pool.imap_unordered(
+                    build_symbol, [(symbol, captures, builder_options, writer_options)
+                                   for _, symbol, captures in work]):
+                logger.info('Built %i books of %s from %i items in %.1fs',
+                            books, symbol, items, duration)
+                results[symbol] = (items, books)
+    return results
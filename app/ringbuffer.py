@@ -0,0 +1,229 @@
+import logging
+import struct
+import time
+
+from multiprocessing import shared_memory
+from queue import Empty, Full
+
+logger = logging.getLogger(__name__)
+
+# head (write) and tail (read) counters live on separate cache lines
+CONTROL_SIZE = 128
+HEAD = 0
+TAIL = 8
+
+# None is stored as NaN for sizes/prices and as NONE for strings
+NAN = float('nan')
+NONE = b'\xff'  # never produced by str.encode()
+
+
+class RingBuffer():
+    """Single-producer/single-consumer ring of fixed-width quote records in
+    shared memory. Exposes the subset of the multiprocessing.Queue interface
+    used by PriceFeed and BookBuilder.
+
+    Items are (time, symbol, entries, snapshot) tuples as put by PriceFeed; an
+    item with more entries than fit in one slot spans consecutive slots and
+    is published in one go. Relies on the total store order of x86-64 so that
+    slot contents are visible before the head counter that publishes them."""
+    # pylint: disable=R0902,R0913
+    def __init__(self,
+                 slots=16384,          # number of fixed-width records
+                 slot_entries=32,      # quote entries per record
+                 symbol_width=16,
+                 entry_id_width=16,
+                 provider_width=16,
+                 name=None,            # attach to existing ring if set
+                 poll_interval=0.00005,
+                 spin=1000,
+                 put_timeout=10.0):     # seconds a blocking put() waits by default
+        self.slots = slots
+        self.slot_entries = slot_entries
+        self.symbol_width = symbol_width
+        self.entry_id_width = entry_id_width
+        self.provider_width = provider_width
+        self.poll_interval = poll_interval
+        self.spin = spin
+        # a consumer that has died never frees space, so put() gives up
+        # rather than waiting forever
+        self.put_timeout = put_timeout
+        # time, symbol, snapshot, entries in this slot, slots that follow
+        self.header = struct.Struct('<Q%is?HI' % symbol_width)
+        # entry_id, bid_size, ask_size, bid_price, ask_price, bid/ask provider
+        self.entry_format = '%isdddd%is%is' % (entry_id_width, provider_width, provider_width)
+        self.entry_size = struct.calcsize('<' + self.entry_format)
+        self.slot_size = self.header.size + slot_entries * self.entry_size
+        # one precompiled struct per number of entries in a slot
+        self.entries = [struct.Struct('<' + self.entry_format * i)
+                        for i in range(slot_entries + 1)]
+        # decoded strings, entry ids and providers repeat constantly
+        self.strings = {}
+        size = CONTROL_SIZE + slots * self.slot_size
+        if name is None:
+            logger.info('Creating %i byte ring buffer (%i slots)', size, slots)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.buf = self.shm.buf
+        self.control = self.buf[:CONTROL_SIZE].cast('Q')
+
+    def __getstate__(self):
+        """Attach by name when sent to a spawned process"""
+        return {
+            'slots': self.slots,
+            'slot_entries': self.slot_entries,
+            'symbol_width': self.symbol_width,
+            'entry_id_width': self.entry_id_width,
+            'provider_width': self.provider_width,
+            'name': self.shm.name,
+            'poll_interval': self.poll_interval,
+            'spin': self.spin,
+            'put_timeout': self.put_timeout,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def qsize(self):
+        """Number of slots (not items) waiting to be consumed"""
+        return self.control[HEAD] - self.control[TAIL]
+
+    def empty(self):
+        return self.control[HEAD] == self.control[TAIL]
+
+    def put(self, item, block=True, timeout=None):
+        """Write item into the next free slot(s), waiting for space if full,
+        for put_timeout seconds unless given a timeout"""
+        exch_time, symbol, entries, snapshot = item
+        needed = max(1, -(-len(entries) // self.slot_entries))
+        if needed > self.slots:
+            raise ValueError('%i entries do not fit in ring buffer' % len(entries))
+        head = self.control[HEAD]
+        if self.slots - (head - self.control[TAIL]) < needed:
+            if timeout is None:
+                timeout = self.put_timeout
+            try:
+                self.wait(lambda: self.slots - (head - self.control[TAIL]) >= needed,
+                          block, timeout, Full)
+            except Full:
+                if block:
+                    logger.error('Ring buffer %s full for %.1fs, is its consumer running?',
+                                 self.name, timeout)
+                raise
+        symbol = encode(symbol, self.symbol_width)
+        for i in range(needed):
+            offset = CONTROL_SIZE + ((head + i) % self.slots) * self.slot_size
+            chunk = entries[i * self.slot_entries:(i + 1) * self.slot_entries]
+            self.header.pack_into(self.buf, offset, exch_time, symbol, snapshot,
+                                  len(chunk), needed - 1 - i)
+            self.entries[len(chunk)].pack_into(self.buf, offset + self.header.size,
+                                               *self.flatten(chunk))
+        # publish
+        self.control[HEAD] = head + needed
+
+    def get(self, block=True, timeout=None):
+        """Read the next item, raising Empty if none arrives in time"""
+        tail = self.control[TAIL]
+        if self.control[HEAD] == tail:
+            self.wait(lambda: self.control[HEAD] != tail, block, timeout, Empty)
+        entries = []
+        remaining = 1
+        while remaining:
+            offset = CONTROL_SIZE + (tail % self.slots) * self.slot_size
+            exch_time, symbol, snapshot, count, remaining = \
+                self.header.unpack_from(self.buf, offset)
+            values = self.entries[count].unpack_from(self.buf, offset + self.header.size)
+            self.unflatten(values, entries)
+            tail += 1
+        # release slot(s) back to producer
+        self.control[TAIL] = tail
+        symbol = self.strings[symbol] if symbol in self.strings else self.decode(symbol)
+        return (exch_time, symbol, entries, snapshot)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def wait(self, ready, block, timeout, exception):
+        """Spin, then sleep-poll, until ready() or timeout"""
+        if ready():
+            return
+        if not block:
+            raise exception
+        for _ in range(self.spin):
+            if ready():
+                return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not ready():
+            if deadline is not None and time.monotonic() >= deadline:
+                raise exception
+            time.sleep(self.poll_interval)
+
+    def flatten(self, entries):
+        """Turn entries into struct values, None becomes NAN/NONE"""
+        values = []
+        extend = values.extend
+        entry_id_width = self.entry_id_width
+        provider_width = self.provider_width
+        for entry_id, bid_size, ask_size, bid_price, ask_price, bid_provider, ask_provider \
+                in entries:
+            extend((
+                encode(entry_id, entry_id_width),
+                NAN if bid_size is None else bid_size,
+                NAN if ask_size is None else ask_size,
+                NAN if bid_price is None else bid_price,
+                NAN if ask_price is None else ask_price,
+                NONE if bid_provider is None else encode(bid_provider, provider_width),
+                NONE if ask_provider is None else encode(ask_provider, provider_width),
+            ))
+        return values
+
+    def unflatten(self, values, entries):
+        """Append entries rebuilt from struct values, NAN/NONE become None"""
+        append = entries.append
+        strings = self.strings
+        fields = iter(values)
+        # pylint: disable=R0124
+        for entry_id, bid_size, ask_size, bid_price, ask_price, bid_provider, ask_provider \
+                in zip(fields, fields, fields, fields, fields, fields, fields):
+            append([
+                strings[entry_id] if entry_id in strings else self.decode(entry_id),
+                bid_size if bid_size == bid_size else None,
+                ask_size if ask_size == ask_size else None,
+                bid_price if bid_price == bid_price else None,
+                ask_price if ask_price == ask_price else None,
+                strings[bid_provider] if bid_provider in strings else self.decode(bid_provider),
+                strings[ask_provider] if ask_provider in strings else self.decode(ask_provider),
+            ])
+
+    def decode(self, value):
+        """Decode (and remember) a fixed-width string field"""
+        stripped = value.rstrip(b'\x00')
+        string = None if stripped == NONE else stripped.decode()
+        self.strings[value] = string
+        return string
+
+    def close(self):
+        """Detach from shared memory"""
+        self.control.release()
+        self.buf = None
+        self.shm.close()
+
+    def join_thread(self):
+        """Nothing to flush, there is no feeder thread"""
+        return
+
+    def unlink(self):
+        """Remove shared memory, called once by the owner"""
+        self.shm.unlink()
+
+
+def encode(value, width):
+    """Encode string into a fixed-width field, refusing to truncate"""
+    encoded = value.encode()
+    if len(encoded) > width:
+        raise ValueError('%r does not fit in %i bytes' % (value, width))
+    return encoded
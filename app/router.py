@@ -0,0 +1,68 @@
+import logging
+import zlib
+
+from app.bookbuilder import PROVIDERS
+from app.filewriter import CLOCK
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400 * 1000000  # microseconds
+
+
+class SymbolRouter():
+    """Puts each item on the queue of the shard that owns its symbol, so a
+    symbol's items always go to the same consumer and stay in order.
+
+    Symbols listed up front are dealt out round robin, anything else is
+    placed by a hash of its name that does not change between runs."""
+    def __init__(self, queues, symbols=()):
+        assert queues
+        self.queues = queues
+        self.shards = {}
+        for i, symbol in enumerate(symbols):
+            self.shards[symbol] = i % len(queues)
+
+    def put(self, item, block=True, timeout=None):
+        self.queues[self.shard(item[1])].put(item, block, timeout)
+
+    def shard(self, symbol):
+        shard = self.shards.get(symbol)
+        if shard is None:
+            shard = shard_of(symbol, len(self.queues))
+            logger.debug('Routing %s to shard %i', symbol, shard)
+            self.shards[symbol] = shard
+        return shard
+
+
+class BookRouter(SymbolRouter):
+    """Routes bookbuilder output to filewriter shards, books and provider
+    names by symbol. Every shard is sent the time when a new day starts so
+    that they all roll over, not just those with books for the new day."""
+    def __init__(self, queues, symbols=()):
+        super().__init__(queues, symbols)
+        self.day = None
+
+    def put(self, item, block=True, timeout=None):
+        time, key, entry = item[:3]  # traced books also carry stamps
+        day = time // DAY
+        if self.day is None or day > self.day:
+            self.day = day
+            for queue in self.queues:
+                queue.put((time, CLOCK, None), block, timeout)
+        symbol = entry[0] if key == PROVIDERS else key
+        self.queues[self.shard(symbol)].put(item, block, timeout)
+
+
+class AllEvents():
+    """Set once every one of events is set, e.g. when every producer
+    feeding a consumer has shut down"""
+    def __init__(self, events):
+        self.events = events
+
+    def is_set(self):
+        return all(event.is_set() for event in self.events)
+
+
+def shard_of(symbol, shards):
+    """Stable shard of symbol, unlike hash() which is salted per process"""
+    return zlib.crc32(symbol.encode()) % shards
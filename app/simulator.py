@@ -0,0 +1,297 @@
+import logging
+import random
+import time
+
+from itertools import permutations
+from time import monotonic
+
+import quickfix as fix
+import quickfix44 as fix44
+
+import app.pxm44 as pxm44
+
+logger = logging.getLogger(__name__)
+
+# symbols are made up of pairs of these, majors first
+CURRENCIES = ['EUR', 'USD', 'JPY', 'GBP', 'AUD', 'CAD', 'CHF', 'NZD', 'SEK', 'NOK',
+              'DKK', 'SGD', 'HKD', 'MXN', 'ZAR', 'TRY', 'PLN', 'CZK', 'HUF', 'CNH']
+# sizes of the levels of the ladder, in base currency
+SIZES = [1000000, 2000000, 3000000, 5000000, 10000000]
+
+
+class Simulator(fix.Application):
+    """PrimeXM-style market data acceptor for load testing. Answers each
+    MarketDataRequest with a snapshot, or a reject for symbols it does not
+    quote, then streams MassQuotes of the subscribed symbols at rate messages
+    per second, asking for a MassQuoteAcknowledgement every ack_every messages"""
+    # pylint: disable=R0902,R0913
+    def __init__(self,
+                 shutdown_event,
+                 symbols,
+                 quote_sets=1,        # quote sets per MassQuote
+                 entries=5,           # entries per quote set
+                 providers=3,         # liquidity providers behind the entries
+                 rate=1000,           # MassQuotes per second
+                 ack_every=100,       # 0 never asks for acknowledgement
+                 duration=None,       # seconds to stream for, None until stopped
+                 stats_interval=10,   # seconds between stats
+                 seed=None):
+        logger.info('Initialising Simulator')
+        assert quote_sets > 0 and entries > 0 and providers > 0 and rate > 0
+        self.fix_adapter = None
+        self.shutdown_event = shutdown_event
+        self.quote_sets = quote_sets
+        self.rate = rate
+        self.ack_every = ack_every
+        self.duration = duration
+        self.stats_interval = stats_interval
+        self.random = random.Random(seed)
+        self.markets = {symbol: Market(symbol, entries, providers, self.random)
+                        for symbol in symbols}
+        # session state
+        self.session_id = None
+        self.streams = []  # (MDReqID, Market) of each subscription
+        self.next_stream = 0
+        self.messages = 0
+        # QuoteID => when its MassQuote was sent, until acknowledged
+        self.outstanding = {}
+        self.reset_stats()
+        # handlers
+        self.handlers = {}
+        self.handlers[fix.MsgType_MarketDataRequest] = self.on_market_data_request
+        self.handlers[fix.MsgType_MassQuoteAcknowledgement] = self.on_mass_quote_ack
+        super().__init__()
+
+    def set_fix_adapter(self, fix_adapter):
+        """Allow Simulator to call stop() on the SocketAcceptor"""
+        self.fix_adapter = fix_adapter
+
+    def run(self):
+        """Stream MassQuotes, paced to rate, while a client is subscribed"""
+        self.fix_adapter.start()
+        interval = 1.0 / self.rate
+        started = None
+        due = monotonic()
+        while not self.shutdown_event.is_set():
+            now = monotonic()
+            if now - self.stats_time >= self.stats_interval:
+                self.log_stats()
+            if self.session_id is None or not self.streams:
+                time.sleep(0.1)
+                due = monotonic()
+                continue
+            if started is None:
+                started = now
+            if self.duration is not None and now - started >= self.duration:
+                break
+            if now < due:
+                time.sleep(min(due - now, 0.1))
+                continue
+            self.send_mass_quote()
+            due += interval
+            if now - due > 1:
+                # more than a second behind, carry on from here rather than burst
+                due = now
+        self.shutdown()
+
+    def shutdown(self):
+        logger.info('Shutdown triggered!')
+        if self.fix_adapter is not None and not self.fix_adapter.isStopped():
+            logger.info('Stopping FIX Adapter')
+            self.fix_adapter.stop()
+        self.shutdown_event.set()
+        self.log_stats()
+        if self.outstanding:
+            logger.warning('%i MassQuote(s) never acknowledged', len(self.outstanding))
+        logger.info('Shutdown complete!')
+
+    def log_stats(self):
+        now = monotonic()
+        logger.info('Sent %i MassQuotes in %.0fs (%.0f/s), %i acknowledged '
+                    '(mean %.3fms, max %.3fms), %i awaiting acknowledgement',
+                    self.sent, now - self.stats_time, self.sent / max(now - self.stats_time, 1e-9),
+                    self.acks, 1000 * self.ack_time / max(self.acks, 1),
+                    1000 * self.max_ack_time, len(self.outstanding))
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.sent = 0
+        self.acks = 0
+        self.ack_time = 0.0
+        self.max_ack_time = 0.0
+        self.stats_time = monotonic()
+
+    # quickfix core callbacks
+
+    # pylint: disable=R0201,W0613
+    def on_create(self, session_id):  # pragma: no cover
+        """Notification of a session being created."""
+        return
+
+    def on_logon(self, session_id):
+        """Notification of a session successfully logging on."""
+        logger.info('Logged ON %s', session_id)
+        self.session_id = session_id
+
+    def on_logout(self, session_id):
+        """Notification of a session logging off or disconnecting."""
+        logger.info('Logged OFF %s', session_id)
+        self.session_id = None
+        self.streams = []
+        self.outstanding.clear()
+
+    # pylint: disable=R0201,W0613
+    def to_admin(self, message, session_id):  # pragma: no cover
+        """Notification of admin message being sent to target."""
+        return
+
+    # pylint: disable=R0201,W0613
+    def to_app(self, message, session_id):  # pragma: no cover
+        """Notification of app message being sent to target."""
+        return
+
+    # pylint: disable=R0201,W0613
+    def from_admin(self, message, session_id):  # pragma: no cover
+        """Notification of admin message being received from target."""
+        return
+
+    def from_app(self, message, session_id):
+        """Notification of app message being received from target."""
+        msg_type = message.getHeader().getField(fix.MsgType()).getString()
+        handler = self.handlers.get(msg_type)
+        if handler:
+            handler(message, session_id)
+        else:
+            logger.warning('Unsupported MsgType received %s', msg_type)
+
+    # aliases to override inherited methods
+    onCreate = on_create
+    onLogon = on_logon
+    onLogout = on_logout
+    toAdmin = to_admin
+    toApp = to_app
+    fromAdmin = from_admin
+    fromApp = from_app
+
+    # inbound message handlers
+
+    def on_market_data_request(self, message, session_id):
+        """Snapshot the requested symbol and start streaming it, or reject it"""
+        md_req_id = message.getField(262)  # MDReqID
+        group = fix44.MarketDataRequest.NoRelatedSym()
+        message.getGroup(1, group)
+        symbol = group.getField(55)        # Symbol
+        market = self.markets.get(symbol)
+        if market is None:
+            logger.warning('Rejecting subscription to %s (%s)', symbol, md_req_id)
+            fix.Session.sendToTarget(create_market_data_request_reject(
+                md_req_id, 'symbol not found'), session_id)
+            return
+        logger.info('Subscribed to %s (%s)', symbol, md_req_id)
+        fix.Session.sendToTarget(create_market_data_snapshot(md_req_id, market), session_id)
+        self.streams.append((md_req_id, market))
+
+    def on_mass_quote_ack(self, message, session_id):
+        """Check a MassQuoteAcknowledgement is for a MassQuote awaiting one"""
+        quote_id = message.getField(117) if message.isSetField(117) else None
+        sent = self.outstanding.pop(quote_id, None)
+        if sent is None:
+            logger.warning('Unexpected MassQuoteAcknowledgement of QuoteID %s', quote_id)
+            return
+        duration = monotonic() - sent
+        self.acks += 1
+        self.ack_time += duration
+        self.max_ack_time = max(self.max_ack_time, duration)
+
+    # outbound messages
+
+    def send_mass_quote(self):
+        """Send the next quote_sets subscriptions, round robin, a tick each"""
+        streams = self.streams
+        quote_sets = []
+        for _ in range(min(self.quote_sets, len(streams))):
+            md_req_id, market = streams[self.next_stream % len(streams)]
+            self.next_stream += 1
+            market.tick()
+            quote_sets.append((md_req_id, market.entries))
+        self.messages += 1
+        quote_id = None
+        if self.ack_every and self.messages % self.ack_every == 0:
+            quote_id = str(self.messages)
+            self.outstanding[quote_id] = monotonic()
+        fix.Session.sendToTarget(create_mass_quote(quote_sets, quote_id), self.session_id)
+        self.sent += 1
+
+
+class Market():
+    """Random walk of a symbol's mid, quoted as a ladder of entries, each
+    [QuoteEntryID, Issuer, BidSize, OfferSize, BidSpotRate, OfferSpotRate]"""
+    def __init__(self, symbol, entries, providers, rng):
+        self.symbol = symbol
+        self.random = rng
+        self.pip = 0.01 if 'JPY' in symbol else 0.0001
+        self.mid = self.random.uniform(0.5, 2.0) * (100 if 'JPY' in symbol else 1)
+        self.entries = [[str(i), str(i % providers), SIZES[i % len(SIZES)],
+                         SIZES[i % len(SIZES)], 0.0, 0.0] for i in range(entries)]
+        self.tick()
+
+    def tick(self):
+        """Move the mid by up to a pip and requote every entry around it"""
+        self.mid += self.pip * self.random.choice((-1, -0.5, 0, 0.5, 1))
+        for i, entry in enumerate(self.entries):
+            half_spread = self.pip * (0.5 + i + 0.5 * self.random.random())
+            entry[4] = round(self.mid - half_spread, 5)
+            entry[5] = round(self.mid + half_spread, 5)
+
+
+def make_symbols(count):
+    """count made up currency pairs, e.g. EUR/USD"""
+    symbols = ['%s/%s' % pair for pair in permutations(CURRENCIES, 2)]
+    if count > len(symbols):
+        raise ValueError('At most %i symbols' % len(symbols))
+    return symbols[:count]
+
+
+def create_mass_quote(quote_sets, quote_id=None):
+    """MassQuote of (QuoteSetID, entries) quote sets"""
+    msg = pxm44.MassQuote()
+    if quote_id is not None:
+        msg.setField(fix.QuoteID(quote_id))
+    for quote_set_id, entries in quote_sets:
+        quote_set = pxm44.MassQuote.NoQuoteSets()
+        quote_set.setField(302, quote_set_id)                   # QuoteSetID
+        for entry_id, provider, bid_size, ask_size, bid_price, ask_price in entries:
+            quote_entry = pxm44.MassQuote.NoQuoteSets.NoQuoteEntries()
+            quote_entry.setField(299, entry_id)                 # QuoteEntryID
+            quote_entry.setField(106, provider)                 # Issuer
+            quote_entry.setField(134, str(bid_size))            # BidSize
+            quote_entry.setField(135, str(ask_size))            # OfferSize
+            quote_entry.setField(188, '%.5f' % bid_price)       # BidSpotRate
+            quote_entry.setField(190, '%.5f' % ask_price)       # OfferSpotRate
+            quote_set.addGroup(quote_entry)
+        msg.addGroup(quote_set)
+    return msg
+
+
+def create_market_data_snapshot(md_req_id, market):
+    """MarketDataSnapshotFullRefresh of a market, a bid and an offer per entry"""
+    msg = pxm44.MarketDataSnapshotFullRefresh()
+    msg.setField(fix.MDReqID(md_req_id))    # 262
+    msg.setField(fix.Symbol(market.symbol))  # 55
+    for entry_id, provider, bid_size, ask_size, bid_price, ask_price in market.entries:
+        for entry_type, price, size in (('0', bid_price, bid_size), ('1', ask_price, ask_size)):
+            md_entry = pxm44.MarketDataSnapshotFullRefresh.NoMDEntries()
+            md_entry.setField(269, entry_type)      # MDEntryType
+            md_entry.setField(270, '%.5f' % price)  # MDEntryPx
+            md_entry.setField(271, str(size))       # MDEntrySize
+            md_entry.setField(299, entry_id)        # QuoteEntryID
+            md_entry.setField(106, provider)        # Issuer
+            msg.addGroup(md_entry)
+    return msg
+
+
+def create_market_data_request_reject(md_req_id, text):
+    msg = fix44.MarketDataRequestReject()
+    msg.setField(fix.MDReqID(md_req_id))  # 262
+    msg.setField(fix.Text(text))          # 58
+    return msg
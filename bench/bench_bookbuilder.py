@@ -9,26 +9,26 @@ import app.bookbuilder
 
 
 ITEM = (1509980228528000, 'EURDKK', [
-    ['0', 100000.0, 100000.0, 1.80699, 1.80709, '1'],
-    ['1', 250000.0, 250000.0, 1.80698, 1.80710, '1'],
-    ['2', 500000.0, 500000.0, 1.80697, 1.80711, '1'],
-    ['3', 750000.0, 750000.0, 1.80695, 1.80712, '1'],
-    ['4', 1000000.0, 1000000.0, 1.80694, 1.80713, '1'],
-    ['5', 2000000.0, 2000000.0, 1.80693, 1.80714, '1'],
-    ['6', 3000000.0, 3000000.0, 1.80692, 1.80715, '1'],
-    ['7', 5000000.0, 5000000.0, 1.80691, 1.80716, '1'],
-    ['8', 7500000.0, 7500000.0, 1.80690, 1.80717, '1'],
-    ['9', 10000000.0, 10000000.0, 1.80689, 1.80718, '1'],
-    ['10', 15000000.0, 15000000.0, 1.80688, 1.80719, '1'],
-    ['11', 20000000.0, 20000000.0, 1.80687, 1.80720, '1'],
-    ['12', 30000000.0, 30000000.0, 1.80686, 1.80721, '1'],
-    ['13', 40000000.0, 40000000.0, 1.80685, 1.80722, '1'],
-    ['14', 50000000.0, 50000000.0, 1.80684, 1.80723, '1'],
-    ['15', 60000000.0, 60000000.0, 1.80683, 1.80724, '1'],
-    ['16', 70000000.0, 70000000.0, 1.80682, 1.80725, '1'],
-    ['17', 80000000.0, 80000000.0, 1.80681, 1.80726, '1'],
-    ['18', 90000000.0, 90000000.0, 1.80680, 1.80727, '1'],
-    ['19', 10000000.0, 10000000.0, 1.80679, 1.80728, '1']])
+    ['0', 100000.0, 100000.0, 1.80699, 1.80709, '1', '1'],
+    ['1', 250000.0, 250000.0, 1.80698, 1.80710, '1', '1'],
+    ['2', 500000.0, 500000.0, 1.80697, 1.80711, '1', '1'],
+    ['3', 750000.0, 750000.0, 1.80695, 1.80712, '1', '1'],
+    ['4', 1000000.0, 1000000.0, 1.80694, 1.80713, '1', '1'],
+    ['5', 2000000.0, 2000000.0, 1.80693, 1.80714, '1', '1'],
+    ['6', 3000000.0, 3000000.0, 1.80692, 1.80715, '1', '1'],
+    ['7', 5000000.0, 5000000.0, 1.80691, 1.80716, '1', '1'],
+    ['8', 7500000.0, 7500000.0, 1.80690, 1.80717, '1', '1'],
+    ['9', 10000000.0, 10000000.0, 1.80689, 1.80718, '1', '1'],
+    ['10', 15000000.0, 15000000.0, 1.80688, 1.80719, '1', '1'],
+    ['11', 20000000.0, 20000000.0, 1.80687, 1.80720, '1', '1'],
+    ['12', 30000000.0, 30000000.0, 1.80686, 1.80721, '1', '1'],
+    ['13', 40000000.0, 40000000.0, 1.80685, 1.80722, '1', '1'],
+    ['14', 50000000.0, 50000000.0, 1.80684, 1.80723, '1', '1'],
+    ['15', 60000000.0, 60000000.0, 1.80683, 1.80724, '1', '1'],
+    ['16', 70000000.0, 70000000.0, 1.80682, 1.80725, '1', '1'],
+    ['17', 80000000.0, 80000000.0, 1.80681, 1.80726, '1', '1'],
+    ['18', 90000000.0, 90000000.0, 1.80680, 1.80727, '1', '1'],
+    ['19', 10000000.0, 10000000.0, 1.80679, 1.80728, '1', '1']])
 
 QUOTES = [
     {'entry_type': 0, 'price': 1.80699, 'size': 100000.0, 'time': 1595336924000000, 'provider': 'p1'},
@@ -74,33 +74,125 @@ QUOTES = [
     ]
 
 
+def make_quotes(quotes, ordered=True):
+    """QuoteState from a list of quote dicts"""
+    return app.bookbuilder.QuoteState.from_dict({
+        ('B' if quote['entry_type'] == 0 else 'S') + str(i): quote
+        for i, quote in enumerate(quotes)}, app.bookbuilder.Providers(), ordered=ordered)
+
+
 def bench_update_quotes(iterations):
+    providers = app.bookbuilder.Providers()
     start_time = datetime.datetime.now()
     time, _, quotes = ITEM
-    # res = {}
     for _ in range(iterations):
-        app.bookbuilder.update_quotes(time, {}, quotes)
+        app.bookbuilder.update_quotes(time, app.bookbuilder.QuoteState(providers), quotes)
     end_time = datetime.datetime.now()
     duration = (end_time - start_time).total_seconds()
     return ("process_items", iterations, duration)
 
 
 def bench_build_book(iterations):
-    schema = app.bookbuilder.create_schema(10)
+    schema = np.zeros(1, dtype=app.bookbuilder.create_schema(10))
+    views = app.bookbuilder.create_views(schema, 10)
+    quotes = make_quotes(QUOTES)
     start_time = datetime.datetime.now()
-    schema = np.empty(1, dtype=schema)
     for _ in range(iterations):
-        app.bookbuilder.build_book(1, QUOTES, np.copy(schema), 10)
+        app.bookbuilder.build_book(1, quotes, schema, 10, views)
     end_time = datetime.datetime.now()
     duration = (end_time - start_time).total_seconds()
     return ("build_book", iterations, duration)
 
 
+def bench_build_book_full_sort(iterations):
+    schema = np.zeros(1, dtype=app.bookbuilder.create_schema(10))
+    views = app.bookbuilder.create_views(schema, 10)
+    quotes = make_quotes(QUOTES, ordered=False)
+    start_time = datetime.datetime.now()
+    for _ in range(iterations):
+        app.bookbuilder.build_book(1, quotes, schema, 10, views)
+    end_time = datetime.datetime.now()
+    duration = (end_time - start_time).total_seconds()
+    return ("build_book_full_sort", iterations, duration)
+
+
+def bench_single_update(iterations, ordered):
+    """One entry changes price then a book is built, as for a one entry MassQuote"""
+    schema = np.zeros(1, dtype=app.bookbuilder.create_schema(10))
+    views = app.bookbuilder.create_views(schema, 10)
+    quotes = make_quotes(QUOTES, ordered=ordered)
+    updates = [[['0', None, None, 1.80699, None, 'p1', None]],
+               [['0', None, None, 1.80690, None, 'p1', None]]]
+    start_time = datetime.datetime.now()
+    for i in range(iterations):
+        app.bookbuilder.update_quotes(i, quotes, updates[i % 2])
+        app.bookbuilder.build_book(i, quotes, schema, 10, views)
+    end_time = datetime.datetime.now()
+    duration = (end_time - start_time).total_seconds()
+    return ("single_update_" + ("incremental" if ordered else "full_sort"), iterations, duration)
+
+
+def make_random_quotes(entries, ordered, seed=42):
+    """QuoteState of entries quotes per side from many providers, prices on
+    a tick grid so there are ties"""
+    rng = np.random.RandomState(seed)
+    quotes = app.bookbuilder.QuoteState(app.bookbuilder.Providers(), ordered=ordered)
+    updates = []
+    for i in range(entries):
+        spread = rng.randint(1, 50) * 0.00001
+        size = float(rng.choice([1000000, 2000000, 5000000]))
+        updates.append([str(i), size, size, round(1.18 - spread, 5), round(1.18 + spread, 5),
+                        str(i % 50), str(i % 50)])
+    return app.bookbuilder.update_quotes(1, quotes, updates)
+
+
+def bench_slots(iterations, entries, number_of_levels, select):
+    quotes = make_random_quotes(entries, ordered=False)
+    side = quotes.sides[0]
+    start_time = datetime.datetime.now()
+    if select:
+        for _ in range(iterations):
+            app.bookbuilder.select_slots(side, True, number_of_levels, 0)
+    else:
+        for _ in range(iterations):
+            app.bookbuilder.sorted_slots(side, True)[:number_of_levels]
+    end_time = datetime.datetime.now()
+    duration = (end_time - start_time).total_seconds()
+    name = 'select_slots' if select else 'sorted_slots'
+    return ('%s_%i_%i' % (name, entries, number_of_levels), iterations, duration)
+
+
+def bench_build_book_size(iterations, entries, number_of_levels, ordered):
+    schema = np.zeros(1, dtype=app.bookbuilder.create_schema(number_of_levels))
+    views = app.bookbuilder.create_views(schema, number_of_levels)
+    quotes = make_random_quotes(entries, ordered)
+    start_time = datetime.datetime.now()
+    for _ in range(iterations):
+        app.bookbuilder.build_book(1, quotes, schema, number_of_levels, views)
+    end_time = datetime.datetime.now()
+    duration = (end_time - start_time).total_seconds()
+    name = 'build_book_incremental' if ordered else 'build_book_full_sort'
+    return ('%s_%i_%i' % (name, entries, number_of_levels), iterations, duration)
+
+
+def bench_book_size_sweep(iterations):
+    """Top-N selection against a full sort as books get deeper"""
+    results = []
+    for entries in (20, 100, 500, 2000):
+        for number_of_levels in (5, 10):
+            results.append(bench_slots(iterations, entries, number_of_levels, False))
+            results.append(bench_slots(iterations, entries, number_of_levels, True))
+            results.append(bench_build_book_size(iterations, entries, number_of_levels, False))
+            results.append(bench_build_book_size(iterations, entries, number_of_levels, True))
+    return results
+
+
 def bench_flip_quotes(iterations):
+    quotes = make_quotes(QUOTES)
     start_time = datetime.datetime.now()
     for _ in range(iterations):
-        app.bookbuilder.flip_quotes(QUOTES, 0, False)
-        app.bookbuilder.flip_quotes(QUOTES, 0, True)
+        app.bookbuilder.flip_quotes(quotes, 0, False)
+        app.bookbuilder.flip_quotes(quotes, 0, True)
     end_time = datetime.datetime.now()
     duration = (end_time - start_time).total_seconds()
     return ("flip_quotes", iterations, duration)
@@ -121,8 +213,16 @@ def main():
     print_results(*res)
     res = bench_build_book(100000)
     print_results(*res)
+    res = bench_build_book_full_sort(100000)
+    print_results(*res)
+    res = bench_single_update(100000, True)
+    print_results(*res)
+    res = bench_single_update(100000, False)
+    print_results(*res)
     res = bench_flip_quotes(100000)
     print_results(*res)
+    for res in bench_book_size_sweep(10000):
+        print_results(*res)
 
 
 if __name__ == '__main__':
@@ -132,3 +232,16 @@ if __name__ == '__main__':
 # process_items,100000,2.942874,0.000029
 # build_book,100000,5.595545,0.000056
 # flip_quotes,100000,2.490446,0.000025
+
+# book size sweep, single core, selection without the small side fallback
+# function,iterations,total,iteration
+# sorted_slots_20_10,10000,0.044923,0.000004
+# select_slots_20_10,10000,0.085152,0.000009
+# sorted_slots_100_10,10000,0.110873,0.000011
+# select_slots_100_10,10000,0.175688,0.000018
+# sorted_slots_500_10,10000,0.331711,0.000033
+# select_slots_500_10,10000,0.236778,0.000024
+# sorted_slots_2000_10,10000,1.401465,0.000140
+# select_slots_2000_10,10000,0.297656,0.000030
+# build_book_full_sort_2000_10,10000,0.740728,0.000074
+# build_book_incremental_2000_10,10000,0.172526,0.000017
@@ -0,0 +1,143 @@
+import datetime
+import os
+import sys
+import tempfile
+
+from unittest.mock import Mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app.bookbuilder
+import app.filewriter
+
+
+SYMBOL = 'EURUSD'
+
+# (name, layout, compression, level, shuffle, chunk_rows)
+SETTINGS = [
+    ('columns', 'columns', 'none', None, False, None),
+    ('columns_chunk_4096', 'columns', 'none', None, False, 4096),
+    ('columns_lzf', 'columns', 'lzf', None, False, None),
+    ('columns_lzf_shuffle', 'columns', 'lzf', None, True, 4096),
+    ('columns_gzip1_shuffle', 'columns', 'gzip', 1, True, 4096),
+    ('columns_gzip4_shuffle', 'columns', 'gzip', 4, True, 4096),
+    ('compound', 'compound', 'none', None, False, None),
+    ('compound_lzf_shuffle', 'compound', 'lzf', None, True, 1024),
+    ('compound_gzip1_shuffle', 'compound', 'gzip', 1, True, 1024),
+    ('raw', 'raw', 'none', None, False, None),
+]
+
+
+def make_books(rows, levels=10, entries=20, seed=42):
+    """Books from a random walk of a few entries per update, so that like a
+    real feed most levels barely change from one row to the next"""
+    rng = np.random.RandomState(seed)
+    providers = app.bookbuilder.Providers()
+    quotes = app.bookbuilder.QuoteState(providers)
+    schema = np.zeros(1, dtype=app.bookbuilder.create_schema(levels))
+    views = app.bookbuilder.create_views(schema, levels)
+    books = np.zeros(rows, dtype=schema.dtype)
+    mid = 1.18
+    time = 1509980228528000
+    for i in range(rows):
+        time += int(rng.exponential(5000)) + 1
+        mid += rng.choice([-0.00001, 0, 0.00001])
+        updates = []
+        for entry in rng.choice(entries, rng.randint(1, 4), replace=False):
+            spread = 0.00001 * (entry + 1)
+            size = 1000000.0 * (entry // 4 + 1)
+            updates.append([str(entry), size, size, round(mid - spread, 5),
+                            round(mid + spread, 5), str(entry % 3), str(entry % 3)])
+        app.bookbuilder.update_quotes(time, quotes, updates)
+        books[i] = app.bookbuilder.build_book(time, quotes, schema, levels, views)[0]
+    return books
+
+
+def bench_setting(directory, books, setting):
+    """Write books through a FileWriter, returns duration and bytes per row"""
+    name, layout, compression, level, shuffle, chunk_rows = setting
+    file_path = os.path.join(directory, name)
+    options = app.filewriter.dataset_options(compression, level, shuffle, chunk_rows)
+    filewriter = app.filewriter.FileWriter(Mock(), Mock(), file_path=file_path,
+                                           layout=layout, options=options)
+    start_time = datetime.datetime.now()
+    for i in range(books.size):
+        book = books[i:i+1]
+        filewriter.process_item((int(book['time'][0]), SYMBOL, book))
+    filewriter.flush_cache_all()
+    end_time = datetime.datetime.now()
+    duration = (end_time - start_time).total_seconds()
+    filename = filewriter.get_filename(SYMBOL)
+    return (name, books.size, duration, os.path.getsize(filename) / books.size)
+
+
+def bench_flush(directory, books, setting, cache_size=1024):
+    """Time only the flushes of cache_size books, as done by a flush thread"""
+    name, layout, compression, level, shuffle, chunk_rows = setting
+    file_path = os.path.join(directory, 'flush_' + name)
+    options = app.filewriter.dataset_options(compression, level, shuffle, chunk_rows)
+    flusher = app.filewriter.Flusher(layout=layout, options=options)
+    filename = os.path.join(file_path, SYMBOL + app.filewriter.EXTENSIONS[layout])
+    start_time = datetime.datetime.now()
+    for i in range(0, books.size, cache_size):
+        flusher.flush(SYMBOL, filename, books[i:i+cache_size])
+    flusher.rollover()
+    end_time = datetime.datetime.now()
+    duration = (end_time - start_time).total_seconds()
+    return ('flush_' + name, books.size, duration, os.path.getsize(filename) / books.size)
+
+
+def print_results(func, iterations, duration, bytes_per_row):
+    print(','.join([
+        func,
+        str(iterations),
+        str(duration),
+        '%f' % (duration / iterations),
+        '%.1f' % bytes_per_row
+        ]))
+
+
+def main():
+    """Usage: bench_filewriter.py [directory], defaults to a temporary
+    directory in /dev/shm, pass a path on disk to compare"""
+    directory = sys.argv[1] if len(sys.argv) > 1 else None
+    if directory is None and os.path.isdir('/dev/shm'):
+        directory = '/dev/shm'
+    books = make_books(65536)
+    print('function,iterations,total,iteration,bytes_per_row')
+    with tempfile.TemporaryDirectory(dir=directory) as temporary_directory:
+        for setting in SETTINGS:
+            res = bench_setting(temporary_directory, books, setting)
+            print_results(*res)
+        for setting in SETTINGS:
+            res = bench_flush(temporary_directory, books, setting)
+            print_results(*res)
+
+
+if __name__ == '__main__':
+    main()
+
+
+# /dev/shm, single core
+# function,iterations,total,iteration,bytes_per_row
+# columns,65536,2.734187,0.000042,511.1
+# columns_chunk_4096,65536,3.085392,0.000047,511.1
+# columns_lzf,65536,2.781216,0.000042,68.8
+# columns_lzf_shuffle,65536,2.933012,0.000045,95.6
+# columns_gzip1_shuffle,65536,3.552702,0.000054,69.3
+# columns_gzip4_shuffle,65536,3.33937,0.000051,61.0
+# compound,65536,2.612926,0.000040,509.3
+# compound_lzf_shuffle,65536,3.002474,0.000046,90.9
+# compound_gzip1_shuffle,65536,2.817841,0.000043,67.7
+# raw,65536,2.43451,0.000037,508.1
+# flush_columns,65536,0.704908,0.000011,511.1
+# flush_columns_chunk_4096,65536,0.704572,0.000011,511.1
+# flush_columns_lzf,65536,0.887004,0.000014,68.8
+# flush_columns_lzf_shuffle,65536,0.912184,0.000014,95.6
+# flush_columns_gzip1_shuffle,65536,0.878109,0.000013,69.3
+# flush_columns_gzip4_shuffle,65536,0.94605,0.000014,61.0
+# flush_compound,65536,0.163247,0.000002,509.3
+# flush_compound_lzf_shuffle,65536,0.357455,0.000005,90.9
+# flush_compound_gzip1_shuffle,65536,0.420677,0.000006,67.7
+# flush_raw,65536,0.054403,0.000001,508.1
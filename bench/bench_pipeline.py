@@ -0,0 +1,184 @@
+import os
+import sys
+import tempfile
+import time
+
+from multiprocessing import Event, Process, Queue
+
+import numpy as np
+import quickfix as fix
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app.bookbuilder
+import app.filewriter
+import app.pipeline
+import app.pricefeed
+
+DATA_DICTIONARY = fix.DataDictionary()
+DATA_DICTIONARY.readFromURL('spec/pxm44.xml')
+SUBSCRIPTIONS = ['EUR/USD', 'USD/CAD', 'AUD/USD', 'EUR/GBP', 'USD/JPY', 'EUR/TRY']
+
+
+class TimedFileWriter(app.filewriter.FileWriter):
+    """FileWriter noting when each book arrives, sent back on shutdown"""
+    def __init__(self, *args, results=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.results = results
+        self.arrivals = []
+
+    def process_item(self, item):
+        if item[1] not in (app.bookbuilder.PROVIDERS, app.filewriter.CLOCK):
+            self.arrivals.append(time.perf_counter_ns())
+        super().process_item(item)
+
+    def shutdown(self):
+        super().shutdown()
+        self.results.put(self.arrivals)
+
+
+def recorded_messages(filename):
+    """MassQuote messages of a quickfix messages log"""
+    messages = []
+    with open(filename) as log:
+        for line in log:
+            raw = line[line.index('8=FIX'):].rstrip('\n') if '8=FIX' in line else ''
+            if '\x0135=i\x01' in raw:
+                messages.append(fix.Message(raw, DATA_DICTIONARY))
+    return messages
+
+
+def make_messages(count, entries=5, seed=42):
+    """MassQuote messages of a random walk, one quote set each, like a
+    recorded session of SUBSCRIPTIONS"""
+    rng = np.random.RandomState(seed)
+    mids = [1.18, 1.25, 0.75, 0.85, 110.0, 9.5]
+    messages = []
+    for i in range(count):
+        quote_set = i % len(SUBSCRIPTIONS)
+        mids[quote_set] += rng.choice([-0.00001, 0, 0.00001])
+        fields = ['35=i', '34=%i' % (i + 2), '49=XC461',
+                  '52=20210328-21:00:%02i.%03i' % (i // 1000 % 60, i % 1000), '56=Q000',
+                  '296=1', '302=%i' % quote_set, '295=%i' % entries]
+        for entry in rng.choice(20, entries, replace=False):
+            spread = 0.00001 * (entry + 1)
+            fields += ['299=%i' % entry, '106=%i' % (entry % 3),
+                       '134=%i' % (1000000 * (entry // 4 + 1)),
+                       '135=%i' % (1000000 * (entry // 4 + 1)),
+                       '188=%.5f' % (mids[quote_set] - spread),
+                       '190=%.5f' % (mids[quote_set] + spread)]
+        body = '\x01'.join(fields) + '\x01'
+        raw = '8=FIX.4.4\x019=%i\x01' % len(body) + body
+        raw += '10=%03i\x01' % (sum(raw.encode()) % 256)
+        messages.append(fix.Message(raw, DATA_DICTIONARY))
+    return messages
+
+
+def create_file_writer(inbound_queue, shutdown_event, file_path, results):
+    TimedFileWriter(inbound_queue, shutdown_event, file_path=file_path,
+                    layout=app.filewriter.RAW, flush_threads=1, results=results).run()
+
+
+def create_book_builder(inbound_queue, outbound_queue, shutdown_event, consumer_shutdown_event):
+    app.bookbuilder.BookBuilder(inbound_queue, outbound_queue, shutdown_event,
+                                consumer_shutdown_event).run()
+
+
+def make_feed(queue, shutdown_event):
+    feed = app.pricefeed.PriceFeed(queue, shutdown_event, SUBSCRIPTIONS)
+    for i, symbol in enumerate(SUBSCRIPTIONS):
+        feed.active_subscriptions[str(i)] = app.pricefeed.drop_slash(symbol)
+    return feed
+
+
+def replay(feed, messages, rate):
+    """Hand messages to the feed at rate per second, returns the time each
+    was handed over"""
+    sent = []
+    interval = 1e9 / rate
+    start = time.perf_counter_ns()
+    for i, message in enumerate(messages):
+        due = start + i * interval
+        while time.perf_counter_ns() < due:
+            pass
+        sent.append(time.perf_counter_ns())
+        feed.on_mass_quote(message, None)
+    return sent
+
+
+def bench_processes(directory, messages, rate):
+    """PriceFeed here, BookBuilder and FileWriter in their own processes"""
+    shutdown_event = Event()
+    consumer_shutdown_event = Event()
+    fix_outbound_queue = Queue()
+    bb_outbound_queue = Queue()
+    results = Queue()
+    consumer = Process(target=create_file_writer,
+                       args=(bb_outbound_queue, consumer_shutdown_event,
+                             os.path.join(directory, 'processes'), results))
+    producer_consumer = Process(target=create_book_builder,
+                                args=(fix_outbound_queue, bb_outbound_queue,
+                                      shutdown_event, consumer_shutdown_event))
+    consumer.start()
+    producer_consumer.start()
+    time.sleep(1)
+    sent = replay(make_feed(fix_outbound_queue, shutdown_event), messages, rate)
+    shutdown_event.set()
+    arrivals = results.get()
+    producer_consumer.join()
+    consumer.join()
+    return ('processes', rate, sent, arrivals)
+
+
+def bench_single_process(directory, messages, rate):
+    """Everything in this process, books written from a thread"""
+    shutdown_event = Event()
+    results = Queue()
+    single_process = app.pipeline.SingleProcessPipeline(shutdown_event)
+    single_process.file_writer = TimedFileWriter(
+        single_process.books, single_process.consumer_shutdown_event,
+        file_path=os.path.join(directory, 'single_process'), layout=app.filewriter.RAW,
+        flush_threads=1, results=results)
+    single_process.writer = app.pipeline.Thread(target=single_process.file_writer.run)
+    single_process.start()
+    sent = replay(make_feed(single_process, shutdown_event), messages, rate)
+    shutdown_event.set()
+    single_process.shutdown()
+    return ('single_process', rate, sent, results.get())
+
+
+def print_results(mode, rate, sent, arrivals):
+    latency = (np.array(arrivals) - np.array(sent)) / 1000
+    print(','.join([
+        mode,
+        str(rate),
+        str(len(sent)),
+        '%.1f' % np.percentile(latency, 50),
+        '%.1f' % np.percentile(latency, 99),
+        '%.1f' % latency.max()
+        ]))
+
+
+def main():
+    """Usage: bench_pipeline.py [messages.log], replays the MassQuotes of a
+    quickfix messages log, or a generated session if none is given"""
+    if len(sys.argv) > 1:
+        messages = recorded_messages(sys.argv[1])
+    else:
+        messages = make_messages(5000)
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    print('mode,rate,messages,p50_us,p99_us,max_us')
+    with tempfile.TemporaryDirectory(dir=directory) as temporary_directory:
+        for rate in (1000, 5000):
+            print_results(*bench_processes(temporary_directory, messages, rate))
+            print_results(*bench_single_process(temporary_directory, messages, rate))
+
+
+if __name__ == '__main__':
+    main()
+
+# results, synthesised session, single cpu
+# mode,rate,messages,p50_us,p99_us,max_us
+# processes,1000,5000,849.0,7829.5,25057.3
+# single_process,1000,5000,376.8,1136.8,5121.0
+# processes,5000,5000,4082.2,12357.9,37508.3
+# single_process,5000,5000,363.1,3651.7,6374.7
@@ -26,12 +26,51 @@ def bench_process_quote_set(iterations):
     return ('process_quote_set', iterations, duration)
 
 
+def bench_decode_mass_quote(iterations):
+    raw = MSG.toString()
+    start_time = datetime.datetime.now()
+    for _ in range(iterations):
+        app.pricefeed.decode_mass_quote(raw)
+    end_time = datetime.datetime.now()
+    duration = (end_time - start_time).total_seconds()
+    return ('decode_mass_quote', iterations, duration)
+
+
+def strptime_sending_time_to_timestamp(sending_time):
+    """sending_time_to_timestamp as it was, for comparison"""
+    strp_format = '%Y%m%d-%H:%M:%S.%f' if len(sending_time) > 17 else '%Y%m%d-%H:%M:%S'
+    return int(1e6*datetime.datetime.strptime(sending_time, strp_format)
+               .replace(tzinfo=datetime.timezone.utc)
+               .timestamp())
+
+
+def make_sending_times(iterations, digits):
+    """SendingTimes a millisecond apart, as a busy session sends them"""
+    start = datetime.datetime(2017, 11, 6, 14, 57, 8)
+    times = []
+    for i in range(iterations):
+        stamp = start + datetime.timedelta(milliseconds=i)
+        fraction = '%06i' % stamp.microsecond + '123'
+        times.append(stamp.strftime('%Y%m%d-%H:%M:%S.') + fraction[:digits])
+    return times
+
+
+def bench_sending_time(name, parse, iterations, digits):
+    times = make_sending_times(iterations, digits)
+    start_time = datetime.datetime.now()
+    for sending_time in times:
+        parse(sending_time)
+    end_time = datetime.datetime.now()
+    duration = (end_time - start_time).total_seconds()
+    return ('%s_%i' % (name, digits), iterations, duration)
+
+
 def print_results(func, iterations, duration):
     print(','.join([
         func,
         str(iterations),
         str(duration),
-        '%f' % (duration / iterations)
+        '%.9f' % (duration / iterations)
         ]))
 
 
@@ -39,6 +78,15 @@ def main():
     print('function,iterations,total,iteration')
     res = bench_process_quote_set(100000)
     print_results(*res)
+    res = bench_decode_mass_quote(100000)
+    print_results(*res)
+    for digits in (3, 6):
+        res = bench_sending_time('strptime', strptime_sending_time_to_timestamp, 100000, digits)
+        print_results(*res)
+    for digits in (3, 6, 9):
+        res = bench_sending_time('sending_time_to_timestamp',
+                                 app.pricefeed.sending_time_to_timestamp, 100000, digits)
+        print_results(*res)
 
 
 if __name__ == '__main__':
@@ -46,3 +94,11 @@ if __name__ == '__main__':
 
 # function,iterations,total,iteration
 # process_quote_set,100000,22.834905,0.000228
+
+# SendingTime parsing, single core
+# function,iterations,total,iteration
+# strptime_3,100000,1.255088,0.000012551
+# strptime_6,100000,1.010513,0.000010105
+# sending_time_to_timestamp_3,100000,0.10697,0.000001070
+# sending_time_to_timestamp_6,100000,0.100886,0.000001009
+# sending_time_to_timestamp_9,100000,0.117589,0.000001176
@@ -0,0 +1,71 @@
+import datetime
+import os
+import sys
+
+from multiprocessing import Event, Process, Queue
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app.ringbuffer
+
+
+# 20 level quote set as produced by PriceFeed
+ITEM = (1509980228528000, 'EURDKK', [
+    [str(i), 100000.0 * (i + 1), 100000.0 * (i + 1), 1.80699 - i * 0.00001, 1.80709 + i * 0.00001, '1', '1']
+    for i in range(20)], False)
+
+
+def consume(queue, iterations, done):
+    for _ in range(iterations):
+        queue.get()
+    done.set()
+
+
+def bench_transport(name, queue, iterations):
+    """Time iterations items from this process to a consumer process"""
+    done = Event()
+    consumer = Process(target=consume, args=(queue, iterations, done))
+    consumer.start()
+    start_time = datetime.datetime.now()
+    for _ in range(iterations):
+        queue.put(ITEM)
+    done.wait()
+    end_time = datetime.datetime.now()
+    consumer.join()
+    duration = (end_time - start_time).total_seconds()
+    return (name, iterations, duration)
+
+
+def bench_queue(iterations):
+    queue = Queue()
+    res = bench_transport('queue', queue, iterations)
+    queue.close()
+    return res
+
+
+def bench_ring_buffer(iterations):
+    ring = app.ringbuffer.RingBuffer(slots=1024)
+    res = bench_transport('ring_buffer', ring, iterations)
+    ring.close()
+    ring.unlink()
+    return res
+
+
+def print_results(func, iterations, duration):
+    print(','.join([
+        func,
+        str(iterations),
+        str(duration),
+        '%f' % (duration / iterations)
+        ]))
+
+
+def main():
+    print('function,iterations,total,iteration')
+    res = bench_queue(100000)
+    print_results(*res)
+    res = bench_ring_buffer(100000)
+    print_results(*res)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,49 +3,130 @@
 import argparse
 import logging
 import signal
+import threading
 
 from multiprocessing import Event, Process, Queue
 
 import quickfix as fix
 
-from app import bookbuilder, filewriter, pricefeed
+from app import bookbuilder, capture, filewriter, latency, messagelog, pipeline, pricefeed, \
+    router
 
 
-def create_file_writer(inbound_queue, shutdown_event, cache_size, block_size, file_path):
-    """Wrapper for turning bookbuilder into a multiprocessing.Process"""
+def create_file_writer(inbound_queue, shutdown_event, cache_size, block_size, file_path,
+                       max_open_files, layout, flush_threads, options, chunk_cache_size,
+                       name='filewriter', tracer=None):
+    """Wrapper for turning filewriter into a multiprocessing.Process"""
     file_writer = filewriter.FileWriter(inbound_queue,
                                         shutdown_event,
                                         cache_size=cache_size,
                                         block_size=block_size,
-                                        file_path=file_path
+                                        file_path=file_path,
+                                        max_open_files=max_open_files,
+                                        layout=layout,
+                                        flush_threads=flush_threads,
+                                        options=options,
+                                        chunk_cache_size=chunk_cache_size,
+                                        name=name,
+                                        tracer=tracer
                                         )
     file_writer.run()
 
 
 def create_book_builder(inbound_queue, outbound_queue, shutdown_event,
-                        consumer_shutdown_event, max_levels):
+                        consumer_shutdown_event, max_levels, incremental_sort, batch, max_batch,
+                        suppress_unchanged, ignore_level_times, tracer=None):
     """Wrapper for turning bookbuilder into a multiprocessing.Process"""
     book_builder = bookbuilder.BookBuilder(inbound_queue,
                                            outbound_queue,
                                            shutdown_event,
                                            consumer_shutdown_event,
-                                           max_levels)
+                                           max_levels,
+                                           incremental_sort=incremental_sort,
+                                           batch=batch,
+                                           max_batch=max_batch,
+                                           suppress_unchanged=suppress_unchanged,
+                                           ignore_level_times=ignore_level_times,
+                                           tracer=tracer)
     book_builder.run()
 
 
-def create_fix_client(outbound_queue, shutdown_event, subscriptions, cfg):
+# pylint: disable=R0913
+def create_fix_client(outbound_queue, shutdown_event, subscriptions, cfg, raw_decoder,
+                      tracer=None, capture_file=None, fix_log=messagelog.FILE,
+                      fix_store=messagelog.FILE, message_log_file=None,
+                      message_log_buffer=65536):
     """Wrapper for turning pricefeed into a multiprocessing.Process"""
+    if capture_file is not None:
+        outbound_queue = capture.CaptureQueue(outbound_queue, capture_file)
     try:
         settings = fix.SessionSettings(cfg)
-        store_factory = fix.FileStoreFactory(settings)
-        log_factory = fix.FileLogFactory(settings)
-        feed = pricefeed.PriceFeed(outbound_queue, shutdown_event, subscriptions)
-        initiator = fix.SocketInitiator(feed, store_factory, settings, log_factory)
+        store_factory = messagelog.create_store_factory(fix_store, settings)
+        log_factory = messagelog.create_log_factory(fix_log, settings)
+        message_log = None
+        if fix_log == messagelog.ASYNC:
+            message_log = messagelog.AsyncMessageLog(message_log_file, message_log_buffer)
+        feed = pricefeed.PriceFeed(outbound_queue, shutdown_event, subscriptions,
+                                   raw_decoder=raw_decoder, tracer=tracer,
+                                   message_log=message_log)
+        if log_factory is None:
+            initiator = fix.SocketInitiator(feed, store_factory, settings)
+        else:
+            initiator = fix.SocketInitiator(feed, store_factory, settings, log_factory)
         feed.set_fix_adapter(initiator)
         feed.run()
     except fix.ConfigError as exception:
         shutdown_event.set()
         logging.error(exception)
+    finally:
+        if capture_file is not None:
+            outbound_queue.close()
+
+
+def create_tracer(args, name):
+    """Latency tracer of a stage, if tracing"""
+    if not args.trace_latency:
+        return None
+    return latency.LatencyTracer(name, args.trace_interval)
+
+
+def run_single_process(args, options, subscriptions):
+    """Build books in the FIX callbacks and write them from a thread, all in
+    this process"""
+    shutdown_event = threading.Event()
+    single_process = pipeline.SingleProcessPipeline(
+        shutdown_event,
+        builder_options={
+            'max_levels': args.max_levels,
+            'incremental_sort': not args.full_sort,
+            'suppress_unchanged': args.suppress_unchanged,
+            'ignore_level_times': args.ignore_level_times,
+            'tracer': create_tracer(args, 'bookbuilder'),
+        },
+        writer_options={
+            'cache_size': args.cache_size,
+            'block_size': args.block_size,
+            'file_path': args.filepath,
+            'max_open_files': args.max_open_files,
+            'layout': args.layout,
+            'flush_threads': args.flush_threads,
+            'options': options,
+            'chunk_cache_size': args.chunk_cache_size,
+            'tracer': create_tracer(args, 'filewriter'),
+        })
+
+    def on_sigint(signum, frame):
+        # pylint: disable=W0613
+        logging.warning('CTRL+C received, shutting down')
+        shutdown_event.set()
+
+    signal.signal(signal.SIGINT, on_sigint)
+    single_process.start()
+    create_fix_client(single_process, shutdown_event, subscriptions, args.config,
+                      args.raw_decoder, create_tracer(args, 'pricefeed'), args.capture,
+                      args.fix_log, args.fix_store, args.message_log_file,
+                      args.message_log_buffer)
+    single_process.shutdown()
 
 
 def main():
@@ -60,13 +141,96 @@ def main():
                         help='path to write data to')
     parser.add_argument('--max-levels', type=int,
                         help='maximum book depth to write to (default: 10)', default=10)
+    parser.add_argument('--bookbuilder-workers', type=int,
+                        help='bookbuilder processes, each building the books of its own ' +
+                        'share of the symbols (default: 1)', default=1)
+    parser.add_argument('--full-sort', action='store_true', default=False,
+                        help='sort every book instead of keeping quotes sorted')
+    parser.add_argument('--batch', choices=bookbuilder.BATCH_MODES, default=bookbuilder.OFF,
+                        help='bookbuilder drains the queue in batches, publishing every ' +
+                        'book (lossless) or the last book of each symbol (conflate) ' +
+                        '(default: off)')
+    parser.add_argument('--max-batch', type=int,
+                        help='bookbuilder maximum items per batch (default: 1024)', default=1024)
+    parser.add_argument('--suppress-unchanged', action='store_true', default=False,
+                        help='skip books whose levels match the last published book')
+    parser.add_argument('--ignore-level-times', action='store_true', default=False,
+                        help='with --suppress-unchanged, a change of level time alone ' +
+                        'does not count as a change')
+    parser.add_argument('--filewriter-workers', type=int,
+                        help='filewriter processes, each writing the files of its own ' +
+                        'share of the symbols (default: 1)', default=1)
     parser.add_argument('--cache-size', type=int,
                         help='filewriter cache size (default: 1024)', default=1024)
     parser.add_argument('--block-size', type=int,
                         help='filewriter on-disk block size (default: 32768)', default=32768)
+    parser.add_argument('--max-open-files', type=int,
+                        help='filewriter open file handle limit (default: 64)', default=64)
+    parser.add_argument('--layout', choices=filewriter.LAYOUTS, default=filewriter.COLUMNS,
+                        help='filewriter layout, an HDF5 dataset per column, one HDF5 ' +
+                        'compound dataset of rows or a raw memory-mapped file (default: columns)')
+    parser.add_argument('--flush-threads', type=int,
+                        help='filewriter background flush threads, 0 flushes inline ' +
+                        '(default: 1)', default=1)
+    parser.add_argument('--compression', choices=filewriter.COMPRESSIONS, default='none',
+                        help='filewriter compression filter for new files (default: none)')
+    parser.add_argument('--compression-level', type=int,
+                        help='filewriter gzip compression level, 0-9')
+    parser.add_argument('--shuffle', action='store_true', default=False,
+                        help='filewriter byte shuffle filter, helps compression')
+    parser.add_argument('--chunk-rows', type=int,
+                        help='filewriter rows per HDF5 chunk (default: chosen by h5py)')
+    parser.add_argument('--chunk-cache-size', type=int,
+                        help='filewriter HDF5 chunk cache bytes per open file ' +
+                        '(default: HDF5 default)')
+    parser.add_argument('--raw-decoder', action='store_true', default=False,
+                        help='decode MassQuote messages from the raw message string')
+    parser.add_argument('--transport', choices=['queue', 'ring'], default='queue',
+                        help='pricefeed => bookbuilder transport (default: queue)')
+    parser.add_argument('--ring-slots', type=int,
+                        help='shared memory ring buffer slots (default: 16384)', default=16384)
+    parser.add_argument('--single-process', action='store_true', default=False,
+                        help='build books in the pricefeed callbacks and write them from a ' +
+                        'thread, no bookbuilder or filewriter processes')
+    parser.add_argument('--trace-latency', action='store_true', default=False,
+                        help='log per stage, per symbol latency histograms, from SendingTime ' +
+                        'to the book being flushed')
+    parser.add_argument('--trace-interval', type=int,
+                        help='seconds between latency summaries (default: 60)', default=60)
+    parser.add_argument('--capture', type=str,
+                        help='record the decoded quotes to this capture file, see replay.py')
+    parser.add_argument('--fix-log', choices=messagelog.LOGS, default=messagelog.FILE,
+                        help='quickfix message log, a text file written on the FIX thread, ' +
+                        'the screen, none, or async: a binary log of the messages written ' +
+                        'from a background thread to --message-log-file (default: file)')
+    parser.add_argument('--fix-store', choices=messagelog.STORES, default=messagelog.FILE,
+                        help='quickfix message store (default: file)')
+    parser.add_argument('--message-log-file', type=str, default='logs/messages.bin',
+                        help='--fix-log async file (default: logs/messages.bin)')
+    parser.add_argument('--message-log-buffer', type=int,
+                        help='--fix-log async messages buffered before dropping them ' +
+                        '(default: 65536)', default=65536)
     parser.add_argument('--debug', action='store_true', default=False)
     args = parser.parse_args()
 
+    if args.bookbuilder_workers < 1:
+        parser.error('--bookbuilder-workers must be at least 1')
+    if args.filewriter_workers < 1:
+        parser.error('--filewriter-workers must be at least 1')
+    if args.single_process and (args.bookbuilder_workers > 1 or args.filewriter_workers > 1 or
+                                args.transport != 'queue' or args.batch != bookbuilder.OFF):
+        parser.error('--single-process has no workers, transport or batches to configure')
+    if args.trace_latency and (args.transport != 'queue' or args.batch == bookbuilder.CONFLATE):
+        parser.error('--trace-latency needs the queue transport and no conflation')
+    if args.message_log_buffer < 1:
+        parser.error('--message-log-buffer must be at least 1')
+
+    try:
+        options = filewriter.dataset_options(args.compression, args.compression_level,
+                                             args.shuffle, args.chunk_rows)
+    except ValueError as exception:
+        parser.error(str(exception))
+
     loglevel = logging.DEBUG if args.debug else logging.INFO
 
     # setup logging
@@ -82,36 +246,80 @@ def main():
     for line in subscriptions_file.readlines():
         subscriptions.append(line.strip())
     subscriptions_file.close()
+    symbols = [pricefeed.drop_slash(symbol) for symbol in subscriptions]
+
+    if args.single_process:
+        run_single_process(args, options, subscriptions)
+        return
 
     # prevent child processes from receiving CTRL+C
     original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
 
     # create SHUTDOWN event
     shutdown_event = Event()
-    consumer_shutdown_event = Event()
-    # create queue for message flow from fix broker => book builder
-    fix_outbound_queue = Queue()
-    # create queue for message flow from book builder => file writer
-    bb_outbound_queue = Queue()
+    # one per book builder, the file writer stops once they are all set
+    consumer_shutdown_events = [Event() for _ in range(args.bookbuilder_workers)]
+    # create queues for message flow from fix broker => book builders
+    if args.transport == 'ring':
+        # multiprocessing.shared_memory needs Python 3.8, only import it if used
+        from app import ringbuffer  # pylint: disable=C0415
+        bb_inbound_queues = [ringbuffer.RingBuffer(slots=args.ring_slots)
+                             for _ in range(args.bookbuilder_workers)]
+    else:
+        bb_inbound_queues = [Queue() for _ in range(args.bookbuilder_workers)]
+    if args.bookbuilder_workers == 1:
+        fix_outbound_queue = bb_inbound_queues[0]
+        consumer_shutdown_event = consumer_shutdown_events[0]
+    else:
+        # each symbol always goes to the same book builder
+        fix_outbound_queue = router.SymbolRouter(bb_inbound_queues, symbols)
+        consumer_shutdown_event = router.AllEvents(consumer_shutdown_events)
+    # create queues for message flow from book builders => file writers
+    fw_inbound_queues = [Queue() for _ in range(args.filewriter_workers)]
+    if args.filewriter_workers == 1:
+        bb_outbound_queue = fw_inbound_queues[0]
+        fw_names = ['filewriter']
+    else:
+        # each symbol always goes to the same file writer
+        bb_outbound_queue = router.BookRouter(fw_inbound_queues, symbols)
+        fw_names = ['filewriter-%i' % i for i in range(args.filewriter_workers)]
     # create our processes
-    consumer = Process(name='filewriter',
-                       target=create_file_writer,
-                       args=(bb_outbound_queue, consumer_shutdown_event,
-                             args.cache_size,
-                             args.block_size,
-                             args.filepath))
-    producer_consumer = Process(name='bookbuilder',
-                                target=create_book_builder,
-                                args=(fix_outbound_queue, bb_outbound_queue,
-                                      shutdown_event, consumer_shutdown_event,
-                                      args.max_levels))
+    consumers = [Process(name=name,
+                         target=create_file_writer,
+                         args=(fw_inbound_queue, consumer_shutdown_event,
+                               args.cache_size,
+                               args.block_size,
+                               args.filepath,
+                               args.max_open_files,
+                               args.layout,
+                               args.flush_threads,
+                               options,
+                               args.chunk_cache_size,
+                               name,
+                               create_tracer(args, name)))
+                 for name, fw_inbound_queue in zip(fw_names, fw_inbound_queues)]
+    producer_consumers = [Process(name='bookbuilder' if args.bookbuilder_workers == 1
+                                  else 'bookbuilder-%i' % i,
+                                  target=create_book_builder,
+                                  args=(bb_inbound_queue, bb_outbound_queue,
+                                        shutdown_event, consumer_shutdown_events[i],
+                                        args.max_levels, not args.full_sort,
+                                        args.batch, args.max_batch,
+                                        args.suppress_unchanged, args.ignore_level_times,
+                                        create_tracer(args, 'bookbuilder-%i' % i)))
+                          for i, bb_inbound_queue in enumerate(bb_inbound_queues)]
     producer = Process(name='pricefeed',
                        target=create_fix_client,
                        args=(fix_outbound_queue, shutdown_event,
-                             subscriptions, args.config))
+                             subscriptions, args.config, args.raw_decoder,
+                             create_tracer(args, 'pricefeed'), args.capture,
+                             args.fix_log, args.fix_store, args.message_log_file,
+                             args.message_log_buffer))
     # spin up
-    consumer.start()
-    producer_consumer.start()
+    for consumer in consumers:
+        consumer.start()
+    for producer_consumer in producer_consumers:
+        producer_consumer.start()
     producer.start()
 
     # re-set sigint
@@ -121,12 +329,19 @@ def main():
         try:
             # wait for them to finish
             producer.join()
-            producer_consumer.join()
-            consumer.join()
+            for producer_consumer in producer_consumers:
+                producer_consumer.join()
+            for consumer in consumers:
+                consumer.join()
         except KeyboardInterrupt:
             logging.warning('CTRL+C received, shutting down')
             shutdown_event.set()
 
+    if args.transport == 'ring':
+        for ring in bb_inbound_queues:
+            ring.close()
+            ring.unlink()
+
 
 if __name__ == '__main__':
     main()
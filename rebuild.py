@@ -0,0 +1,92 @@
+"""Rebuild book files from the quickfix message logs of past sessions"""
+
+import argparse
+import logging
+
+from app import filewriter, rebuild
+
+
+def main():
+    """Rebuild and report"""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('logs', type=str, nargs='+',
+                        help='quickfix message logs, or directories of *.messages.current.log')
+    parser.add_argument('filepath', type=str,
+                        help='path to write data to')
+    parser.add_argument('--processes', type=int,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--work-dir', type=str,
+                        help='where to keep the decoded quotes while building ' +
+                        '(default: system temporary directory)')
+    parser.add_argument('--spec', type=str, default='spec/pxm44.xml',
+                        help='FIX data dictionary (default: spec/pxm44.xml)')
+    parser.add_argument('--max-levels', type=int,
+                        help='maximum book depth to write to (default: 10)', default=10)
+    parser.add_argument('--full-sort', action='store_true', default=False,
+                        help='sort every book instead of keeping quotes sorted')
+    parser.add_argument('--suppress-unchanged', action='store_true', default=False,
+                        help='skip books whose levels match the last published book')
+    parser.add_argument('--ignore-level-times', action='store_true', default=False,
+                        help='with --suppress-unchanged, a change of level time alone ' +
+                        'does not count as a change')
+    parser.add_argument('--cache-size', type=int,
+                        help='filewriter cache size (default: 1024)', default=1024)
+    parser.add_argument('--block-size', type=int,
+                        help='filewriter on-disk block size (default: 32768)', default=32768)
+    parser.add_argument('--layout', choices=filewriter.LAYOUTS, default=filewriter.COLUMNS,
+                        help='filewriter layout (default: columns)')
+    parser.add_argument('--compression', choices=filewriter.COMPRESSIONS, default='none',
+                        help='filewriter compression filter for new files (default: none)')
+    parser.add_argument('--compression-level', type=int,
+                        help='filewriter gzip compression level, 0-9')
+    parser.add_argument('--shuffle', action='store_true', default=False,
+                        help='filewriter byte shuffle filter, helps compression')
+    parser.add_argument('--chunk-rows', type=int,
+                        help='filewriter rows per HDF5 chunk (default: chosen by h5py)')
+    parser.add_argument('--debug', action='store_true', default=False)
+    args = parser.parse_args()
+
+    if args.processes is not None and args.processes < 1:
+        parser.error('--processes must be at least 1')
+    try:
+        options = filewriter.dataset_options(args.compression, args.compression_level,
+                                             args.shuffle, args.chunk_rows)
+    except ValueError as exception:
+        parser.error(str(exception))
+
+    logging.basicConfig(handlers=[logging.StreamHandler()],
+                        level=logging.DEBUG if args.debug else logging.INFO,
+                        format=('%(asctime)s.%(msecs)03d %(levelname)s %(filename)s ' +
+                                '%(funcName)s %(message)s'),
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    if not args.debug:
+        # one line per symbol from rebuild, not the pipeline's own chatter
+        for name in ('app.pricefeed', 'app.bookbuilder', 'app.filewriter', 'app.rawfile',
+                     'app.capture'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    results = rebuild.rebuild(
+        args.logs,
+        builder_options={
+            'max_levels': args.max_levels,
+            'incremental_sort': not args.full_sort,
+            'suppress_unchanged': args.suppress_unchanged,
+            'ignore_level_times': args.ignore_level_times,
+        },
+        writer_options={
+            'cache_size': args.cache_size,
+            'block_size': args.block_size,
+            'file_path': args.filepath,
+            'layout': args.layout,
+            'options': options,
+        },
+        processes=args.processes,
+        work_dir=args.work_dir,
+        spec=args.spec)
+    logging.info('Rebuilt %i books of %i symbols', sum(books for _, books in results.values()),
+                 len(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Replay a capture recorded by main.py --capture through the book builder
+and file writer, reporting throughput, latency and checksums of the books"""
+
+import argparse
+import logging
+
+import numpy as np
+
+from app import capture, filewriter
+
+
+def main():
+    """Replay and report"""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('capture', type=str,
+                        help='capture file written by main.py --capture')
+    parser.add_argument('filepath', type=str,
+                        help='path to write data to')
+    parser.add_argument('--speed', type=float,
+                        help='replay at this multiple of the original pace, 1 for real time ' +
+                        '(default: as fast as possible)')
+    parser.add_argument('--max-levels', type=int,
+                        help='maximum book depth to write to (default: 10)', default=10)
+    parser.add_argument('--full-sort', action='store_true', default=False,
+                        help='sort every book instead of keeping quotes sorted')
+    parser.add_argument('--suppress-unchanged', action='store_true', default=False,
+                        help='skip books whose levels match the last published book')
+    parser.add_argument('--ignore-level-times', action='store_true', default=False,
+                        help='with --suppress-unchanged, a change of level time alone ' +
+                        'does not count as a change')
+    parser.add_argument('--cache-size', type=int,
+                        help='filewriter cache size (default: 1024)', default=1024)
+    parser.add_argument('--block-size', type=int,
+                        help='filewriter on-disk block size (default: 32768)', default=32768)
+    parser.add_argument('--layout', choices=filewriter.LAYOUTS, default=filewriter.COLUMNS,
+                        help='filewriter layout (default: columns)')
+    parser.add_argument('--flush-threads', type=int,
+                        help='filewriter background flush threads, 0 flushes inline ' +
+                        '(default: 0)', default=0)
+    parser.add_argument('--symbols', action='store_true', default=False,
+                        help='report the books and checksum of each symbol')
+    parser.add_argument('--debug', action='store_true', default=False)
+    args = parser.parse_args()
+
+    if args.speed is not None and args.speed <= 0:
+        parser.error('--speed must be positive')
+
+    logging.basicConfig(handlers=[logging.StreamHandler()],
+                        level=logging.DEBUG if args.debug else logging.WARNING,
+                        format=('%(asctime)s.%(msecs)03d %(levelname)s %(filename)s ' +
+                                '%(funcName)s %(message)s'),
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    items, duration, latencies, checksums = capture.replay(
+        args.capture,
+        builder_options={
+            'max_levels': args.max_levels,
+            'incremental_sort': not args.full_sort,
+            'suppress_unchanged': args.suppress_unchanged,
+            'ignore_level_times': args.ignore_level_times,
+        },
+        writer_options={
+            'cache_size': args.cache_size,
+            'block_size': args.block_size,
+            'file_path': args.filepath,
+            'layout': args.layout,
+            'flush_threads': args.flush_threads,
+        },
+        speed=args.speed)
+
+    if not items:
+        print('%s holds no items' % args.capture)
+        return
+    micros = latencies / 1000
+    print('items,books,seconds,items_per_s,p50_us,p99_us,p999_us,max_us,checksum')
+    print(','.join([
+        str(items),
+        str(sum(checksums.books.values())),
+        '%.3f' % duration,
+        '%.0f' % (items / duration),
+        '%.1f' % np.percentile(micros, 50),
+        '%.1f' % np.percentile(micros, 99),
+        '%.1f' % np.percentile(micros, 99.9),
+        '%.1f' % micros.max(),
+        '%08x' % checksums.total(),
+        ]))
+    if args.symbols:
+        print('symbol,books,checksum')
+        for symbol in sorted(checksums.checksums):
+            print('%s,%i,%08x' % (symbol, checksums.books.get(symbol, 0),
+                                  checksums.checksums[symbol]))
+
+
+if __name__ == '__main__':
+    main()
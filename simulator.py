@@ -0,0 +1,91 @@
+"""PrimeXM-style FIX acceptor streaming MassQuotes, for load testing main.py"""
+
+import argparse
+import logging
+import signal
+import threading
+
+import quickfix as fix
+
+from app import simulator
+
+
+def main():
+    """Accept a price feed session and stream quotes to it"""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config', type=str,
+                        help='quickfix acceptor configuration file, e.g. config/simulator.cfg')
+    parser.add_argument('--symbols', type=int,
+                        help='symbols quoted, others are rejected (default: 6)', default=6)
+    parser.add_argument('--write-subscriptions', type=argparse.FileType('w'),
+                        help='write the quoted symbols to a subscriptions file for main.py')
+    parser.add_argument('--quote-sets', type=int,
+                        help='quote sets (symbols) per MassQuote (default: 1)', default=1)
+    parser.add_argument('--entries', type=int,
+                        help='quote entries per quote set (default: 5)', default=5)
+    parser.add_argument('--providers', type=int,
+                        help='liquidity providers quoting the entries (default: 3)', default=3)
+    parser.add_argument('--rate', type=float,
+                        help='MassQuotes per second (default: 1000)', default=1000)
+    parser.add_argument('--ack-every', type=int,
+                        help='ask for a MassQuoteAcknowledgement every this many ' +
+                        'MassQuotes, 0 never (default: 100)', default=100)
+    parser.add_argument('--duration', type=float,
+                        help='seconds to stream for once subscribed (default: until CTRL+C)')
+    parser.add_argument('--seed', type=int, help='random seed of the quotes')
+    parser.add_argument('--log', action='store_true', default=False,
+                        help='log messages to FileLogPath, slows the simulator down')
+    parser.add_argument('--debug', action='store_true', default=False)
+    args = parser.parse_args()
+
+    if min(args.quote_sets, args.entries, args.providers) < 1 or args.rate <= 0:
+        parser.error('--quote-sets, --entries, --providers and --rate must be positive')
+    try:
+        symbols = simulator.make_symbols(args.symbols)
+    except ValueError as exception:
+        parser.error(str(exception))
+
+    logging.basicConfig(handlers=[logging.StreamHandler()],
+                        level=logging.DEBUG if args.debug else logging.INFO,
+                        format=('%(asctime)s.%(msecs)03d %(levelname)s %(filename)s ' +
+                                '%(funcName)s %(message)s'),
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    if args.write_subscriptions:
+        for symbol in symbols:
+            args.write_subscriptions.write(symbol + '\n')
+        args.write_subscriptions.close()
+
+    shutdown_event = threading.Event()
+
+    def on_sigint(signum, frame):
+        # pylint: disable=W0613
+        logging.warning('CTRL+C received, shutting down')
+        shutdown_event.set()
+
+    signal.signal(signal.SIGINT, on_sigint)
+    try:
+        settings = fix.SessionSettings(args.config)
+        store_factory = fix.MemoryStoreFactory()
+        feed = simulator.Simulator(shutdown_event, symbols,
+                                   quote_sets=args.quote_sets,
+                                   entries=args.entries,
+                                   providers=args.providers,
+                                   rate=args.rate,
+                                   ack_every=args.ack_every,
+                                   duration=args.duration,
+                                   seed=args.seed)
+        if args.log:
+            acceptor = fix.SocketAcceptor(feed, store_factory, settings,
+                                          fix.FileLogFactory(settings))
+        else:
+            acceptor = fix.SocketAcceptor(feed, store_factory, settings)
+        feed.set_fix_adapter(acceptor)
+        feed.run()
+    except fix.ConfigError as exception:
+        logging.error(exception)
+
+
+if __name__ == '__main__':
+    main()
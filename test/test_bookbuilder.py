@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, call, patch
 
 from queue import Empty
 
@@ -19,6 +19,11 @@ class TestBookBuilderClass(unittest.TestCase):
                                           self.shutdown_event, self.shutdown_consumer,
                                           max_levels=4)
 
+    def published_books(self):
+        """Books put on the outbound queue, without provider names"""
+        items = [args[0][0] for args in self.outbound_queue.put.call_args_list]
+        return [item for item in items if item[1] != bb.PROVIDERS]
+
     def test_run(self):
         self.shutdown_event.is_set = Mock(side_effect=[False, True])
         self.inbound_queue.get = Mock(side_effect=["item"])
@@ -50,28 +55,184 @@ class TestBookBuilderClass(unittest.TestCase):
             self.inbound_queue.join_thread.assert_called_once()
 
     def test_process_item(self):
-        with patch('app.bookbuilder.update_quotes', side_effect=[dict()]) as update_quotes:
+        with patch('app.bookbuilder.update_quotes', side_effect=lambda t, q, n: q) as update_quotes:
             with patch('app.bookbuilder.build_book') as build_book:
                 self.bookbuilder.process_item([1, "symbol", [3, 4, 5], False])
-                update_quotes.assert_called_with(1, {}, [3, 4, 5])
+                update_quotes.assert_called_with(1, ANY, [3, 4, 5])
+                self.assertEqual(0, len(update_quotes.call_args[0][1]))
                 build_book.assert_called_once()
 
+    def test_process_item_traced(self):
+        tracer = Mock()
+        self.bookbuilder.tracer = tracer
+        with patch('app.bookbuilder.monotonic_ns', side_effect=[30, 40]) as _:
+            book = self.bookbuilder.process_item(
+                (1, 'EURUSD', [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False, (10, 20)))
+        time, symbol, published, stamps = self.outbound_queue.put.call_args[0][0]
+        self.assertEqual((1, 'EURUSD', (10, 20, 30, 40)), (time, symbol, stamps))
+        self.assertEqual(book, published)
+        self.assertEqual([call('inbound', 'EURUSD', 20, 30), call('build', 'EURUSD', 30, 40)],
+                         tracer.record_since.call_args_list)
+        tracer.tick.assert_called_once()
+
     def test_process_item_not_snapshot(self):
-        with patch('app.bookbuilder.update_quotes', side_effect=[dict()]) as update_quotes:
+        with patch('app.bookbuilder.update_quotes', side_effect=lambda t, q, n: q) as update_quotes:
             with patch('app.bookbuilder.build_book') as build_book:
-                self.bookbuilder.quotes["symbol"] = {'a': 1 }
+                quotes = bb.QuoteState(self.bookbuilder.providers_of('symbol'))
+                self.bookbuilder.quotes["symbol"] = quotes
                 self.bookbuilder.process_item([1, "symbol", [3, 4, 5], False])
-                update_quotes.assert_called_with(1, {'a': 1 }, [3, 4, 5])
+                update_quotes.assert_called_with(1, quotes, [3, 4, 5])
                 build_book.assert_called_once()
 
     def test_process_item_snapshot(self):
-        with patch('app.bookbuilder.update_quotes', side_effect=[dict()]) as update_quotes:
+        with patch('app.bookbuilder.update_quotes', side_effect=lambda t, q, n: q) as update_quotes:
             with patch('app.bookbuilder.build_book') as build_book:
-                self.bookbuilder.quotes["symbol"] = {'a': 1 }
+                quotes = bb.QuoteState(self.bookbuilder.providers_of('symbol'))
+                self.bookbuilder.quotes["symbol"] = quotes
                 self.bookbuilder.process_item([1, "symbol", [3, 4, 5], True])
-                update_quotes.assert_called_with(1, {}, [3, 4, 5])
+                update_quotes.assert_called_with(1, ANY, [3, 4, 5])
+                self.assertIsNot(quotes, update_quotes.call_args[0][1])
                 build_book.assert_called_once()
 
+    def test_process_item_snapshot_restores_time(self):
+        self.bookbuilder.process_item([1, "symbol", [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False])
+        self.bookbuilder.process_item([2, "symbol", [['0', 100.0, 300.0, 1.23, 2.34, 'a', 'a']], True])
+        quotes = self.bookbuilder.quotes["symbol"].to_dict()
+        self.assertEqual(1, quotes['B0']['time'])
+        self.assertEqual(2, quotes['S0']['time'])
+
+    def test_run_batch(self):
+        bookbuilder = bb.BookBuilder(self.inbound_queue, self.outbound_queue,
+                                     self.shutdown_event, self.shutdown_consumer,
+                                     max_levels=4, batch=bb.CONFLATE, max_batch=2)
+        self.shutdown_event.is_set = Mock(side_effect=[False, True])
+        self.inbound_queue.get = Mock(side_effect=["item1", "item2", "item3"])
+        with patch('app.bookbuilder.BookBuilder.process_batch') as process_batch:
+            with patch('app.bookbuilder.BookBuilder.shutdown') as shutdown:
+                bookbuilder.run()
+                process_batch.assert_called_once_with(["item1", "item2"])
+                shutdown.assert_called_once()
+
+    def test_shutdown_batch(self):
+        bookbuilder = bb.BookBuilder(self.inbound_queue, self.outbound_queue,
+                                     self.shutdown_event, self.shutdown_consumer,
+                                     max_levels=4, batch=bb.LOSSLESS)
+        self.inbound_queue.get = Mock(side_effect=["item1", "item2", Empty, Empty])
+        with patch('app.bookbuilder.BookBuilder.process_batch') as process_batch:
+            bookbuilder.shutdown()
+            process_batch.assert_called_once_with(["item1", "item2"])
+            self.shutdown_consumer.set.assert_called_once()
+
+    def test_process_batch_conflate(self):
+        bookbuilder = bb.BookBuilder(self.inbound_queue, self.outbound_queue,
+                                     self.shutdown_event, self.shutdown_consumer,
+                                     max_levels=4, batch=bb.CONFLATE)
+        bookbuilder.process_batch([
+            [1, "EURUSD", [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False],
+            [2, "USDCAD", [['0', 100.0, 200.0, 1.33, 1.34, 'a', 'a']], False],
+            [3, "EURUSD", [['1', 100.0, 200.0, 1.24, 2.33, 'a', 'a']], False],
+        ])
+        books = self.published_books()
+        # in order of each symbol's last update
+        self.assertEqual([(2, "USDCAD"), (3, "EURUSD")], [book[:2] for book in books])
+        # all updates applied before the book was built
+        self.assertEqual(1.24, books[1][2]['bid_px0'])
+        self.assertEqual(1.23, books[1][2]['bid_px1'])
+        self.assertEqual(1, bookbuilder.batches)
+        self.assertEqual(3, bookbuilder.max_batch_items)
+        self.assertEqual(1, bookbuilder.conflated)
+
+    def test_process_batch_conflate_across_midnight(self):
+        bookbuilder = bb.BookBuilder(self.inbound_queue, self.outbound_queue,
+                                     self.shutdown_event, self.shutdown_consumer,
+                                     max_levels=4, batch=bb.CONFLATE)
+        before, after = 1616975999900000, 1616976000100000  # either side of midnight
+        bookbuilder.process_batch([
+            [before - 1, "EURUSD", [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False],
+            [after, "EURUSD", [['0', 100.0, 200.0, 1.24, 2.34, 'a', 'a']], False],
+            [before, "USDCAD", [['0', 100.0, 200.0, 1.33, 1.34, 'a', 'a']], False],
+            [before + 1, "USDJPY", [['0', 100.0, 200.0, 110.1, 110.2, 'a', 'a']], False],
+        ])
+        # the new day's book comes last, not where EURUSD first appeared
+        self.assertEqual([(before, "USDCAD"), (before + 1, "USDJPY"), (after, "EURUSD")],
+                         [book[:2] for book in self.published_books()])
+
+    def test_process_batch_lossless(self):
+        bookbuilder = bb.BookBuilder(self.inbound_queue, self.outbound_queue,
+                                     self.shutdown_event, self.shutdown_consumer,
+                                     max_levels=4, batch=bb.LOSSLESS)
+        bookbuilder.process_batch([
+            [1, "EURUSD", [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False],
+            [3, "EURUSD", [['1', 100.0, 200.0, 1.24, 2.33, 'a', 'a']], False],
+        ])
+        books = self.published_books()
+        self.assertEqual([1, 3], [book[0] for book in books])
+        self.assertEqual(1.23, books[0][2]['bid_px0'])
+        self.assertEqual(0, bookbuilder.conflated)
+
+    def test_process_item_suppress_unchanged(self):
+        bookbuilder = bb.BookBuilder(self.inbound_queue, self.outbound_queue,
+                                     self.shutdown_event, self.shutdown_consumer,
+                                     max_levels=1, suppress_unchanged=True)
+        self.assertIsNotNone(bookbuilder.process_item(
+            [1, "symbol", [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False]))
+        # below the top level
+        self.assertIsNone(bookbuilder.process_item(
+            [2, "symbol", [['1', 100.0, 200.0, 1.22, 2.35, 'a', 'a']], False]))
+        # same price and size, new level time
+        self.assertIsNotNone(bookbuilder.process_item(
+            [3, "symbol", [['0', 100.0, None, 1.23, None, 'a', None]], False]))
+        self.assertIsNotNone(bookbuilder.process_item(
+            [4, "symbol", [['0', 300.0, None, None, None, None, None]], False]))
+        self.assertEqual([1, 3, 4], [book[0] for book in self.published_books()])
+        self.assertEqual(4, bookbuilder.books)
+        self.assertEqual(1, bookbuilder.suppressed)
+
+    def test_process_item_suppress_unchanged_ignore_level_times(self):
+        bookbuilder = bb.BookBuilder(self.inbound_queue, self.outbound_queue,
+                                     self.shutdown_event, self.shutdown_consumer,
+                                     max_levels=1, suppress_unchanged=True,
+                                     ignore_level_times=True)
+        bookbuilder.process_item([1, "symbol", [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False])
+        self.assertIsNone(bookbuilder.process_item(
+            [3, "symbol", [['0', 100.0, None, 1.23, None, 'a', None]], False]))
+        # per symbol
+        self.assertIsNotNone(bookbuilder.process_item(
+            [4, "other", [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False]))
+        self.assertEqual(1, bookbuilder.suppressed)
+
+    def test_process_item_full_sort(self):
+        bookbuilder = bb.BookBuilder(self.inbound_queue, self.outbound_queue,
+                                     self.shutdown_event, self.shutdown_consumer,
+                                     max_levels=4, incremental_sort=False)
+        book = bookbuilder.process_item([1, "symbol", [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False])
+        self.assertFalse(bookbuilder.quotes["symbol"].ordered)
+        self.assertEqual(1.23, book['bid_px0'])
+        self.assertEqual(2.34, book['ask_px0'])
+
+    def test_process_item_publishes_copy(self):
+        first = self.bookbuilder.process_item([1, "symbol", [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False])
+        second = self.bookbuilder.process_item([2, "symbol", [['0', 100.0, 200.0, 1.24, 2.35, 'a', 'a']], False])
+        self.assertEqual(1.23, first['bid_px0'])
+        self.assertEqual(1.24, second['bid_px0'])
+        self.assertIs(second, self.outbound_queue.put.call_args[0][0][2])
+        self.assertIsNot(self.bookbuilder.schema, second)
+
+    def test_process_item_publishes_providers(self):
+        self.bookbuilder.process_item([1, "symbol", [['0', 100.0, 200.0, 1.23, 2.34, 'lp1', 'lp1']], False])
+        self.bookbuilder.process_item([2, "symbol", [['0', 100.0, 200.0, 1.24, 2.35, 'lp1', 'lp1']], False])
+        self.bookbuilder.process_item([3, "other", [['0', 100.0, 200.0, 1.24, 2.35, 'lp2', 'lp2']], False])
+        self.bookbuilder.process_item([4, "symbol", [['1', 100.0, 200.0, 1.22, 2.36, 'lp2', 'lp2']], False])
+        items = [args[0][0] for args in self.outbound_queue.put.call_args_list]
+        self.assertEqual([
+            (1, bb.PROVIDERS, ('symbol', ('', 'lp1'))), 1, 2,
+            (3, bb.PROVIDERS, ('other', ('', 'lp2'))), 3,
+            (4, bb.PROVIDERS, ('symbol', ('', 'lp1', 'lp2'))), 4,
+        ], [item if item[1] == bb.PROVIDERS else item[0] for item in items])
+        # codes are per symbol
+        self.assertEqual(1, items[4][2]['bid_provider0'])
+        self.assertEqual(2, items[6][2]['bid_provider1'])
+
 class TestBookBuilderFuncs(unittest.TestCase):
 
     def setUp(self):
@@ -86,16 +247,16 @@ class TestBookBuilderFuncs(unittest.TestCase):
             ('bid_px2', 'float64'), ('bid_px3', 'float64'),
             ('bid_size0', 'float64'), ('bid_size1', 'float64'),
             ('bid_size2', 'float64'), ('bid_size3', 'float64'),
-            ('bid_provider0', 'S1'), ('bid_provider1', 'S1'),
-            ('bid_provider2', 'S1'), ('bid_provider3', 'S1'),
+            ('bid_provider0', 'uint16'), ('bid_provider1', 'uint16'),
+            ('bid_provider2', 'uint16'), ('bid_provider3', 'uint16'),
             ('ask_time0', 'uint64'), ('ask_time1', 'uint64'),
             ('ask_time2', 'uint64'), ('ask_time3', 'uint64'),
             ('ask_px0', 'float64'), ('ask_px1', 'float64'),
             ('ask_px2', 'float64'), ('ask_px3', 'float64'),
             ('ask_size0', 'float64'), ('ask_size1', 'float64'),
             ('ask_size2', 'float64'), ('ask_size3', 'float64'),
-            ('ask_provider0', 'S1'), ('ask_provider1', 'S1'),
-            ('ask_provider2', 'S1'), ('ask_provider3', 'S1'),
+            ('ask_provider0', 'uint16'), ('ask_provider1', 'uint16'),
+            ('ask_provider2', 'uint16'), ('ask_provider3', 'uint16'),
         ]
         self.schema = np.zeros(1, dtype=self.dtype)
         self.quotes = [
@@ -131,89 +292,102 @@ class TestBookBuilderFuncs(unittest.TestCase):
             'provider': 'a',
             'size': 100.0
         }
+        self.providers = bb.Providers()
+
+    def new_quotes(self):
+        return bb.QuoteState(self.providers)
+
+    def name(self, code):
+        return self.providers.names[code]
+
+    def make_quotes(self, quotes):
+        """QuoteState from a list of quote dicts, one entry per dict"""
+        return bb.QuoteState.from_dict({
+            ('B' if quote['entry_type'] == 0 else 'S') + str(i): quote
+            for i, quote in enumerate(quotes)}, self.providers)
 
 # update_quotes
     # add prices to clean book
     def test_update_quotes_empty_book_bid(self):
         quote = [['1', 100, None, 1.23, None, 'a', None]]
-        res = bb.update_quotes(self.time, {}, quote)
+        res = bb.update_quotes(self.time, self.new_quotes(), quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'B1': {'entry_type': 0, 'price': 1.23, 'provider': 'a',
                                  'size': 100.0, 'time': 1595336924000000}},
-                         res)
+                         res.to_dict())
 
     def test_update_quotes_empty_book_ask(self):
         quote = [['1', None, 200.0, None, 2.34, None, 'a']]
-        res = bb.update_quotes(self.time, {}, quote)
+        res = bb.update_quotes(self.time, self.new_quotes(), quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'S1': {'entry_type': 1, 'price': 2.34, 'provider': 'a',
                                  'size': 200.0, 'time': 1595336924000000}},
-                         res)
+                         res.to_dict())
 
     def test_update_quotes_empty_book_both(self):
         quote = [['1', 100, 200, 1.23, 2.34, 'a', 'b']]
-        res = bb.update_quotes(self.time, {}, quote)
+        res = bb.update_quotes(self.time, self.new_quotes(), quote)
         self.assertEqual(2, len(res))
         self.assertEqual({'B1': {'entry_type': 0, 'price': 1.23, 'provider': 'a',
                                  'size': 100, 'time': 1595336924000000},
                           'S1': {'entry_type': 1, 'price': 2.34, 'provider': 'b',
                                  'size': 200, 'time': 1595336924000000}},
-                         res)
+                         res.to_dict())
 
     def test_update_quotes_empty_book_zero_qty(self):
         quote = [['1', 0.0, None, 1.23, None, 'a', None]]
-        res = bb.update_quotes(self.time, {}, quote)
+        res = bb.update_quotes(self.time, self.new_quotes(), quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'B1': {'entry_type': 0, 'price': 1.23, 'provider': 'a',
                                  'size': 0.0, 'time': 1595336924000000}},
-                         res)
+                         res.to_dict())
     # update price
     def test_update_quotes_update_bid_price(self):
         quote = [['1', 100, None, 1.23, None, 'a', None]]
         new_quote = [['1', None, None, 1.24, None, 'a', None]]
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'B1': {'entry_type': 0, 'price': 1.24, 'provider': 'a',
                                  'size': 100, 'time': 1595336925000000}},
-                         res)
+                         res.to_dict())
 
     def test_update_quotes_update_ask_price(self):
         quote = [['1', None, 200, None, 2.34, None, 'a']]
         new_quote = [['1', None, None, None, 2.35, None, 'a']]
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'S1': {'entry_type': 1, 'price': 2.35, 'provider': 'a',
                                  'size': 200, 'time': 1595336925000000}},
-                         res)
+                         res.to_dict())
 
     # update size
     def test_update_quotes_update_bid_size(self):
         quote = [['1', 100, None, 1.23, None, 'a', None]]
         new_quote = [['1', 125, None, None, None, 'a', None]]
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'B1': {'entry_type': 0, 'price': 1.23, 'provider': 'a',
                                  'size': 125, 'time': 1595336925000000}},
-                         res)
+                         res.to_dict())
 
     def test_update_quotes_update_ask_size(self):
         quote = [['1', None, 200, None, 2.34, None, 'a']]
         new_quote = [['1', None, 250, None, None, None, 'a']]
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'S1': {'entry_type': 1, 'price': 2.34, 'provider': 'a',
                                  'size': 250, 'time': 1595336925000000}},
-                         res)
+                         res.to_dict())
 
     # update provider (?)
     # def test_update_quotes_update_provider(self):
     #     quote = [['1', 100, None, 1.23, None, 'a', None]]
     #     new_quote = [['1', None, None, None, None, 'b', None]]
-    #     quotes = bb.update_quotes(self.time, {}, quote)
+    #     quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
     #     res = bb.update_quotes(self.new_time, quotes, new_quote)
     #     self.assertEqual(1, len(res))
     #     self.assertEqual({'B1': {'entry_type': 0, 'price': 1.23, 'provider': 'b',
@@ -224,53 +398,53 @@ class TestBookBuilderFuncs(unittest.TestCase):
     def test_update_quotes_update_bid(self):
         quote = [['1', 100, None, 1.23, None, 'a', None]]
         new_quote = [['1', 125, None, 1.24, None, 'b', None]]
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'B1': {'entry_type': 0, 'price': 1.24, 'provider': 'b',
                                  'size': 125, 'time': 1595336925000000}},
-                         res)
+                         res.to_dict())
 
     def test_update_quotes_update_ask(self):
         quote = [['1', None, 200, None, 2.34, None, 'a']]
         new_quote = [['1', None, 250, None, 2.35, None, 'b']]
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'S1': {'entry_type': 1, 'price': 2.35, 'provider': 'b',
                                  'size': 250, 'time': 1595336925000000}},
-                         res)
+                         res.to_dict())
 
     def test_update_quotes_update_bid_and_ask(self):
         quote = [['1', 100, 200, 1.23, 2.34, 'a', 'a']]
         new_quote = [['1', 125, 250, 1.24, 2.35, 'c', 'b']]
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(2, len(res))
         self.assertEqual({'B1': {'entry_type': 0, 'price': 1.24, 'provider': 'c',
                                  'size': 125, 'time': 1595336925000000},
                           'S1': {'entry_type': 1, 'price': 2.35, 'provider': 'b',
                                  'size': 250, 'time': 1595336925000000}},
-                         res)
+                         res.to_dict())
 
     def test_update_quotes_zero_price_and_size(self):
         quote = [['1', 0.0, 0.0, 0.0, 0.0, 'a', 'b']]
-        res = bb.update_quotes(self.time, {}, quote)
+        res = bb.update_quotes(self.time, self.new_quotes(), quote)
         self.assertEqual(2, len(res))
         self.assertEqual({'B1': {'entry_type': 0, 'price': 0.0, 'provider': 'a',
                                  'size': 0.0, 'time': 1595336924000000},
                           'S1': {'entry_type': 1, 'price': 0.0, 'provider': 'b',
                                  'size': 0.0, 'time': 1595336924000000}},
-                         res)
+                         res.to_dict())
 
     # delete quote
     def test_update_quotes_delete_bid(self):
         quote = [['1', 100, None, 1.23, None, 'a', None]]
         new_quote = [['1', -1, None, 1.23, None, None, None]]  # if we get a price
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(0, len(res))
-        self.assertEqual({}, res)
+        self.assertEqual({}, res.to_dict())
 
     def test_update_quotes_delete_bid_multiple_levels(self):
         quote = [
@@ -278,20 +452,20 @@ class TestBookBuilderFuncs(unittest.TestCase):
             ['2', 250, None, 1.22, None, 'b', None]
         ]
         new_quote = [['1', -1, None, 1.23, None, None, None]]
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'B2': {'entry_type': 0, 'price': 1.22, 'provider': 'b',
                                  'size': 250, 'time': 1595336924000000}},
-                         res)
+                         res.to_dict())
 
     def test_update_quotes_delete_ask(self):
         quote = [['1', None, 200, None, 2.34, None, 'a']]
         new_quote = [['1', None, -1, None, None, None, None]]  # if we dont get a price
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(0, len(res))
-        self.assertEqual({}, res)
+        self.assertEqual({}, res.to_dict())
 
     def test_update_quotes_delete_ask_multiple_levels(self):
         quote = [
@@ -299,67 +473,67 @@ class TestBookBuilderFuncs(unittest.TestCase):
             ['2', None, 250, None, 2.35, None, 'b']
         ]
         new_quote = [['2', None, -1, None, None, None, None]]
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(1, len(res))
         self.assertEqual({'S1': {'entry_type': 1, 'price': 2.34, 'provider': 'a',
                                  'size': 200, 'time': 1595336924000000}},
-                         res)
+                         res.to_dict())
 
     def test_update_quotes_delete_both(self):
         quote = [['1', 100, 200, 1.23, 2.34, 'a', 'a']]
         new_quote = [['1', -1, -1, None, None, None, None]]
-        quotes = bb.update_quotes(self.time, {}, quote)
+        quotes = bb.update_quotes(self.time, self.new_quotes(), quote)
         res = bb.update_quotes(self.new_time, quotes, new_quote)
         self.assertEqual(0, len(res))
         self.assertEqual({},
-                         res)
+                         res.to_dict())
 
 # build_book
     def test_build_book_single_level_bid(self):
         quotes = [{'entry_type': 0, 'price': 1.23, 'size': 100,
                    'time': 1595336924000000, 'provider': 'abc'}]
-        res = bb.build_book(1595336925000000, quotes, self.schema, 4)
+        res = bb.build_book(1595336925000000, self.make_quotes(quotes), self.schema, 4)
 
         self.assertEqual(1595336925000000, res['time'])
         self.assertEqual(1595336924000000, res['bid_time0'])
         self.assertEqual(1.23, res['bid_px0'])
         self.assertEqual(100, res['bid_size0'])
-        self.assertEqual(b'a', res['bid_provider0'][0])
+        self.assertEqual('abc', self.name(res['bid_provider0'][0]))
         self.assertEqual(0, res['ask_time0'])
         self.assertEqual(0, res['ask_px0'])
         self.assertEqual(0, res['ask_size0'])
-        self.assertEqual(b'', res['ask_provider0'])
+        self.assertEqual(0, res['ask_provider0'])
 
     def test_build_book_single_level_ask(self):
         quotes = [{'entry_type': 1, 'price': 2.34, 'size': 200,
                    'time': 1595336924000000, 'provider': 'a'}]
-        res = bb.build_book(1595336925000000, quotes, self.schema, 4)
+        res = bb.build_book(1595336925000000, self.make_quotes(quotes), self.schema, 4)
         self.assertEqual(1595336925000000, res['time'])
         self.assertEqual(0, res['bid_time0'])
         self.assertEqual(0, res['bid_px0'])
         self.assertEqual(0, res['bid_size0'])
-        self.assertEqual(b'', res['bid_provider0'][0])
+        self.assertEqual('', self.name(res['bid_provider0'][0]))
         self.assertEqual(1595336924000000, res['ask_time0'])
         self.assertEqual(2.34, res['ask_px0'])
         self.assertEqual(200, res['ask_size0'])
-        self.assertEqual(b'a', res['ask_provider0'][0])
+        self.assertEqual('a', self.name(res['ask_provider0'][0]))
 
     def test_build_book_single_level_bid_and_ask(self):
         quotes = [
             {'entry_type': 0, 'price': 1.23, 'size': 100, 'time': 1595336924000000, 'provider': 'a'},
             {'entry_type': 1, 'price': 2.34, 'size': 200, 'time': 1595336924000000, 'provider': 'b'}
             ]
-        res = bb.build_book(1595336925000000, quotes, self.schema, 4)
+        res = bb.build_book(1595336925000000, self.make_quotes(quotes), self.schema, 4)
         self.assertEqual(1595336925000000, res['time'])
         self.assertEqual(1595336924000000, res['bid_time0'])
         self.assertEqual(1.23, res['bid_px0'])
         self.assertEqual(100, res['bid_size0'])
-        self.assertEqual(b'a', res['bid_provider0'][0])
+        self.assertEqual('a', self.name(res['bid_provider0'][0]))
         self.assertEqual(1595336924000000, res['ask_time0'])
         self.assertEqual(2.34, res['ask_px0'])
         self.assertEqual(200, res['ask_size0'])
-        self.assertEqual(b'b', res['ask_provider0'][0])
+        self.assertEqual('b', self.name(res['ask_provider0'][0]))
 
     def test_build_book_multi_level_bid(self):
         quotes = [
@@ -376,27 +550,27 @@ class TestBookBuilderFuncs(unittest.TestCase):
                 'time': 1595336925000000, 'provider': 'c'
             },
         ]
-        res = bb.build_book(1595336925000000, quotes, self.schema, 4)
+        res = bb.build_book(1595336925000000, self.make_quotes(quotes), self.schema, 4)
         self.assertEqual(1595336925000000, res['time'][0])
         self.assertEqual(1595336925000000, res['bid_time0'])
         self.assertEqual(1.25, res['bid_px0'])
         self.assertEqual(300, res['bid_size0'])
-        self.assertEqual(b'c', res['bid_provider0'][0])
+        self.assertEqual('c', self.name(res['bid_provider0'][0]))
         self.assertEqual(1595336924000000, res['bid_time1'])
         self.assertEqual(1.24, res['bid_px1'])
         self.assertEqual(200, res['bid_size1'])
-        self.assertEqual(b'b', res['bid_provider1'][0])
+        self.assertEqual('b', self.name(res['bid_provider1'][0]))
         self.assertEqual(1595336923000000, res['bid_time2'])
         self.assertEqual(1.23, res['bid_px2'])
         self.assertEqual(100, res['bid_size2'])
-        self.assertEqual(b'a', res['bid_provider2'][0])
+        self.assertEqual('a', self.name(res['bid_provider2'][0]))
         self.assertEqual(0, res['bid_time3'])
         self.assertEqual(0, res['bid_px3'])
         self.assertEqual(0, res['bid_size3'])
         self.assertEqual(0, res['ask_time0'])
         self.assertEqual(0, res['ask_px0'])
         self.assertEqual(0, res['ask_size0'])
-        self.assertEqual(b'', res['ask_provider0'][0])
+        self.assertEqual('', self.name(res['ask_provider0'][0]))
 
     def test_build_book_multi_level_ask(self):
         quotes = [
@@ -410,31 +584,31 @@ class TestBookBuilderFuncs(unittest.TestCase):
              'time': 1595336922000000, 'provider': 'c'
             },
             ]
-        res = bb.build_book(1595336925000000, quotes, self.schema, 4)
+        res = bb.build_book(1595336925000000, self.make_quotes(quotes), self.schema, 4)
         self.assertEqual(1595336925000000, res['time'])
         self.assertEqual(1595336922000000, res['ask_time0'])
         self.assertEqual(2.32, res['ask_px0'])
         self.assertEqual(200, res['ask_size0'])
-        self.assertEqual(b'c', res['ask_provider0'][0])
+        self.assertEqual('c', self.name(res['ask_provider0'][0]))
         self.assertEqual(1595336923000000, res['ask_time1'])
         self.assertEqual(2.33, res['ask_px1'])
         self.assertEqual(300, res['ask_size1'])
-        self.assertEqual(b'b', res['ask_provider1'][0])
+        self.assertEqual('b', self.name(res['ask_provider1'][0]))
         self.assertEqual(1595336924000000, res['ask_time2'])
         self.assertEqual(2.34, res['ask_px2'])
         self.assertEqual(400, res['ask_size2'])
-        self.assertEqual(b'a', res['ask_provider2'][0])
+        self.assertEqual('a', self.name(res['ask_provider2'][0]))
         self.assertEqual(0, res['ask_time3'])
         self.assertEqual(0, res['ask_px3'])
         self.assertEqual(0, res['ask_size3'])
-        self.assertEqual(b'', res['ask_provider3'][0])
+        self.assertEqual('', self.name(res['ask_provider3'][0]))
         self.assertEqual(0, res['bid_time0'])
         self.assertEqual(0, res['bid_px0'])
         self.assertEqual(0, res['bid_size0'])
-        self.assertEqual(b'', res['bid_provider0'][0])
+        self.assertEqual('', self.name(res['bid_provider0'][0]))
 
     def test_build_book_multi_level_bid_and_ask(self):
-        res = bb.build_book(1595336925000000, self.quotes, self.schema, 4)
+        res = bb.build_book(1595336925000000, self.make_quotes(self.quotes), self.schema, 4)
         self.assertEqual(1595336925000000, res['time'])
         self.assertEqual(1595336925000000, res['bid_time0'])
         self.assertEqual(1.25, res['bid_px0'])
@@ -456,6 +630,140 @@ class TestBookBuilderFuncs(unittest.TestCase):
         self.assertEqual(400, res['ask_size2'])
 
 
+    def test_build_book_full_sort(self):
+        quotes = bb.QuoteState.from_dict(self.make_quotes(self.quotes).to_dict(),
+                                         self.providers, ordered=False)
+        res = bb.build_book(1595336925000000, quotes, np.copy(self.schema), 4)
+        expected = bb.build_book(1595336925000000, self.make_quotes(self.quotes),
+                                 np.copy(self.schema), 4)
+        self.assertEqual(expected.tobytes(), res.tobytes())
+
+    def test_build_book_equal_prices_by_arrival(self):
+        # ties on price are ordered by arrival, the latest bid and the
+        # earliest ask first, whether kept in order, fully sorted or selected
+        entries = [['0', 100, 100, 1.20, 1.30, 'a', 'a'],
+                   ['1', 200, 200, 1.20, 1.30, 'b', 'b'],
+                   ['2', 300, 300, 1.20, 1.30, 'c', 'c'],
+                   ['3', 400, None, 1.21, None, 'd', None]]
+        for ordered in (True, False):
+            quotes = bb.QuoteState(self.providers, ordered=ordered)
+            for entry in entries:
+                bb.update_quotes(self.time, quotes, [entry])
+            res = bb.build_book(self.time, quotes, np.zeros(1, dtype=bb.create_schema(3)), 3)
+            with self.subTest(ordered=ordered):
+                self.assertEqual(['d', 'c', 'b'],
+                                 [self.name(res['bid_provider%i' % i][0]) for i in range(3)])
+                self.assertEqual(['a', 'b', 'c'],
+                                 [self.name(res['ask_provider%i' % i][0]) for i in range(3)])
+        bids, asks = quotes.sides
+        self.assertEqual(['d', 'c'], [self.name(bids.provider[slot])
+                                      for slot in bb.select_slots(bids, True, 2, 0)])
+        self.assertEqual(['a', 'b'], [self.name(asks.provider[slot])
+                                      for slot in bb.select_slots(asks, False, 2, 0)])
+
+    def test_build_book_reused_views(self):
+        views = bb.create_views(self.schema, 4)
+        bb.build_book(1595336925000000, self.make_quotes(self.quotes), self.schema, 4, views)
+        quotes = [{'entry_type': 1, 'price': 2.34, 'size': 200,
+                   'time': 1595336924000000, 'provider': 'a'}]
+        res = bb.build_book(1595336926000000, self.make_quotes(quotes), self.schema, 4, views)
+        expected = bb.build_book(1595336926000000, self.make_quotes(quotes),
+                                 np.zeros(1, dtype=self.dtype), 4)
+        self.assertIs(self.schema, res)
+        self.assertEqual(expected.tobytes(), res.tobytes())
+        self.assertEqual(0, res['bid_px0'])
+        self.assertEqual(0, res['bid_provider0'])
+        self.assertEqual(0, res['ask_px1'])
+
+    def test_create_views(self):
+        time, bids, asks = bb.create_views(self.schema, 4)
+        asks[0][1].view('float64')[:] = [1, 2, 3, 4]
+        bids[0][0] = [5, 6, 7, 8]
+        bids[1][:] = [1, 2, 3, 4]
+        time[0] = 9
+        self.assertEqual(9, self.schema['time'])
+        self.assertEqual(3, self.schema['ask_px2'])
+        self.assertEqual(8, self.schema['bid_time3'])
+        self.assertEqual(3, self.schema['bid_provider2'])
+
+    def test_create_views_not_contiguous(self):
+        dtype = [('time', 'uint64')] + [
+            (column + str(i), 'float64')
+            for i in range(2)
+            for column in ('bid_time', 'bid_px', 'bid_size', 'bid_provider',
+                           'ask_time', 'ask_px', 'ask_size', 'ask_provider')]
+        self.assertRaises(ValueError, bb.create_views, np.zeros(1, dtype=dtype), 2)
+
+    def test_build_book_incremental_matches_full_sort(self):
+        # random adds, updates and deletes, including ties on price
+        rng = np.random.RandomState(42)
+        ordered = self.new_quotes()
+        full = bb.QuoteState(self.providers, ordered=False)
+        for i in range(500):
+            entry_id = str(rng.randint(30))
+            size = float(rng.choice([-1, 0, 1000000, 2000000]))
+            price = float(rng.randint(100, 110)) / 100
+            quote = [[entry_id, size, size, price, price + 0.01, 'a', 'b']]
+            bb.update_quotes(i, ordered, quote)
+            bb.update_quotes(i, full, quote)
+            for entry_type, descending in ((0, True), (1, False)):
+                self.assertEqual(bb.flip_quotes(full, entry_type, descending),
+                                 bb.top_quotes(ordered, entry_type, 30))
+            self.assertEqual(
+                bb.build_book(i, full, np.copy(self.schema), 4).tobytes(),
+                bb.build_book(i, ordered, np.copy(self.schema), 4).tobytes())
+
+    def test_select_slots(self):
+        # many entries on few prices, so ties straddle the cut
+        rng = np.random.RandomState(7)
+        for _ in range(50):
+            quotes = bb.QuoteState(self.providers, ordered=False)
+            for i in range(rng.randint(1, 60)):
+                price = float(rng.randint(100, 106)) / 100
+                size = float(rng.choice([0, 1000000]))
+                bb.update_quotes(i, quotes, [[str(i), size, size, price, price, 'a', 'a']])
+            for entry_type, descending in ((0, True), (1, False)):
+                side = quotes.sides[entry_type]
+                for number_of_levels in (1, 3, 10):
+                    self.assertEqual(
+                        bb.sorted_slots(side, descending)[:number_of_levels].tolist(),
+                        bb.select_slots(side, descending, number_of_levels, 0).tolist())
+
+    def test_top_quotes(self):
+        quotes = self.make_quotes(self.quotes)
+        times, prices, sizes, providers = bb.top_quotes(quotes, 0, 2)
+        self.assertEqual([1595336925000000, 1595336924000000], times)
+        self.assertEqual([1.25, 1.24], prices)
+        self.assertEqual([300, 200], sizes)
+        self.assertEqual(['c', 'b'], providers)
+        times, prices, sizes, providers = bb.top_quotes(quotes, 1, 10)
+        self.assertEqual([2.32, 2.33, 2.34], prices)
+
+    def test_top_quotes_follows_updates(self):
+        quotes = self.make_quotes(self.quotes)
+        # best bid moves to the back, then is removed, zero qty is not shown
+        bb.update_quotes(self.new_time, quotes, [['4', None, None, 1.20, None, None, None]])
+        self.assertEqual([1.24, 1.23, 1.20], bb.top_quotes(quotes, 0, 4)[1])
+        bb.update_quotes(self.new_time, quotes, [['4', -1, None, None, None, None, None]])
+        self.assertEqual([1.24, 1.23], bb.top_quotes(quotes, 0, 4)[1])
+        bb.update_quotes(self.new_time, quotes, [['3', 0.0, None, None, None, None, None]])
+        self.assertEqual([1.23], bb.top_quotes(quotes, 0, 4)[1])
+        self.assertEqual([(-1.23, -0, 0)], quotes.sides[0].order)
+
+# compare_ranges
+    def test_compare_ranges(self):
+        self.assertEqual([(8, 8 + 26 * 4), (112, 112 + 26 * 4)], bb.compare_ranges(self.schema, 4))
+        self.assertEqual([(40, 112), (144, 216)], bb.compare_ranges(self.schema, 4, True))
+
+    def test_book_levels(self):
+        ranges = bb.compare_ranges(self.schema, 4, True)
+        before = bb.book_levels(self.schema, ranges)
+        self.schema['time'] = 1
+        self.schema['ask_time3'] = 1
+        self.assertEqual(before, bb.book_levels(self.schema, ranges))
+        self.schema['ask_provider3'] = 1
+        self.assertNotEqual(before, bb.book_levels(self.schema, ranges))
+
 # create_schema
     def test_create_schema(self):
         res = bb.create_schema(4)
@@ -463,58 +771,85 @@ class TestBookBuilderFuncs(unittest.TestCase):
 
 # update_entry
     def test_update_entry_new_entry(self):
-        res = bb.update_entry(None, 0, 1, 100, 1.25, 'a')
-        self.assertEqual(self.quote_entry, res)
+        res = self.new_quotes()
+        bb.update_entry(res.sides[0], self.providers, '1', 1, 100, 1.25, 'a')
+        self.assertEqual({'B1': self.quote_entry}, res.to_dict())
 
     def test_update_entry_update_size(self):
-        res = bb.update_entry(self.quote_entry, 0, 1, 200, None, 'a')
-        self.assertEqual(200, res['size'])
-        self.assertEqual(1.25, res['price'])
-        self.assertEqual('a', res['provider'])
+        res = self.make_quotes([self.quote_entry])
+        bb.update_entry(res.sides[0], self.providers, '0', 1, 200, None, 'a')
+        self.assertEqual(200, res.to_dict()['B0']['size'])
+        self.assertEqual(1.25, res.to_dict()['B0']['price'])
+        self.assertEqual('a', res.to_dict()['B0']['provider'])
 
     def test_update_entry_update_price(self):
-        res = bb.update_entry(self.quote_entry, 0, 1, None, 1.35, 'a')
-        self.assertEqual(100, res['size'])
-        self.assertEqual(1.35, res['price'])
-        self.assertEqual('a', res['provider'])
+        res = self.make_quotes([self.quote_entry])
+        bb.update_entry(res.sides[0], self.providers, '0', 1, None, 1.35, 'a')
+        self.assertEqual(100, res.to_dict()['B0']['size'])
+        self.assertEqual(1.35, res.to_dict()['B0']['price'])
+        self.assertEqual('a', res.to_dict()['B0']['provider'])
 
     def test_update_entry_update_price_and_size(self):
-        res = bb.update_entry(self.quote_entry, 0, 1, 200, 1.35, 'a')
-        self.assertEqual(200, res['size'])
-        self.assertEqual(1.35, res['price'])
-        self.assertEqual('a', res['provider'])
+        res = self.make_quotes([self.quote_entry])
+        bb.update_entry(res.sides[0], self.providers, '0', 1, 200, 1.35, 'a')
+        self.assertEqual(200, res.to_dict()['B0']['size'])
+        self.assertEqual(1.35, res.to_dict()['B0']['price'])
+        self.assertEqual('a', res.to_dict()['B0']['provider'])
 
     def test_update_entry_delete(self):
-        res = bb.update_entry(self.quote_entry, 0, 1, -1, None, None)
-        self.assertEqual(None, res)
+        res = self.make_quotes([self.quote_entry])
+        bb.update_entry(res.sides[0], self.providers, '0', 1, -1, None, None)
+        self.assertEqual({}, res.to_dict())
+        self.assertEqual(0, res.sides[0].size.sum())
+
+    def test_update_entry_delete_unknown(self):
+        res = self.new_quotes()
+        bb.update_entry(res.sides[0], self.providers, '0', 1, -1, None, None)
+        self.assertEqual({}, res.to_dict())
 
     def test_update_entry_no_provider(self):
-        res = bb.update_entry(None, 0, 1, 100, 1.25, None)
-        self.assertEqual('', res['provider'])
+        res = self.new_quotes()
+        bb.update_entry(res.sides[0], self.providers, '0', 1, 100, 1.25, None)
+        self.assertEqual('', res.to_dict()['B0']['provider'])
+
+    def test_update_entry_reuses_slot(self):
+        res = self.make_quotes([self.quote_entry])
+        bb.update_entry(res.sides[0], self.providers, '0', 1, -1, None, None)
+        bb.update_entry(res.sides[0], self.providers, '1', 1, 100, 1.25, 'a')
+        self.assertEqual(0, res.sides[0].slots['1'])
+
+    def test_update_entry_grows_side(self):
+        res = bb.QuoteState(self.providers, capacity=2)
+        for i in range(5):
+            bb.update_entry(res.sides[1], self.providers, str(i), 1, 100 + i, 1.25 + i, 'a')
+        self.assertEqual(5, len(res))
+        self.assertEqual(8, len(res.sides[1].price))
+        self.assertEqual(104, res.to_dict()['S4']['size'])
+
 # flip_quotes
     def test_flip_quotes_bid_descending(self):
-        times, prices, sizes, providers = bb.flip_quotes(self.quotes, 0, True)
+        times, prices, sizes, providers = bb.flip_quotes(self.make_quotes(self.quotes), 0, True)
         self.assertEqual([1595336925000000, 1595336924000000, 1595336923000000], times)
         self.assertEqual([1.25, 1.24, 1.23], prices)
         self.assertEqual([300, 200, 100], sizes)
         self.assertEqual(['c', 'b', 'a'], providers)
 
     def test_flip_quotes_bid_ascending(self):
-        times, prices, sizes, providers = bb.flip_quotes(self.quotes, 0, False)
+        times, prices, sizes, providers = bb.flip_quotes(self.make_quotes(self.quotes), 0, False)
         self.assertEqual([1595336923000000, 1595336924000000, 1595336925000000], times)
         self.assertEqual([1.23, 1.24, 1.25], prices)
         self.assertEqual([100, 200, 300], sizes)
         self.assertEqual(['a', 'b', 'c'], providers)
 
     def test_flip_quotes_ask_descending(self):
-        times, prices, sizes, providers = bb.flip_quotes(self.quotes, 1, True)
+        times, prices, sizes, providers = bb.flip_quotes(self.make_quotes(self.quotes), 1, True)
         self.assertEqual([1595336924000000, 1595336923000000, 1595336922000000], times)
         self.assertEqual([2.34, 2.33, 2.32], prices)
         self.assertEqual([400, 300, 200], sizes)
         self.assertEqual(['b', 'b', 'c'], providers)
 
     def test_flip_quotes_ask_ascending(self):
-        times, prices, sizes, providers = bb.flip_quotes(self.quotes, 1, False)
+        times, prices, sizes, providers = bb.flip_quotes(self.make_quotes(self.quotes), 1, False)
         self.assertEqual([1595336922000000, 1595336923000000, 1595336924000000], times)
         self.assertEqual([2.32, 2.33, 2.34], prices)
         self.assertEqual([200, 300, 400], sizes)
@@ -526,8 +861,26 @@ class TestBookBuilderFuncs(unittest.TestCase):
             {'entry_type': 0, 'price': 1.24, 'size': 0.0, 'time': 1595336924000000, 'provider': 'b'},
             {'entry_type': 0, 'price': 1.25, 'size': 3.0, 'time': 1595336925000000, 'provider': 'c'},
         ]
-        times, prices, sizes, providers = bb.flip_quotes(quotes, 0, False)
+        times, prices, sizes, providers = bb.flip_quotes(self.make_quotes(quotes), 0, False)
         self.assertEqual([1595336923000000, 1595336925000000], times)
         self.assertEqual([1.23, 1.25], prices)
         self.assertEqual([5.0, 3.0], sizes)
         self.assertEqual(['a', 'c'], providers)
+
+    def test_flip_quotes_ties_keep_arrival_order(self):
+        quotes = [
+            {'entry_type': 1, 'price': 1.49, 'size': 5.0, 'time': 1595336923000000, 'provider': 'a'},
+            {'entry_type': 1, 'price': 1.49, 'size': 3.0, 'time': 1595336925000000, 'provider': 'b'},
+        ]
+        _, _, _, providers = bb.flip_quotes(self.make_quotes(quotes), 1, False)
+        self.assertEqual(['a', 'b'], providers)
+        _, _, _, providers = bb.flip_quotes(self.make_quotes(quotes), 1, True)
+        self.assertEqual(['b', 'a'], providers)
+
+# Providers
+    def test_providers(self):
+        self.assertEqual(0, self.providers.code(''))
+        self.assertEqual(1, self.providers.code('lp1'))
+        self.assertEqual(2, self.providers.code('lp2'))
+        self.assertEqual(1, self.providers.code('lp1'))
+        self.assertEqual(['', 'lp1', 'lp2'], self.providers.names)
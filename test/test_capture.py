@@ -0,0 +1,145 @@
+import os
+import struct
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+import app.bookbuilder as bb
+import app.capture as cp
+import app.filewriter as fw
+
+ITEMS = [
+    (1, 'EURUSD', [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'b']], True),
+    (2, 'EURUSD', [['0', None, 300.0, None, 2.35, None, 'b'],
+                   ['1', 100.0, None, 1.22, None, 'c', None]], False),
+    (3, 'USDJPY', [], False),
+    (4, 'USDJPY', [['x', 1e6, 2e6, 110.1, 110.2, 'a', 'a']], False),
+]
+
+
+class TestCaptureQueueClass(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'capture.bin')
+        self.queue = Mock()
+        self.capture = cp.CaptureQueue(self.queue, self.filename)
+
+    def tearDown(self):
+        self.capture.file.close()
+        self.directory.cleanup()
+
+    def test_put(self):
+        self.capture.put(ITEMS[0])
+        self.queue.put.assert_called_once_with(ITEMS[0], True, None)
+        self.assertEqual(1, self.capture.items)
+
+    def test_round_trip(self):
+        with patch('time.time_ns', side_effect=[10, 20, 30, 40]) as _:
+            for item in ITEMS:
+                self.capture.put(item)
+        self.capture.close()
+        captured = list(cp.read_capture(self.filename))
+        self.assertEqual([10, 20, 30, 40], [stamp for stamp, _ in captured])
+        self.assertEqual(ITEMS, [item for _, item in captured])
+
+    def test_strings_defined_once(self):
+        self.capture.put(ITEMS[0])
+        size = self.capture.file.tell()
+        self.capture.put(ITEMS[0])
+        # just the item record, its strings are known
+        self.assertEqual(1 + cp.ITEM_HEADER.size + struct.calcsize('<' + cp.ENTRY),
+                         self.capture.file.tell() - size)
+
+    def test_traced_item(self):
+        self.capture.put(ITEMS[0] + ((1, 2),))
+        self.capture.close()
+        self.assertEqual([ITEMS[0]], [item for _, item in cp.read_capture(self.filename)])
+
+    def test_partial_record(self):
+        for item in ITEMS:
+            self.capture.put(item)
+        self.capture.close()
+        with open(self.filename, 'r+b') as capture:
+            capture.truncate(os.path.getsize(self.filename) - 1)
+        with self.assertLogs('app.capture', 'WARNING'):
+            self.assertEqual(ITEMS[:3], [item for _, item in cp.read_capture(self.filename)])
+
+    def test_not_a_capture(self):
+        self.capture.close()
+        with open(self.filename, 'wb') as capture:
+            capture.write(b'PFBOOKS2')
+        self.assertRaises(ValueError, list, cp.read_capture(self.filename))
+
+    def test_empty_file(self):
+        self.capture.close()
+        open(self.filename, 'wb').close()
+        self.assertRaises(ValueError, list, cp.read_capture(self.filename))
+
+    def test_read_capture_maps_file(self):
+        for item in ITEMS:
+            self.capture.put(item)
+        self.capture.close()
+        with patch('mmap.mmap', wraps=cp.mmap.mmap) as mapped:
+            self.assertEqual(ITEMS, [item for _, item in cp.read_capture(self.filename)])
+            mapped.assert_called_once()
+
+
+class TestChecksumsClass(unittest.TestCase):
+
+    def test_update(self):
+        book = np.zeros(1, dtype=[('time', 'uint64')])
+        checksums = cp.Checksums()
+        checksums.update((1, bb.PROVIDERS, ('EURUSD', ('', 'a'))))
+        checksums.update((1, 'EURUSD', book))
+        self.assertEqual({'EURUSD': 1}, checksums.books)
+        other = cp.Checksums()
+        other.update((1, 'EURUSD', book))
+        self.assertNotEqual(checksums.total(), other.total())
+        book['time'] = 1
+        again = cp.Checksums()
+        again.update((1, bb.PROVIDERS, ('EURUSD', ('', 'a'))))
+        again.update((1, 'EURUSD', book))
+        self.assertNotEqual(checksums.total(), again.total())
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'capture.bin')
+        capture = cp.CaptureQueue(Mock(), self.filename)
+        # a second apart
+        with patch('time.time_ns', side_effect=[i * 10**9 for i in range(len(ITEMS))]) as _:
+            for item in ITEMS:
+                capture.put(item)
+        capture.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def replay(self, name, **kwargs):
+        return cp.replay(self.filename, builder_options={'max_levels': 2},
+                         writer_options={'file_path': os.path.join(self.directory.name, name),
+                                         'cache_size': 2, 'block_size': 4, 'layout': fw.RAW},
+                         **kwargs)
+
+    def test_replay(self):
+        items, duration, latencies, checksums = self.replay('first')
+        self.assertEqual(4, items)
+        self.assertEqual(4, len(latencies))
+        self.assertTrue(duration > 0)
+        self.assertEqual({'EURUSD': 2, 'USDJPY': 2}, checksums.books)
+        books = fw.read_books(os.path.join(self.directory.name, 'first', '1970-01-01',
+                                           'EURUSD.bin'))
+        self.assertEqual([1, 2], list(books['time']))
+        # same capture, same books
+        self.assertEqual(checksums.total(), self.replay('second')[3].total())
+
+    def test_replay_speed(self):
+        with patch('time.sleep') as sleep:
+            self.replay('paced', speed=2)
+            self.assertEqual(3, sleep.call_count)
+            self.assertAlmostEqual(0.5, sleep.call_args_list[0][0][0], places=1)
@@ -1,13 +1,25 @@
+import os
+import tempfile
 import unittest
-from unittest.mock import MagicMock, Mock, patch
+from unittest.mock import MagicMock, Mock, call, patch
 
 from queue import Empty
 
+import h5py
 import numpy as np
 
+import app.bookbuilder as bb
 import app.filewriter as fw
 
 
+class MockDatasetFile(dict):
+    """Datasets by name, with the attrs and filename of an h5py.File"""
+    def __init__(self, datasets, attrs=None):
+        super().__init__(datasets)
+        self.attrs = {} if attrs is None else attrs
+        self.filename = 'filename'
+
+
 class TestFileWriterClass(unittest.TestCase):
     def setUp(self):
         self.inbound_queue = Mock()
@@ -76,7 +88,9 @@ class TestFileWriterClass(unittest.TestCase):
 # process_item
     def test_process_item(self):
         self.filewriter.process_item((1, 'key', self.item))
-        self.assertEqual(self.item, self.filewriter.cache.get('key'))
+        self.assertEqual(self.cache_size, len(self.filewriter.cache.get('key')))
+        self.assertEqual(self.item, self.filewriter.cache.get('key')[:1])
+        self.assertEqual(1, self.filewriter.cache_cursor.get('key'))
 
     def test_process_item_flush_cache(self):
         with patch('app.filewriter.flush_cache') as flush_cache:
@@ -90,8 +104,9 @@ class TestFileWriterClass(unittest.TestCase):
             self.assertSequenceEqual(list(np.concatenate((self.item, self.item))), list(cache))
             self.assertEqual(self.file_path + '/1970-01-01/key.h5', filename)
             self.assertEqual(None, offset)
-            # cache empty
-            self.assertEqual(None, self.filewriter.cache.get('key'))
+            # cache empty, buffer is reused
+            self.assertEqual(0, self.filewriter.cache_cursor.get('key'))
+            self.assertIs(cache.base, self.filewriter.cache.get('key'))
 
     def test_process_item_new_date(self):
         with patch('app.filewriter.FileWriter.flush_cache_all') as flush_cache_all:
@@ -105,6 +120,56 @@ class TestFileWriterClass(unittest.TestCase):
             flush_cache_all.assert_not_called()
             self.assertEqual('1970-01-01', str(self.filewriter.file_date))
 
+    def test_process_item_late_book(self):
+        with patch('app.filewriter.flush_cache', side_effect=[1, 2, 1]) as flush_cache:
+            self.filewriter.process_item((86400000000, 'key', self.item))
+            # a late book of the previous day, then the current day again
+            self.filewriter.process_item((86399999999, 'key', self.item))
+            self.filewriter.process_item((86400000001, 'key', self.item))
+            self.filewriter.flush_cache_all()
+            self.assertEqual('1970-01-02', str(self.filewriter.file_date))
+            self.assertEqual([self.file_path + '/1970-01-02/key.h5',
+                              self.file_path + '/1970-01-01/key.h5',
+                              self.file_path + '/1970-01-02/key.h5'],
+                             [args[0][1] for args in flush_cache.call_args_list])
+            self.assertEqual([1, 1, 1], [len(args[0][0]) for args in flush_cache.call_args_list])
+            # each file has its own offset
+            self.assertEqual([None, None, 1], [args[0][2] for args in flush_cache.call_args_list])
+
+    def test_process_item_traced(self):
+        tracer = Mock()
+        self.filewriter.tracer = tracer
+        with patch('app.filewriter.flush_cache', return_value=2) as flush_cache:
+            with patch('app.filewriter.monotonic_ns', side_effect=[5000, 8000, 20000]) as _:
+                self.filewriter.process_item((1, 'key', self.item, (1000, 2000, 3000, 4000)))
+                self.filewriter.process_item((2, 'key', self.item, (2000, 3000, 4000, 6000)))
+            flush_cache.assert_called_once()
+        self.assertEqual([call('outbound', 'key', 4000, 5000), call('outbound', 'key', 6000, 8000)],
+                         tracer.record_since.call_args_list)
+        # per row, from the cache and from receipt to the flush
+        (flush, _, waited), (total, _, since_received) = \
+            [args[0] for args in tracer.record_all.call_args_list]
+        self.assertEqual(('flush', [15, 12]), (flush, list(waited)))
+        self.assertEqual(('total', [19, 18]), (total, list(since_received)))
+        self.assertEqual([], self.filewriter.stamps['key'])
+        self.assertEqual(2, self.filewriter.books)
+
+    def test_process_item_clock(self):
+        with patch('app.filewriter.FileWriter.flush_cache_all') as flush_cache_all:
+            self.filewriter.process_item((86400000000, fw.CLOCK, None))
+            flush_cache_all.assert_called_once()
+            self.assertEqual('1970-01-02', str(self.filewriter.file_date))
+            self.assertEqual({}, self.filewriter.cache)
+            self.assertEqual(0, self.filewriter.books)
+
+    def test_log_metrics(self):
+        self.filewriter.process_item((1, 'key', self.item))
+        self.assertEqual(1, self.filewriter.books)
+        with self.assertLogs('app.filewriter') as logs:
+            self.filewriter.log_metrics()
+        self.assertIn('filewriter took 1 books', logs.output[0])
+        self.assertEqual(0, self.filewriter.books)
+
 # flush_cache_all
     def test_flush_cache_all(self):
         with patch('app.filewriter.flush_cache') as flush_cache:
@@ -114,10 +179,111 @@ class TestFileWriterClass(unittest.TestCase):
             flush_cache.assert_not_called()
             self.filewriter.flush_cache_all()
             self.assertEqual(2, len(flush_cache.call_args_list))
-            self.assertEqual(None, self.filewriter.cache['key'])
-            self.assertEqual(None, self.filewriter.cache['key2'])
-            self.assertEqual(None, self.filewriter.file_offset['key'])
-            self.assertEqual(None, self.filewriter.file_offset['key2'])
+            self.assertEqual(1, len(flush_cache.call_args[0][0]))
+            self.assertEqual(0, self.filewriter.cache_cursor['key'])
+            self.assertEqual(0, self.filewriter.cache_cursor['key2'])
+            self.assertEqual({}, self.filewriter.flusher.file_offset)
+
+    def test_flush_cache_all_closes_files(self):
+        self.filewriter.flusher.files = Mock()
+        self.filewriter.flush_cache_all()
+        self.filewriter.flusher.files.close_all.assert_called_once()
+
+# flush threads
+    def test_flush_thread(self):
+        with patch('os.path.isdir', side_effect=[True]) as _:
+            filewriter = fw.FileWriter(self.inbound_queue, self.shutdown_event,
+                                       self.cache_size, self.block_size,
+                                       file_path=self.file_path, flush_threads=1)
+        self.inbound_queue.get = Mock(side_effect=Empty)
+        with patch('app.filewriter.flush_cache', side_effect=[2, 3]) as flush_cache:
+            first = filewriter.cache.get('key')
+            filewriter.process_item((1, 'key', self.item))
+            filewriter.process_item((2, 'key', self.item))
+            # carries on in a fresh buffer while the full one is written
+            self.assertIsNot(first, filewriter.cache.get('key'))
+            filewriter.process_item((3, 'key', self.item))
+            filewriter.shutdown()
+            self.assertFalse(filewriter.workers[0].is_alive())
+            self.assertEqual(2, len(flush_cache.call_args_list))
+            cache, filename, offset = flush_cache.call_args_list[0][0]
+            self.assertEqual(2, len(cache))
+            self.assertEqual(self.file_path + '/1970-01-01/key.h5', filename)
+            self.assertEqual(None, offset)
+            cache, _, offset = flush_cache.call_args_list[1][0]
+            self.assertEqual(1, len(cache))
+            self.assertEqual(2, offset)
+            # full buffers are handed back for reuse
+            self.assertEqual(2, len(filewriter.spare['key']))
+
+    def test_flush_thread_rollover(self):
+        with patch('os.path.isdir', side_effect=[True]) as _:
+            filewriter = fw.FileWriter(self.inbound_queue, self.shutdown_event,
+                                       self.cache_size, self.block_size,
+                                       file_path=self.file_path, flush_threads=2)
+        self.inbound_queue.get = Mock(side_effect=Empty)
+        with patch('app.filewriter.flush_cache', side_effect=[1, 1]) as flush_cache:
+            filewriter.process_item((1, 'key', self.item))
+            filewriter.process_item((86400000000, 'key', self.item))
+            filewriter.shutdown()
+            filenames = [args[0][1] for args in flush_cache.call_args_list]
+            self.assertEqual([self.file_path + '/1970-01-01/key.h5',
+                              self.file_path + '/1970-01-02/key.h5'], filenames)
+            # offset of the previous day is not carried over
+            self.assertEqual([None, None], [args[0][2] for args in flush_cache.call_args_list])
+
+    def test_flush_thread_retries(self):
+        with patch('os.path.isdir', side_effect=[True]) as _:
+            filewriter = fw.FileWriter(self.inbound_queue, self.shutdown_event,
+                                       self.cache_size, self.block_size,
+                                       file_path=self.file_path, flush_threads=1)
+        filewriter.workers[0].retry_delay = 0
+        self.inbound_queue.get = Mock(side_effect=Empty)
+        with patch('app.filewriter.flush_cache', side_effect=[OSError('busy'), 2]) as flush_cache:
+            filewriter.process_item((1, 'key', self.item))
+            filewriter.process_item((2, 'key', self.item))
+            with self.assertLogs('app.filewriter', level='WARNING') as logs:
+                filewriter.shutdown()
+            self.assertIn('retrying', logs.output[0])
+            # the same rows to the same place again
+            self.assertEqual(flush_cache.call_args_list[0], flush_cache.call_args_list[1])
+            self.assertEqual(2, len(flush_cache.call_args_list))
+            self.assertIsNone(filewriter.workers[0].error)
+            self.assertEqual(1, len(filewriter.spare['key']))
+
+    def test_flush_thread_failure(self):
+        with patch('os.path.isdir', side_effect=[True]) as _:
+            filewriter = fw.FileWriter(self.inbound_queue, self.shutdown_event,
+                                       self.cache_size, self.block_size,
+                                       file_path=self.file_path, flush_threads=1)
+        worker = filewriter.workers[0]
+        worker.retry_delay = 0
+        self.inbound_queue.get = Mock(side_effect=Empty)
+        with patch('app.filewriter.flush_cache', side_effect=OSError('disk full')) as flush_cache:
+            with self.assertLogs('app.filewriter', level='WARNING'):
+                filewriter.process_item((1, 'key', self.item))
+                filewriter.process_item((2, 'key', self.item))
+                worker.join(5)
+            self.assertFalse(worker.is_alive())
+            self.assertEqual(worker.retries + 1, len(flush_cache.call_args_list))
+            self.assertIsInstance(worker.error, OSError)
+            # the rows it could not write are not reused
+            self.assertEqual(0, len(filewriter.spare['key']))
+            # nor is the failure ignored
+            filewriter.process_item((3, 'key', self.item))
+            with self.assertRaises(RuntimeError):
+                filewriter.process_item((4, 'key', self.item))
+            with self.assertRaises(RuntimeError):
+                filewriter.shutdown()
+
+    def test_flush_logs_metrics(self):
+        self.filewriter.stats_interval = 0
+        with patch('app.filewriter.flush_cache', return_value=2):
+            with self.assertLogs('app.filewriter') as logs:
+                self.filewriter.process_item((1, 'key', self.item))
+                self.filewriter.process_item((2, 'key', self.item))
+        self.assertIn('filewriter took 2 books', logs.output[0])
+        self.assertIn('filewriter flushed 1 caches', logs.output[1])
 
 # get_filename
     def test_get_filename(self):
@@ -138,10 +304,16 @@ class TestFileWriterFunctions(unittest.TestCase):
                                'filename',
                                None)
                 write_to_new_dataset_file.assert_called_once()
-                dataset, filename, _ = write_to_new_dataset_file.call_args[0]
+                dataset, filename, _, _ = write_to_new_dataset_file.call_args[0]
                 self.assertEqual(None, dataset)
                 self.assertEqual('filename', filename)
 
+    def test_flush_no_offset_new_compound_file(self):
+        with patch('os.path.exists', side_effect=[False]) as _:
+            with patch('app.filewriter.write_to_new_compound_file') as write_to_new_compound_file:
+                fw.flush_cache(None, 'filename', None, layout=fw.COMPOUND)
+                write_to_new_compound_file.assert_called_once()
+
     def test_flush_no_offset_existing_file(self):
         with patch('os.path.exists', side_effect=[True]) as _:
             with patch('app.filewriter.get_file_offset', side_effect=[123]) as get_file_offset:
@@ -169,6 +341,23 @@ class TestFileWriterFunctions(unittest.TestCase):
             self.assertEqual('filename', filename)
             self.assertEqual(123, offset)
 
+    def test_flush_offset_files(self):
+        files = Mock()
+        files.get = Mock(return_value='datasets')
+        files.attrs = Mock(return_value='attrs')
+        entry = np.zeros(2)
+        with patch('app.filewriter.write_to_datasets', return_value=125) as write_to_datasets:
+            with patch('app.filewriter.write_to_existing_dataset_file') as write_to_existing_dataset_file:
+                res = fw.flush_cache(entry, 'filename', 123, files=files)
+                self.assertEqual(125, res)
+                files.get.assert_called_once_with('filename')
+                write_to_existing_dataset_file.assert_not_called()
+                dataset, datasets, offset, _, attrs = write_to_datasets.call_args[0]
+                self.assertIs(entry, dataset)
+                self.assertEqual('datasets', datasets)
+                self.assertEqual(123, offset)
+                self.assertEqual('attrs', attrs)
+
 # write_to_new_dataset_file
     def test_write_to_new_dataset_file(self):
         with patch('h5py.File') as _:
@@ -176,31 +365,70 @@ class TestFileWriterFunctions(unittest.TestCase):
                 res = fw.write_to_new_dataset_file(self.entry, '/dummy/path/filename')
                 self.assertEqual(1, res)
 
+    def test_write_to_new_dataset_file_options(self):
+        with patch('h5py.File') as mock:
+            with patch('os.makedirs') as _:
+                options = fw.dataset_options('gzip', 4, True, 128)
+                fw.write_to_new_dataset_file(self.entry, '/dummy/path/filename', 256, options)
+                dataset_file = mock.return_value.__enter__.return_value
+                self.assertEqual(3, len(dataset_file.create_dataset.call_args_list))
+                _, kwargs = dataset_file.create_dataset.call_args
+                self.assertEqual((128,), kwargs['chunks'])
+                self.assertEqual('gzip', kwargs['compression'])
+                self.assertEqual(4, kwargs['compression_opts'])
+                self.assertTrue(kwargs['shuffle'])
+
+# dataset_options
+    def test_dataset_options(self):
+        self.assertEqual({'chunks': True}, fw.dataset_options())
+        self.assertEqual({'chunks': (1024,), 'compression': 'lzf', 'shuffle': True},
+                         fw.dataset_options('lzf', shuffle=True, chunk_rows=1024))
+
+    def test_dataset_options_invalid(self):
+        self.assertRaises(ValueError, fw.dataset_options, 'zstd')
+        self.assertRaises(ValueError, fw.dataset_options, 'lzf', 4)
+        self.assertRaises(ValueError, fw.dataset_options, 'none', 4)
+
+    def test_dataset_options_gzip_level(self):
+        self.assertEqual(0, fw.dataset_options('gzip', 0)['compression_opts'])
+        self.assertEqual(9, fw.dataset_options('gzip', 9)['compression_opts'])
+        self.assertRaises(ValueError, fw.dataset_options, 'gzip', -1)
+        self.assertRaises(ValueError, fw.dataset_options, 'gzip', 10)
+        self.assertRaises(ValueError, fw.dataset_options, 'gzip', 12)
+
+    def test_dataset_options_chunk_rows(self):
+        self.assertEqual((1,), fw.dataset_options(chunk_rows=1)['chunks'])
+        self.assertRaises(ValueError, fw.dataset_options, chunk_rows=0)
+        self.assertRaises(ValueError, fw.dataset_options, chunk_rows=-5)
+
 # write_to_existing_dataset_file
     def test_write_to_existing_dataset_file(self):
         mock_column = MagicMock()
         mock_column.len = Mock(return_value=4)
-        mock_dataset_file = lambda x: {
+        attrs = {}
+        mock_dataset_file = lambda x: MockDatasetFile({
             'time': mock_column,
             'a': mock_column,
             'b': mock_column,
             'c': mock_column,
-        }
+        }, attrs)
         with patch('h5py.File') as mock:
             mock.return_value.__enter__ = mock_dataset_file
             res = fw.write_to_existing_dataset_file(self.entry, 'filename', 2)
             self.assertEqual(3, res)
+            self.assertEqual({fw.ROWS: 3}, attrs)
             mock_column.resize.assert_not_called()
 
     def test_write_to_existing_dataset_file_needs_resizing(self):
         mock_column = MagicMock()
         mock_column.len = Mock(return_value=4)
-        mock_dataset_file = lambda x: {
+        attrs = {}
+        mock_dataset_file = lambda x: MockDatasetFile({
             'time': mock_column,
             'a': mock_column,
             'b': mock_column,
             'c': mock_column,
-        }
+        }, attrs)
         with patch('h5py.File') as mock:
             mock.return_value.__enter__ = mock_dataset_file
             res = fw.write_to_existing_dataset_file(self.entry, 'filename', 3, 10)
@@ -208,31 +436,223 @@ class TestFileWriterFunctions(unittest.TestCase):
             new_size, _ = mock_column.resize.call_args
             self.assertEqual((14,), new_size)
 
+# write_to_datasets
+    def test_write_to_datasets(self):
+        datasets = {name: MagicMock() for name in ('time', 'a', 'b', 'c')}
+        datasets['time'].len = Mock(return_value=4)
+        res = fw.write_to_datasets(self.entry, datasets, 2)
+        self.assertEqual(3, res)
+        datasets['a'].__setitem__.assert_called_once()
+        self.assertEqual(slice(2, 3), datasets['a'].__setitem__.call_args[0][0])
+        datasets['a'].resize.assert_not_called()
+
+    def test_write_to_datasets_compound(self):
+        book = MagicMock()
+        book.len = Mock(return_value=3)
+        res = fw.write_to_datasets(self.entry, {fw.BOOK: book}, 2, 10)
+        self.assertEqual(3, res)
+        book.resize.assert_called_once_with(13, axis=0)
+        index, value = book.__setitem__.call_args[0]
+        self.assertEqual(slice(2, 3), index)
+        self.assertIs(self.entry, value)
+
 # add_cache_entry
     def test_add_cache_entry_no_entries(self):
-        res = fw.add_cache_entry(None, self.entry)
-        self.assertEqual(1, len(res))
+        cache = np.zeros(4, dtype=self.entry.dtype)
+        self.entry['a'] = 1
+        res = fw.add_cache_entry(cache, 0, self.entry)
+        self.assertEqual(1, res)
+        self.assertEqual([1, 0, 0, 0], list(cache['a']))
 
     def test_add_cache_entry_single_entry(self):
-        res = fw.add_cache_entry(self.entry, self.entry)
-        self.assertEqual(2, len(res))
+        cache = np.zeros(4, dtype=self.entry.dtype)
+        self.entry['b'] = 2
+        res = fw.add_cache_entry(cache, 1, self.entry)
+        self.assertEqual(2, res)
+        self.assertEqual([0, 2, 0, 0], list(cache['b']))
 
     def test_add_cache_entry_multiple_entries(self):
-        res = fw.add_cache_entry(np.concatenate((self.entry, self.entry, self.entry)), self.entry)
-        self.assertEqual(4, len(res))
+        cache = np.zeros(4, dtype=self.entry.dtype)
+        res = fw.add_cache_entry(cache, 1, np.concatenate((self.entry, self.entry, self.entry)))
+        self.assertEqual(4, res)
 
 # get_file_offset
     def test_get_file_offset(self):
-        mock_dataset_file = lambda x: {'time': np.array([1, 2, 3, 4, 0, 0, 0, 0])}
+        mock_dataset_file = lambda x: MockDatasetFile({'time': np.array([1, 2, 3, 4, 0, 0, 0, 0])})
         with patch('h5py.File') as mock:
             mock.return_value.__enter__ = mock_dataset_file
             res = fw.get_file_offset('filename', 'time')
             self.assertEqual(4, res)
 
     def test_get_file_offset_empty(self):
-        mock_dataset_file = lambda x: {'time': np.array([0, 0, 0, 0, 0, 0, 0, 0])}
+        mock_dataset_file = lambda x: MockDatasetFile({'time': np.array([0, 0, 0, 0, 0, 0, 0, 0])})
 
         with patch('h5py.File') as mock:
             mock.return_value.__enter__ = mock_dataset_file
             res = fw.get_file_offset('filename', 'time')
             self.assertEqual(0, res)
+
+    def test_get_file_offset_rows_attribute(self):
+        # zero times are not mistaken for the end of the data
+        mock_dataset_file = lambda x: MockDatasetFile({'time': np.array([1, 2, 0, 4, 5, 0, 0, 0])},
+                                                      {fw.ROWS: 5})
+        with patch('h5py.File') as mock:
+            mock.return_value.__enter__ = mock_dataset_file
+            res = fw.get_file_offset('filename', 'time')
+            self.assertEqual(5, res)
+
+
+class TestFilePoolClass(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = fw.FilePool(2)
+
+    def test_get(self):
+        with patch('h5py.File') as h5file:
+            h5file.return_value.__iter__ = Mock(return_value=iter(['time', 'a']))
+            datasets = self.pool.get('one.h5')
+            self.assertEqual(['time', 'a'], list(datasets))
+            self.assertIs(datasets, self.pool.get('one.h5'))
+            h5file.assert_called_once_with('one.h5', 'a')
+            self.assertEqual(1, len(self.pool))
+
+    def test_get_chunk_cache_size(self):
+        pool = fw.FilePool(2, chunk_cache_size=4194304)
+        with patch('h5py.File') as h5file:
+            pool.get('one.h5')
+            h5file.assert_called_once_with('one.h5', 'a', rdcc_nbytes=4194304)
+
+    def test_get_evicts_least_recently_used(self):
+        handles = {name: MagicMock() for name in ('one.h5', 'two.h5', 'three.h5')}
+        with patch('h5py.File', side_effect=lambda name, mode: handles[name]):
+            self.pool.get('one.h5')
+            self.pool.get('two.h5')
+            self.pool.get('one.h5')
+            self.pool.get('three.h5')
+            handles['two.h5'].close.assert_called_once()
+            handles['one.h5'].close.assert_not_called()
+            self.assertEqual(['one.h5', 'three.h5'], list(self.pool.files))
+
+    def test_close_all(self):
+        handle = MagicMock()
+        with patch('h5py.File', return_value=handle):
+            self.pool.get('one.h5')
+            self.pool.get('two.h5')
+            self.pool.close_all()
+            self.assertEqual(2, len(handle.close.call_args_list))
+            self.assertEqual(0, len(self.pool))
+
+
+class TestFileLayouts(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.dtype = [('time', 'uint64'), ('bid_px0', 'float64'), ('bid_provider0', 'uint16')]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_books(self, layout, options=None):
+        file_path = os.path.join(self.directory.name, layout)
+        filewriter = fw.FileWriter(Mock(), Mock(), cache_size=2, block_size=4,
+                                   file_path=file_path, layout=layout,
+                                   options=options, chunk_cache_size=65536)
+        for i in range(1, 8):
+            book = np.array([(i, i / 10, 1)], dtype=self.dtype)
+            filewriter.process_item((i, 'key', book))
+        filewriter.flush_cache_all()
+        return os.path.join(file_path, '1970-01-01', 'key' + fw.EXTENSIONS[layout])
+
+    def check_books(self, filename):
+        books = fw.read_books(filename)
+        self.assertEqual(np.dtype(self.dtype), books.dtype)
+        self.assertEqual(list(range(1, 8)), list(books['time']))
+        self.assertEqual(0.7, books['bid_px0'][-1])
+        self.assertEqual([2, 3], list(fw.read_books(filename, 1, 3)['time']))
+        self.assertEqual(7, fw.get_file_offset(filename))
+        with h5py.File(filename, 'r') as dataset_file:
+            self.assertEqual(7, dataset_file.attrs[fw.ROWS])
+
+    def test_columns(self):
+        self.check_books(self.write_books(fw.COLUMNS))
+
+    def test_compound(self):
+        filename = self.write_books(fw.COMPOUND)
+        with h5py.File(filename, 'r') as dataset_file:
+            self.assertEqual([fw.BOOK], list(dataset_file))
+        self.check_books(filename)
+
+    def test_raw(self):
+        filename = self.write_books(fw.RAW)
+        self.assertTrue(filename.endswith('.bin'))
+        books = fw.read_books(filename)
+        self.assertIsInstance(books, np.memmap)
+        self.assertEqual(np.dtype(self.dtype), books.dtype)
+        self.assertEqual(list(range(1, 8)), list(books['time']))
+        self.assertEqual([2, 3], list(fw.read_books(filename, 1, 3)['time']))
+
+    def test_raw_dtype_mismatch(self):
+        filename = self.write_books(fw.RAW)
+        self.assertRaises(ValueError, fw.open_raw_file, filename, np.dtype([('time', 'uint64')]))
+
+    def test_compressed(self):
+        for layout in (fw.COLUMNS, fw.COMPOUND):
+            with self.subTest(layout=layout):
+                options = fw.dataset_options('gzip', 1, True, 3)
+                filename = self.write_books(layout, options)
+                self.check_books(filename)
+                with h5py.File(filename, 'r') as dataset_file:
+                    dataset = dataset_file[fw.BOOK if layout == fw.COMPOUND else 'time']
+                    self.assertEqual('gzip', dataset.compression)
+                    self.assertEqual((3,), dataset.chunks)
+
+    def test_providers(self):
+        for layout in fw.LAYOUTS:
+            with self.subTest(layout=layout):
+                file_path = os.path.join(self.directory.name, 'providers', layout)
+                filewriter = fw.FileWriter(Mock(), Mock(), cache_size=2, block_size=4,
+                                           file_path=file_path, layout=layout)
+                filewriter.process_item((1, bb.PROVIDERS, ('key', ('', 'lp1'))))
+                for i in range(1, 4):
+                    filewriter.process_item((i, 'key', np.array([(i, i / 10, 1)], dtype=self.dtype)))
+                filename = filewriter.get_filename('key')
+                self.assertEqual(['', 'lp1'], fw.read_providers(filename))
+                filewriter.process_item((4, bb.PROVIDERS, ('key', ('', 'lp1', 'lp2'))))
+                filewriter.process_item((4, 'key', np.array([(4, 0.4, 2)], dtype=self.dtype)))
+                filewriter.flush_cache_all()
+                self.assertEqual(['', 'lp1', 'lp2'], fw.read_providers(filename))
+                self.assertEqual([1, 1, 1, 2], list(fw.read_books(filename)['bid_provider0']))
+
+    def test_providers_after_restart(self):
+        def write(filewriter, time, names, code):
+            filewriter.process_item((time, bb.PROVIDERS, ('key', names)))
+            filewriter.process_item((time, 'key', np.array([(time, 0.1, code)], dtype=self.dtype)))
+
+        for layout in fw.LAYOUTS:
+            with self.subTest(layout=layout):
+                file_path = os.path.join(self.directory.name, 'restart', layout)
+                filewriter = fw.FileWriter(Mock(), Mock(), cache_size=2, block_size=4,
+                                           file_path=file_path, layout=layout)
+                write(filewriter, 1, ('', 'LP_A'), 1)
+                write(filewriter, 2, ('', 'LP_A', 'LP_B'), 2)
+                filewriter.flush_cache_all()
+                # a new session numbers its providers afresh
+                filewriter = fw.FileWriter(Mock(), Mock(), cache_size=2, block_size=4,
+                                           file_path=file_path, layout=layout)
+                write(filewriter, 3, ('', 'LP_B'), 1)
+                write(filewriter, 4, ('', 'LP_B', 'LP_A'), 2)
+                write(filewriter, 5, ('', 'LP_B', 'LP_A', 'LP_C'), 3)
+                filewriter.flush_cache_all()
+                filename = filewriter.get_filename('key')
+                names = fw.read_providers(filename)
+                self.assertEqual(['', 'LP_A', 'LP_B', 'LP_C'], names)
+                self.assertEqual(['LP_A', 'LP_B', 'LP_B', 'LP_A', 'LP_C'],
+                                 [names[code] for code in fw.read_books(filename)['bid_provider0']])
+
+    def test_merge_providers(self):
+        self.assertEqual((['', 'a', 'b'], None), fw.merge_providers([], ('', 'a', 'b')))
+        self.assertEqual((['', 'a', 'b'], None), fw.merge_providers(['', 'a'], ('', 'a', 'b')))
+        self.assertEqual((['', 'a', 'b'], None), fw.merge_providers(['', 'a', 'b'], ('', 'a')))
+        names, codes = fw.merge_providers(['', 'a', 'b'], ('', 'c', 'b'))
+        self.assertEqual(['', 'a', 'b', 'c'], names)
+        self.assertEqual([0, 3, 2], list(codes))
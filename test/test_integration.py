@@ -23,6 +23,19 @@ class TestIntegrationClass(unittest.TestCase):
         self.bookbuilder = bb.BookBuilder(self.pricefeed_queue, self.filewriter_queue,
                                           self.shutdown_event, self.shutdown_consumer,
                                           max_levels=3)
+        self.names = {}
+
+    def next_book(self):
+        """Next book on the bookbuilder's outbound queue, keeping any provider
+        names sent ahead of it"""
+        while True:
+            time, symbol, book = self.bookbuilder.outbound_queue.get()
+            if symbol != bb.PROVIDERS:
+                return time, symbol, book
+            self.names[book[0]] = book[1]
+
+    def provider(self, symbol, code):
+        return self.names[symbol][code]
 
 # 1.) logon
 
@@ -52,35 +65,35 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2000000.0, 2000000.0, 2.48, 2.51, '0', '0'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217156000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965217156000, book['time'])
         self.assertEqual(1616965217156000, book['bid_time0'])
         self.assertEqual(2.49, book['bid_px0'])
         self.assertEqual(1000000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217156000, book['bid_time1'])
         self.assertEqual(2.48, book['bid_px1'])
         self.assertEqual(2000000, book['bid_size1'])
-        self.assertEqual(b'0', book['bid_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # asks
         self.assertEqual(1616965217156000, book['ask_time0'])
         self.assertEqual(2.50, book['ask_px0'])
         self.assertEqual(1000000, book['ask_size0'])
-        self.assertEqual(b'0', book['ask_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217156000, book['ask_time1'])
         self.assertEqual(2.51, book['ask_px1'])
         self.assertEqual(2000000, book['ask_size1'])
-        self.assertEqual(b'0', book['ask_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         np.savetxt('/tmp/book_eurusd_0001.csv', book, delimiter=',', fmt='%s')
 
     # USD/CAD
@@ -96,35 +109,35 @@ class TestIntegrationClass(unittest.TestCase):
             ['0', 1000000.0, 1000000.0, 1.49, 1.50, '0', '1'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217156000, time)
         self.assertEqual('USDCAD', symbol)
         self.assertEqual(1616965217156000, book['time'])
         self.assertEqual(1616965217156000, book['bid_time0'])
         self.assertEqual(1.49, book['bid_px0'])
         self.assertEqual(1000000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217156000, book['bid_time1'])
         self.assertEqual(1.48, book['bid_px1'])
         self.assertEqual(2000000, book['bid_size1'])
-        self.assertEqual(b'1', book['bid_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # asks
         self.assertEqual(1616965217156000, book['ask_time0'])
         self.assertEqual(1.50, book['ask_px0'])
         self.assertEqual(1000000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217156000, book['ask_time1'])
         self.assertEqual(1.51, book['ask_px1'])
         self.assertEqual(2000000, book['ask_size1'])
-        self.assertEqual(b'0', book['ask_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         np.savetxt('/tmp/book_usdcad_0002.csv', book, delimiter=',', fmt='%s')
 
 # 4.) i
@@ -151,35 +164,35 @@ class TestIntegrationClass(unittest.TestCase):
                 ['1', 1100000.0, 2200000.0, 2.46, 2.48, '1', '1'],
             ], False), item)
             self.bookbuilder.process_item(item)
-            time, symbol, book = self.bookbuilder.outbound_queue.get()
+            time, symbol, book = self.next_book()
             self.assertEqual(1616965217157000, time)
             self.assertEqual('EURUSD', symbol)
             self.assertEqual(1616965217157000, book['time'])
             self.assertEqual(1616965217157000, book['bid_time0'])
             self.assertEqual(2.47, book['bid_px0'])
             self.assertEqual(1100000, book['bid_size0'])
-            self.assertEqual(b'0', book['bid_provider0'][0])
+            self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
             self.assertEqual(1616965217157000, book['bid_time1'])
             self.assertEqual(2.46, book['bid_px1'])
             self.assertEqual(1100000, book['bid_size1'])
-            self.assertEqual(b'1', book['bid_provider1'][0])
+            self.assertEqual('1', self.provider(symbol, book['bid_provider1'][0]))
             self.assertEqual(0, book['bid_time2'])
             self.assertEqual(0, book['bid_px2'])
             self.assertEqual(0, book['bid_size2'])
-            self.assertEqual(b'', book['bid_provider2'][0])
+            self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
             # asks
             self.assertEqual(1616965217157000, book['ask_time0'])
             self.assertEqual(2.48, book['ask_px0'])
             self.assertEqual(2200000, book['ask_size0'])
-            self.assertEqual(b'1', book['ask_provider0'][0])
+            self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
             self.assertEqual(1616965217157000, book['ask_time1'])
             self.assertEqual(2.49, book['ask_px1'])
             self.assertEqual(2200000, book['ask_size1'])
-            self.assertEqual(b'0', book['ask_provider1'][0])
+            self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
             self.assertEqual(0, book['ask_time2'])
             self.assertEqual(0, book['ask_px2'])
             self.assertEqual(0, book['ask_size2'])
-            self.assertEqual(b'', book['ask_provider2'][0])
+            self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
             np.savetxt('/tmp/book_eurusd_0003.csv', book, delimiter=',', fmt='%s')
 
 # update all entries for 2 crosses
@@ -205,35 +218,35 @@ class TestIntegrationClass(unittest.TestCase):
                 ['1', 2300000.0, 2300000.0, 2.45, 2.48, '0', '0'],
             ], False), item)
             self.bookbuilder.process_item(item)
-            time, symbol, book = self.bookbuilder.outbound_queue.get()
+            time, symbol, book = self.next_book()
             self.assertEqual(1616965217159000, time)
             self.assertEqual('EURUSD', symbol)
             self.assertEqual(1616965217159000, book['time'])
             self.assertEqual(1616965217159000, book['bid_time0'])
             self.assertEqual(2.46, book['bid_px0'])
             self.assertEqual(1200000, book['bid_size0'])
-            self.assertEqual(b'1', book['bid_provider0'][0])
+            self.assertEqual('1', self.provider(symbol, book['bid_provider0'][0]))
             self.assertEqual(1616965217159000, book['bid_time1'])
             self.assertEqual(2.45, book['bid_px1'])
             self.assertEqual(2300000, book['bid_size1'])
-            self.assertEqual(b'0', book['bid_provider1'][0])
+            self.assertEqual('0', self.provider(symbol, book['bid_provider1'][0]))
             self.assertEqual(0, book['bid_time2'])
             self.assertEqual(0, book['bid_px2'])
             self.assertEqual(0, book['bid_size2'])
-            self.assertEqual(b'', book['bid_provider2'][0])
+            self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
             # asks
             self.assertEqual(1616965217159000, book['ask_time0'])
             self.assertEqual(2.47, book['ask_px0'])
             self.assertEqual(1200000, book['ask_size0'])
-            self.assertEqual(b'1', book['ask_provider0'][0])
+            self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
             self.assertEqual(1616965217159000, book['ask_time1'])
             self.assertEqual(2.48, book['ask_px1'])
             self.assertEqual(2300000, book['ask_size1'])
-            self.assertEqual(b'0', book['ask_provider1'][0])
+            self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
             self.assertEqual(0, book['ask_time2'])
             self.assertEqual(0, book['ask_px2'])
             self.assertEqual(0, book['ask_size2'])
-            self.assertEqual(b'', book['ask_provider2'][0])
+            self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
             np.savetxt('/tmp/book_eurusd_0004.csv', book, delimiter=',', fmt='%s')
             # second quoteset
             item = self.pricefeed.queue.get()
@@ -242,35 +255,35 @@ class TestIntegrationClass(unittest.TestCase):
                 ['1', 2200000.0, 1100000.0, 1.46, 1.49, '1', '1'],
             ], False), item)
             self.bookbuilder.process_item(item)
-            time, symbol, book = self.bookbuilder.outbound_queue.get()
+            time, symbol, book = self.next_book()
             self.assertEqual(1616965217159000, time)
             self.assertEqual('USDCAD', symbol)
             self.assertEqual(1616965217159000, book['time'])
             self.assertEqual(1616965217159000, book['bid_time0'])
             self.assertEqual(1.47, book['bid_px0'])
             self.assertEqual(2200000, book['bid_size0'])
-            self.assertEqual(b'0', book['bid_provider0'][0])
+            self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
             self.assertEqual(1616965217159000, book['bid_time1'])
             self.assertEqual(1.46, book['bid_px1'])
             self.assertEqual(2200000, book['bid_size1'])
-            self.assertEqual(b'1', book['bid_provider1'][0])
+            self.assertEqual('1', self.provider(symbol, book['bid_provider1'][0]))
             self.assertEqual(0, book['bid_time2'])
             self.assertEqual(0, book['bid_px2'])
             self.assertEqual(0, book['bid_size2'])
-            self.assertEqual(b'', book['bid_provider2'][0])
+            self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
             # asks
             self.assertEqual(1616965217159000, book['ask_time0'])
             self.assertEqual(1.49, book['ask_px0'])
             self.assertEqual(1100000, book['ask_size0'])
-            self.assertEqual(b'0', book['ask_provider0'][0])
+            self.assertEqual('0', self.provider(symbol, book['ask_provider0'][0]))
             self.assertEqual(1616965217159000, book['ask_time1'])
             self.assertEqual(1.49, book['ask_px1'])
             self.assertEqual(1100000, book['ask_size1'])
-            self.assertEqual(b'1', book['ask_provider1'][0])
+            self.assertEqual('1', self.provider(symbol, book['ask_provider1'][0]))
             self.assertEqual(0, book['ask_time2'])
             self.assertEqual(0, book['ask_px2'])
             self.assertEqual(0, book['ask_size2'])
-            self.assertEqual(b'', book['ask_provider2'][0])
+            self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
             np.savetxt('/tmp/book_usdcad_0004.csv', book, delimiter=',', fmt='%s')
 
 # update bid for 1 cross:
@@ -283,12 +296,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [0] 1200000 @ 2.44*lp1 | [1] 2300000 @ 2.48 lp0
     def test_incremental_book_bid_price(self):
         # hack but we dont want to keep state so...
-        self.bookbuilder.quotes['EURUSD'] = {
+        self.bookbuilder.quotes['EURUSD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 2.46, 'size': 1200000.0, 'provider': '1', 'time': 1616965217159000},
             'S0': {'entry_type': 1, 'price': 2.47, 'size': 1200000.0, 'provider': '1', 'time': 1616965217159000},
             'B1': {'entry_type': 0, 'price': 2.45, 'size': 2300000.0, 'provider': '0', 'time': 1616965217159000},
             'S1': {'entry_type': 1, 'price': 2.48, 'size': 2300000.0, 'provider': '0', 'time': 1616965217159000}
-        }
+        }, self.bookbuilder.providers_of('EURUSD'))
 
         msg = fix.Message('8=FIX.4.4|9=91|35=i|34=6|49=XC461|52=20210328-21:00:17.160|56=Q000|296=1|302=0|295=1|299=0|106=1|188=2.44|10=0|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.active_subscriptions['0'] = 'EURUSD'
@@ -299,35 +312,35 @@ class TestIntegrationClass(unittest.TestCase):
         ], False), item)
         # only bids updated
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217160000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965217160000, book['time'])
         self.assertEqual(1616965217159000, book['bid_time0'])
         self.assertEqual(2.45, book['bid_px0'])
         self.assertEqual(2300000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217160000, book['bid_time1'])
         self.assertEqual(2.44, book['bid_px1'])
         self.assertEqual(1200000, book['bid_size1'])
-        self.assertEqual(b'1', book['bid_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # no change to asks
         self.assertEqual(1616965217159000, book['ask_time0'])
         self.assertEqual(2.47, book['ask_px0'])
         self.assertEqual(1200000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217159000, book['ask_time1'])
         self.assertEqual(2.48, book['ask_px1'])
         self.assertEqual(2300000, book['ask_size1'])
-        self.assertEqual(b'0', book['ask_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         np.savetxt('/tmp/book_eurusd_0005.csv', book, delimiter=',', fmt='%s')
 
 ## update bid qty for 1 cross (id 1)
@@ -338,12 +351,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [0] 1200000 @ 2.44 lp1 | [1] 2300000 @ 2.48 lp0
     def test_incremental_book_bid_qty(self):
         # restore book state
-        self.bookbuilder.quotes['EURUSD'] = {
+        self.bookbuilder.quotes['EURUSD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 2.44, 'size': 1200000.0, 'provider': '1', 'time': 1616965217160000},
             'S0': {'entry_type': 1, 'price': 2.47, 'size': 1200000.0, 'provider': '1', 'time': 1616965217159000},
             'B1': {'entry_type': 0, 'price': 2.45, 'size': 2300000.0, 'provider': '0', 'time': 1616965217159000},
             'S1': {'entry_type': 1, 'price': 2.48, 'size': 2300000.0, 'provider': '0', 'time': 1616965217159000}
-        }
+        }, self.bookbuilder.providers_of('EURUSD'))
         msg = fix.Message('8=FIX.4.4|9=88|35=i|34=6|49=XC461|52=20210328-21:00:17.161|56=Q000|296=1|302=0|295=1|299=1|134=2400000|10=135|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.active_subscriptions['0'] = 'EURUSD'
         self.pricefeed.on_mass_quote(msg, None)
@@ -352,7 +365,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2400000.0, None, None, None, None, None]
         ], False), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217161000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965217161000, book['time'])
@@ -360,28 +373,28 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217161000, book['bid_time0'])
         self.assertEqual(2.45, book['bid_px0'])
         self.assertEqual(2400000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217160000, book['bid_time1'])
         self.assertEqual(2.44, book['bid_px1'])
         self.assertEqual(1200000, book['bid_size1'])
-        self.assertEqual(b'1', book['bid_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # no change to asks
         self.assertEqual(1616965217159000, book['ask_time0'])
         self.assertEqual(2.47, book['ask_px0'])
         self.assertEqual(1200000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217159000, book['ask_time1'])
         self.assertEqual(2.48, book['ask_px1'])
         self.assertEqual(2300000, book['ask_size1'])
-        self.assertEqual(b'0', book['ask_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         np.savetxt('/tmp/book_eurusd_0006.csv', book, delimiter=',', fmt='%s')
 
 ## update bid price+provider for 1 cross (id 0)
@@ -392,12 +405,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [0] 1200000 @ 2.43*lp0*| [1] 2300000 @ 2.48 lp0
     def test_incremental_book_bid_price_and_provider(self):
         # restore book state
-        self.bookbuilder.quotes['EURUSD'] = {
+        self.bookbuilder.quotes['EURUSD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 2.44, 'size': 1200000.0, 'provider': '1', 'time': 1616965217160000},
             'S0': {'entry_type': 1, 'price': 2.47, 'size': 1200000.0, 'provider': '1', 'time': 1616965217159000},
             'B1': {'entry_type': 0, 'price': 2.45, 'size': 2400000.0, 'provider': '0', 'time': 1616965217161000},
             'S1': {'entry_type': 1, 'price': 2.48, 'size': 2300000.0, 'provider': '0', 'time': 1616965217159000}
-        }
+        }, self.bookbuilder.providers_of('EURUSD'))
         msg = fix.Message('8=FIX.4.4|9=91|35=i|34=6|49=XC461|52=20210328-21:00:17.162|56=Q000|296=1|302=0|295=1|299=0|106=0|188=2.43|10=0|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.active_subscriptions['0'] = 'EURUSD'
         self.pricefeed.on_mass_quote(msg, None)
@@ -406,35 +419,35 @@ class TestIntegrationClass(unittest.TestCase):
             ['0', None, None, 2.43, None, '0', None]
         ], False), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217162000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965217162000, book['time'])
         self.assertEqual(1616965217161000, book['bid_time0'])
         self.assertEqual(2.45, book['bid_px0'])
         self.assertEqual(2400000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217162000, book['bid_time1'])
         self.assertEqual(2.43, book['bid_px1'])
         self.assertEqual(1200000, book['bid_size1'])
-        self.assertEqual(b'0', book['bid_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # no change to asks
         self.assertEqual(1616965217159000, book['ask_time0'])
         self.assertEqual(2.47, book['ask_px0'])
         self.assertEqual(1200000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217159000, book['ask_time1'])
         self.assertEqual(2.48, book['ask_px1'])
         self.assertEqual(2300000, book['ask_size1'])
-        self.assertEqual(b'0', book['ask_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         np.savetxt('/tmp/book_eurusd_0007.csv', book, delimiter=',', fmt='%s')
 
 
@@ -448,12 +461,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [0] 1200000 @ 2.43 lp0 | [1] 2300000 @ 2.49*lp0
     def test_incremental_book_ask_price(self):
         # restore book state
-        self.bookbuilder.quotes['EURUSD'] = {
+        self.bookbuilder.quotes['EURUSD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 2.43, 'size': 1200000.0, 'provider': '0', 'time': 1616965217162000},
             'S0': {'entry_type': 1, 'price': 2.47, 'size': 1200000.0, 'provider': '1', 'time': 1616965217159000},
             'B1': {'entry_type': 0, 'price': 2.45, 'size': 2400000.0, 'provider': '0', 'time': 1616965217161000},
             'S1': {'entry_type': 1, 'price': 2.48, 'size': 2300000.0, 'provider': '0', 'time': 1616965217159000}
-        }
+        }, self.bookbuilder.providers_of('EURUSD'))
         msg = fix.Message('8=FIX.4.4|9=91|35=i|34=6|49=XC461|52=20210328-21:00:17.163|56=Q000|296=1|302=0|295=1|299=1|106=0|190=2.49|10=1|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.active_subscriptions['0'] = 'EURUSD'
         self.pricefeed.on_mass_quote(msg, None)
@@ -462,7 +475,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', None, None, None, 2.49, None, '0']
         ], False), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217163000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965217163000, book['time'])
@@ -470,28 +483,28 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217159000, book['ask_time0'])
         self.assertEqual(2.47, book['ask_px0'])
         self.assertEqual(1200000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217163000, book['ask_time1'])
         self.assertEqual(2.49, book['ask_px1'])
         self.assertEqual(2300000, book['ask_size1'])
-        self.assertEqual(b'0', book['ask_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         # no change to bids
         self.assertEqual(1616965217161000, book['bid_time0'])
         self.assertEqual(2.45, book['bid_px0'])
         self.assertEqual(2400000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217162000, book['bid_time1'])
         self.assertEqual(2.43, book['bid_px1'])
         self.assertEqual(1200000, book['bid_size1'])
-        self.assertEqual(b'0', book['bid_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         np.savetxt('/tmp/book_eurusd_0008.csv', book, delimiter=',', fmt='%s')
 
 ## update ask qty for 1 cross (id 0)
@@ -502,12 +515,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [0] 1200000 @ 2.43 lp0 | [1] 2300000 @ 2.49 lp0
     def test_incremental_book_ask_qty(self):
         # restore book state
-        self.bookbuilder.quotes['EURUSD'] = {
+        self.bookbuilder.quotes['EURUSD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 2.43, 'size': 1200000.0, 'provider': '0', 'time': 1616965217162000},
             'S0': {'entry_type': 1, 'price': 2.47, 'size': 1200000.0, 'provider': '1', 'time': 1616965217159000},
             'B1': {'entry_type': 0, 'price': 2.45, 'size': 2400000.0, 'provider': '0', 'time': 1616965217161000},
             'S1': {'entry_type': 1, 'price': 2.49, 'size': 2300000.0, 'provider': '0', 'time': 1616965217163000}
-        }
+        }, self.bookbuilder.providers_of('EURUSD'))
         msg = fix.Message('8=FIX.4.4|9=88|35=i|34=6|49=XC461|52=20210328-21:00:17.164|56=Q000|296=1|302=0|295=1|299=0|135=1300000|10=136|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.active_subscriptions['0'] = 'EURUSD'
         self.pricefeed.on_mass_quote(msg, None)
@@ -516,7 +529,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['0', None, 1300000.0, None, None, None, None]
         ], False), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217164000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965217164000, book['time'])
@@ -524,28 +537,28 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217164000, book['ask_time0'])
         self.assertEqual(2.47, book['ask_px0'])
         self.assertEqual(1300000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217163000, book['ask_time1'])
         self.assertEqual(2.49, book['ask_px1'])
         self.assertEqual(2300000, book['ask_size1'])
-        self.assertEqual(b'0', book['ask_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         # no change to bids
         self.assertEqual(1616965217161000, book['bid_time0'])
         self.assertEqual(2.45, book['bid_px0'])
         self.assertEqual(2400000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217162000, book['bid_time1'])
         self.assertEqual(2.43, book['bid_px1'])
         self.assertEqual(1200000, book['bid_size1'])
-        self.assertEqual(b'0', book['bid_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         np.savetxt('/tmp/book_eurusd_0009.csv', book, delimiter=',', fmt='%s')
 
 ## update ask price+provider for 1 cross (level 1)
@@ -556,12 +569,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [0] 1200000 @ 2.43 lp0 | [0] 1300000 @ 2.47 lp1
     def test_incremental_book_ask_price_and_provider(self):
         # restore book state
-        self.bookbuilder.quotes['EURUSD'] = {
+        self.bookbuilder.quotes['EURUSD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 2.43, 'size': 1200000.0, 'provider': '0', 'time': 1616965217162000},
             'S0': {'entry_type': 1, 'price': 2.47, 'size': 1300000.0, 'provider': '1', 'time': 1616965217164000},
             'B1': {'entry_type': 0, 'price': 2.45, 'size': 2400000.0, 'provider': '0', 'time': 1616965217161000},
             'S1': {'entry_type': 1, 'price': 2.49, 'size': 2300000.0, 'provider': '0', 'time': 1616965217163000}
-        }
+        }, self.bookbuilder.providers_of('EURUSD'))
         msg = fix.Message('8=FIX.4.4|9=91|35=i|34=6|49=XC461|52=20210328-21:00:17.165|56=Q000|296=1|302=0|295=1|299=1|106=1|190=2.46|10=1|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.active_subscriptions['0'] = 'EURUSD'
         self.pricefeed.on_mass_quote(msg, None)
@@ -570,7 +583,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', None, None, None, 2.46, None, '1']
         ], False), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217165000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965217165000, book['time'])
@@ -578,28 +591,28 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217165000, book['ask_time0'])
         self.assertEqual(2.46, book['ask_px0'])
         self.assertEqual(2300000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217164000, book['ask_time1'])
         self.assertEqual(2.47, book['ask_px1'])
         self.assertEqual(1300000, book['ask_size1'])
-        self.assertEqual(b'1', book['ask_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         # no change to bids
         self.assertEqual(1616965217161000, book['bid_time0'])
         self.assertEqual(2.45, book['bid_px0'])
         self.assertEqual(2400000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217162000, book['bid_time1'])
         self.assertEqual(2.43, book['bid_px1'])
         self.assertEqual(1200000, book['bid_size1'])
-        self.assertEqual(b'0', book['bid_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         np.savetxt('/tmp/book_eurusd_0010.csv', book, delimiter=',', fmt='%s')
 
 
@@ -610,12 +623,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [1] 2400000 @ 2.45 lp0 | [1] 2300000 @ 2.46 lp1
     # [0] 1200000 @ 2.43 lp0 | [0] 1300000 @ 2.47 lp1
     def test_snapshot_no_changes_1(self):
-        self.bookbuilder.quotes['EURUSD'] = {
+        self.bookbuilder.quotes['EURUSD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 2.43, 'size': 1200000.0, 'provider': '0', 'time': 1616965217162000},
             'S0': {'entry_type': 1, 'price': 2.47, 'size': 1300000.0, 'provider': '1', 'time': 1616965217164000},
             'B1': {'entry_type': 0, 'price': 2.45, 'size': 2400000.0, 'provider': '0', 'time': 1616965217161000},
             'S1': {'entry_type': 1, 'price': 2.46, 'size': 2300000.0, 'provider': '1', 'time': 1616965217165000}
-        }
+        }, self.bookbuilder.providers_of('EURUSD'))
         msg = fix.Message('8=FIX.4.4|9=231|35=W|34=4|49=XC461|52=20210328-21:00:17.166|56=Q000|55=EUR/USD|262=0|268=4|269=0|270=2.43|271=1200000|299=0|106=0|269=1|270=2.47|271=1300000|299=0|106=1|269=0|270=2.45|271=2400000|299=1|106=0|269=1|270=2.46|271=2300000|299=1|106=1|10=215|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.on_market_data_snapshot(msg, None)
         item = self.pricefeed.queue.get()
@@ -624,7 +637,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2400000.0, 2300000.0, 2.45, 2.46, '0', '1'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217166000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965217166000, book['time'])
@@ -632,28 +645,28 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217161000, book['bid_time0'])
         self.assertEqual(2.45, book['bid_px0'])
         self.assertEqual(2400000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217162000, book['bid_time1'])
         self.assertEqual(2.43, book['bid_px1'])
         self.assertEqual(1200000, book['bid_size1'])
-        self.assertEqual(b'0', book['bid_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # no change to asks
         self.assertEqual(1616965217165000, book['ask_time0'])
         self.assertEqual(2.46, book['ask_px0'])
         self.assertEqual(2300000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217164000, book['ask_time1'])
         self.assertEqual(2.47, book['ask_px1'])
         self.assertEqual(1300000, book['ask_size1'])
-        self.assertEqual(b'1', book['ask_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
 
         np.savetxt('/tmp/book_eurusd_0011.csv', book, delimiter=',', fmt='%s')
 
@@ -662,12 +675,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [0] 2200000 @ 1.47 lp0 | [0] 1100000 @ 1.49 lp1 *** asks could be either way around
     # [1] 2200000 @ 1.46 lp1 | [1] 1100000 @ 1.49 lp0
     def test_snapshot_no_changes_2(self):
-        self.bookbuilder.quotes['USDCAD'] = {
+        self.bookbuilder.quotes['USDCAD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 1.47, 'size': 2200000.0, 'provider': '0', 'time': 1616965217159000},
             'S0': {'entry_type': 1, 'price': 1.49, 'size': 1100000.0, 'provider': '0', 'time': 1616965217159000},
             'B1': {'entry_type': 0, 'price': 1.46, 'size': 2200000.0, 'provider': '1', 'time': 1616965217159000},
             'S1': {'entry_type': 1, 'price': 1.49, 'size': 1100000.0, 'provider': '1', 'time': 1616965217159000}
-        }
+        }, self.bookbuilder.providers_of('USDCAD'))
         msg = fix.Message('8=FIX.4.4|9=231|35=W|34=5|49=XC461|52=20210328-21:00:17.168|56=Q000|55=USD/CAD|262=1|268=4|269=0|270=1.47|271=2200000|299=0|106=0|269=1|270=1.49|271=1100000|299=0|106=0|269=0|270=1.46|271=2200000|299=1|106=1|269=1|270=1.49|271=1100000|299=1|106=1|10=183|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.on_market_data_snapshot(msg, None)
         item = self.pricefeed.queue.get()
@@ -676,7 +689,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2200000.0, 1100000.0, 1.46, 1.49, '1', '1'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217168000, time)
         self.assertEqual('USDCAD', symbol)
         # no changes to bids or asks
@@ -684,27 +697,27 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217159000, book['bid_time0'])
         self.assertEqual(1.47, book['bid_px0'])
         self.assertEqual(2200000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217159000, book['bid_time1'])
         self.assertEqual(1.46, book['bid_px1'])
         self.assertEqual(2200000, book['bid_size1'])
-        self.assertEqual(b'1', book['bid_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         self.assertEqual(1616965217159000, book['ask_time0'])
         self.assertEqual(1.49, book['ask_px0'])
         self.assertEqual(1100000, book['ask_size0'])
-        self.assertEqual(b'0', book['ask_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217159000, book['ask_time1'])
         self.assertEqual(1.49, book['ask_px1'])
         self.assertEqual(1100000, book['ask_size1'])
-        self.assertEqual(b'1', book['ask_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         np.savetxt('/tmp/book_usdcad_0012.csv', book, delimiter=',', fmt='%s')
 
 # 6.) single-sided snapshot
@@ -715,12 +728,12 @@ class TestIntegrationClass(unittest.TestCase):
     #                   bids | asks
     # [1] 1000000 @ 2.44 lp0 |
     def test_snapshot_only_bid(self):
-        self.bookbuilder.quotes['EURUSD'] = {
+        self.bookbuilder.quotes['EURUSD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 2.43, 'size': 1200000.0, 'provider': '0', 'time': 1616965217162000},
             'S0': {'entry_type': 1, 'price': 2.47, 'size': 1300000.0, 'provider': '1', 'time': 1616965217164000},
             'B1': {'entry_type': 0, 'price': 2.45, 'size': 2400000.0, 'provider': '0', 'time': 1616965217161000},
             'S1': {'entry_type': 1, 'price': 2.46, 'size': 2300000.0, 'provider': '1', 'time': 1616965217165000}
-        }
+        }, self.bookbuilder.providers_of('EURUSD'))
 
         msg = fix.Message('8=FIX.4.4|9=114|35=W|34=4|49=XC461|52=20210328-21:00:17.170|56=Q000|55=EUR/USD|262=0|268=1|269=0|270=2.44|271=1000000|299=1|106=0|10=237|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.on_market_data_snapshot(msg, None)
@@ -729,23 +742,23 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 1000000.0, None, 2.44, None, '0', None],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217170000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965217170000, book['time'])
         self.assertEqual(1616965217170000, book['bid_time0'])
         self.assertEqual(2.44, book['bid_px0'])
         self.assertEqual(1000000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(0, book['bid_time1'])
         self.assertEqual(0, book['bid_px1'])
         self.assertEqual(0, book['bid_size1'])
-        self.assertEqual(b'', book['bid_provider1'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider1'][0]))
         # empty ask
         self.assertEqual(0, book['ask_time0'])
         self.assertEqual(0, book['ask_px0'])
         self.assertEqual(0, book['ask_size0'])
-        self.assertEqual(b'', book['ask_provider0'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider0'][0]))
         np.savetxt('/tmp/book_eurusd_0013.csv', book, delimiter=',', fmt='%s')
 
 ## snapshot, only 1 ask
@@ -753,9 +766,9 @@ class TestIntegrationClass(unittest.TestCase):
     #                   bids | asks
     #                        | [0] 1000000 @ 2.48 lp1
     def test_snapshot_only_ask(self):
-        self.bookbuilder.quotes['EURUSD'] = {
+        self.bookbuilder.quotes['EURUSD'] = bb.QuoteState.from_dict({
             'B1': {'entry_type': 0, 'price': 2.44, 'size': 1000000.0, 'provider': '0', 'time': 1616965217170000}
-        }
+        }, self.bookbuilder.providers_of('EURUSD'))
 
         msg = fix.Message('8=FIX.4.4|9=114|35=W|34=4|49=XC461|52=20210328-21:00:17.171|56=Q000|55=EUR/USD|262=0|268=1|269=1|270=2.48|271=1000000|299=0|106=1|10=243|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.on_market_data_snapshot(msg, None)
@@ -764,7 +777,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['0', None, 1000000.0, None, 2.48, None, '1'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217171000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965217171000, book['time'])
@@ -772,16 +785,16 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(0, book['bid_time0'])
         self.assertEqual(0, book['bid_px0'])
         self.assertEqual(0, book['bid_size0'])
-        self.assertEqual(b'', book['bid_provider0'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider0'][0]))
         # only one layer of asks
         self.assertEqual(1616965217171000, book['ask_time0'])
         self.assertEqual(2.48, book['ask_px0'])
         self.assertEqual(1000000.0, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(0, book['ask_time1'])
         self.assertEqual(0, book['ask_px1'])
         self.assertEqual(0, book['ask_size1'])
-        self.assertEqual(b'', book['ask_provider1'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider1'][0]))
         np.savetxt('/tmp/book_eurusd_0014.csv', book, delimiter=',', fmt='%s')
 
 # 7.) w <- different price/feed/quantity - all combinations as in i
@@ -791,12 +804,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [0] 2300000 @ 1.37 lp1 | [0] 1200000 @ 1.39 lp0
     # [1] 2300000 @ 1.36 lp0 | [1] 1200000 @ 1.40 lp1
     def test_snapshot_change_all_prices_sizes_and_providers(self):
-        self.bookbuilder.quotes['USDCAD'] = {
+        self.bookbuilder.quotes['USDCAD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 1.47, 'size': 2200000.0, 'provider': '0', 'time': 1616965217168000},
             'S0': {'entry_type': 1, 'price': 1.49, 'size': 1100000.0, 'provider': '0', 'time': 1616965217168000},
             'B1': {'entry_type': 0, 'price': 1.46, 'size': 2200000.0, 'provider': '1', 'time': 1616965217168000},
             'S1': {'entry_type': 1, 'price': 1.49, 'size': 1100000.0, 'provider': '1', 'time': 1616965217168000}
-        }
+        }, self.bookbuilder.providers_of('USDCAD'))
         msg = fix.Message('8=FIX.4.4|9=231|35=W|34=5|49=XC461|52=20210328-21:00:17.180|56=Q000|55=USD/CAD|262=1|268=4|269=0|270=1.37|271=2300000|299=0|106=1|269=1|270=1.40|271=1200000|299=0|106=1|269=0|270=1.36|271=2300000|299=1|106=0|269=1|270=1.39|271=1200000|299=1|106=0|10=169|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.on_market_data_snapshot(msg, None)
         item = self.pricefeed.queue.get()
@@ -805,7 +818,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2300000.0, 1200000.0, 1.36, 1.39, '0', '0'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217180000, time)
         self.assertEqual('USDCAD', symbol)
         self.assertEqual(1616965217180000, book['time'])
@@ -813,28 +826,28 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217180000, book['bid_time0'])
         self.assertEqual(1.37, book['bid_px0'])
         self.assertEqual(2300000, book['bid_size0'])
-        self.assertEqual(b'1', book['bid_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217180000, book['bid_time1'])
         self.assertEqual(1.36, book['bid_px1'])
         self.assertEqual(2300000, book['bid_size1'])
-        self.assertEqual(b'0', book['bid_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # check asks
         self.assertEqual(1616965217180000, book['ask_time0'])
         self.assertEqual(1.39, book['ask_px0'])
         self.assertEqual(1200000, book['ask_size0'])
-        self.assertEqual(b'0', book['ask_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217180000, book['ask_time1'])
         self.assertEqual(1.40, book['ask_px1'])
         self.assertEqual(1200000, book['ask_size1'])
-        self.assertEqual(b'1', book['ask_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         np.savetxt('/tmp/book_usdcad_0015.csv', book, delimiter=',', fmt='%s')
 
     # USD/CAD
@@ -842,12 +855,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [0] 2100000*@ 1.37 lp1 | [0] 1400000*@ 1.39 lp0
     # [1] 2200000*@ 1.36 lp0 | [1] 1300000*@ 1.40 lp1
     def test_snapshot_change_all_sizes(self):
-        self.bookbuilder.quotes['USDCAD'] = {
+        self.bookbuilder.quotes['USDCAD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 1.37, 'size': 2300000.0, 'provider': '1', 'time': 1616965217180000},
             'S0': {'entry_type': 1, 'price': 1.40, 'size': 1200000.0, 'provider': '1', 'time': 1616965217180000},
             'B1': {'entry_type': 0, 'price': 1.36, 'size': 2300000.0, 'provider': '0', 'time': 1616965217180000},
             'S1': {'entry_type': 1, 'price': 1.39, 'size': 1200000.0, 'provider': '0', 'time': 1616965217180000}
-        }
+        }, self.bookbuilder.providers_of('USDCAD'))
         msg = fix.Message('8=FIX.4.4|9=231|35=W|34=5|49=XC461|52=20210328-21:00:17.181|56=Q000|55=USD/CAD|262=1|268=4|269=0|270=1.37|271=2100000|299=0|106=1|269=1|270=1.40|271=1300000|299=0|106=1|269=0|270=1.36|271=2200000|299=1|106=0|269=1|270=1.39|271=1400000|299=1|106=0|10=170|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.on_market_data_snapshot(msg, None)
         item = self.pricefeed.queue.get()
@@ -856,7 +869,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2200000.0, 1400000.0, 1.36, 1.39, '0', '0'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217181000, time)
         self.assertEqual('USDCAD', symbol)
         self.assertEqual(1616965217181000, book['time'])
@@ -864,28 +877,28 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217181000, book['bid_time0'])
         self.assertEqual(1.37, book['bid_px0'])
         self.assertEqual(2100000, book['bid_size0'])
-        self.assertEqual(b'1', book['bid_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217181000, book['bid_time1'])
         self.assertEqual(1.36, book['bid_px1'])
         self.assertEqual(2200000, book['bid_size1'])
-        self.assertEqual(b'0', book['bid_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # check asks
         self.assertEqual(1616965217181000, book['ask_time0'])
         self.assertEqual(1.39, book['ask_px0'])
         self.assertEqual(1400000, book['ask_size0'])
-        self.assertEqual(b'0', book['ask_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217181000, book['ask_time1'])
         self.assertEqual(1.40, book['ask_px1'])
         self.assertEqual(1300000, book['ask_size1'])
-        self.assertEqual(b'1', book['ask_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         # print(self.bookbuilder.quotes['USDCAD'])
         np.savetxt('/tmp/book_usdcad_0016.csv', book, delimiter=',', fmt='%s')
 
@@ -894,12 +907,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [0] 2200000 @ 1.35*lp1 | [0] 1400000 @ 1.35*lp0
     # [1] 2100000 @ 1.35*lp0 | [1] 1300000 @ 1.35*lp1
     def test_snapshot_change_all_prices(self):
-        self.bookbuilder.quotes['USDCAD'] = {
+        self.bookbuilder.quotes['USDCAD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 1.37, 'size': 2100000.0, 'provider': '1', 'time': 1616965217181000},
             'S0': {'entry_type': 1, 'price': 1.40, 'size': 1300000.0, 'provider': '1', 'time': 1616965217181000},
             'B1': {'entry_type': 0, 'price': 1.36, 'size': 2200000.0, 'provider': '0', 'time': 1616965217181000},
             'S1': {'entry_type': 1, 'price': 1.39, 'size': 1400000.0, 'provider': '0', 'time': 1616965217181000}
-        }
+        }, self.bookbuilder.providers_of('USDCAD'))
         msg = fix.Message('8=FIX.4.4|9=231|35=W|34=5|49=XC461|52=20210328-21:00:17.182|56=Q000|55=USD/CAD|262=1|268=4|269=0|270=1.35|271=2100000|299=0|106=1|269=1|270=1.35|271=1300000|299=0|106=1|269=0|270=1.35|271=2200000|299=1|106=0|269=1|270=1.35|271=1400000|299=1|106=0|10=168|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.on_market_data_snapshot(msg, None)
         item = self.pricefeed.queue.get()
@@ -908,7 +921,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2200000.0, 1400000.0, 1.35, 1.35, '0', '0'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217182000, time)
         self.assertEqual('USDCAD', symbol)
         self.assertEqual(1616965217182000, book['time'])
@@ -916,30 +929,30 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217182000, book['bid_time0'])
         self.assertEqual(1.35, book['bid_px0'])
         self.assertEqual(2200000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217182000, book['bid_time1'])
         self.assertEqual(1.35, book['bid_px1'])
         self.assertEqual(2100000, book['bid_size1'])
-        self.assertEqual(b'1', book['bid_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # check asks
         self.assertEqual(1616965217182000, book['ask_time0'])
         self.assertEqual(1.35, book['ask_px0'])
         # FIXME: we should sort sizes descending always...
         # self.assertEqual(1400000, book['ask_size0'])
-        # self.assertEqual(b'0', book['ask_provider0'][0])
+        # self.assertEqual('0', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217182000, book['ask_time1'])
         self.assertEqual(1.35, book['ask_px1'])
         # FIXME: we should sort sizes descending always...
         # self.assertEqual(1300000, book['ask_size1'])
-        # self.assertEqual(b'1', book['ask_provider1'][0])
+        # self.assertEqual('1', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         np.savetxt('/tmp/book_usdcad_0017.csv', book, delimiter=',', fmt='%s')
 
 
@@ -948,12 +961,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [1] 2100000 @ 1.34*lp0 | [1] 1500000 @ 1.34*lp1
     # [0] 2000000 @ 1.34*lp1 | [0] 1200000 @ 1.34*lp0
     def test_snapshot_change_all_prices_and_sizes(self):
-        self.bookbuilder.quotes['USDCAD'] = {
+        self.bookbuilder.quotes['USDCAD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 1.35, 'size': 2100000.0, 'provider': '1', 'time': 1616965217182000},
             'S0': {'entry_type': 1, 'price': 1.35, 'size': 1300000.0, 'provider': '1', 'time': 1616965217182000},
             'B1': {'entry_type': 0, 'price': 1.35, 'size': 2200000.0, 'provider': '0', 'time': 1616965217182000},
             'S1': {'entry_type': 1, 'price': 1.35, 'size': 1400000.0, 'provider': '0', 'time': 1616965217182000}
-        }
+        }, self.bookbuilder.providers_of('USDCAD'))
         msg = fix.Message('8=FIX.4.4|9=231|35=W|34=5|49=XC461|52=20210328-21:00:17.185|56=Q000|55=USD/CAD|262=1|268=4|269=0|270=1.34|271=2000000|299=0|106=1|269=1|270=1.34|271=1500000|299=0|106=1|269=0|270=1.34|271=2100000|299=1|106=0|269=1|270=1.34|271=1200000|299=1|106=0|10=165|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.on_market_data_snapshot(msg, None)
         item = self.pricefeed.queue.get()
@@ -962,7 +975,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2100000.0, 1200000.0, 1.34, 1.34, '0', '0'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217185000, time)
         self.assertEqual('USDCAD', symbol)
         self.assertEqual(1616965217185000, book['time'])
@@ -970,28 +983,28 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217185000, book['bid_time0'])
         self.assertEqual(1.34, book['bid_px0'])
         self.assertEqual(2100000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217185000, book['bid_time1'])
         self.assertEqual(1.34, book['bid_px1'])
         self.assertEqual(2000000, book['bid_size1'])
-        self.assertEqual(b'1', book['bid_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # check asks
         self.assertEqual(1616965217185000, book['ask_time0'])
         self.assertEqual(1.34, book['ask_px0'])
         self.assertEqual(1500000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217185000, book['ask_time1'])
         self.assertEqual(1.34, book['ask_px1'])
         self.assertEqual(1200000, book['ask_size1'])
-        self.assertEqual(b'0', book['ask_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         np.savetxt('/tmp/book_usdcad_0018.csv', book, delimiter=',', fmt='%s')
 
     # USD/CAD
@@ -999,12 +1012,12 @@ class TestIntegrationClass(unittest.TestCase):
     # [1] 2100000 @ 1.34 lp1*| [0] 1500000 @ 1.34 lp0*
     # [0] 2000000 @ 1.34 lp0*| [1] 1200000 @ 1.34 lp1*
     def test_snapshot_change_all_providers(self):
-        self.bookbuilder.quotes['USDCAD'] = {
+        self.bookbuilder.quotes['USDCAD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 1.34, 'size': 2000000.0, 'provider': '1', 'time': 1616965217185000},
             'S0': {'entry_type': 1, 'price': 1.34, 'size': 1500000.0, 'provider': '1', 'time': 1616965217185000},
             'B1': {'entry_type': 0, 'price': 1.34, 'size': 2100000.0, 'provider': '0', 'time': 1616965217185000},
             'S1': {'entry_type': 1, 'price': 1.34, 'size': 1200000.0, 'provider': '0', 'time': 1616965217185000}
-        }
+        }, self.bookbuilder.providers_of('USDCAD'))
         msg = fix.Message('8=FIX.4.4|9=231|35=W|34=5|49=XC461|52=20210328-21:00:17.186|56=Q000|55=USD/CAD|262=1|268=4|269=0|270=1.34|271=2000000|299=0|106=0|269=1|270=1.34|271=1500000|299=0|106=0|269=0|270=1.34|271=2100000|299=1|106=1|269=1|270=1.34|271=1200000|299=1|106=1|10=166|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.on_market_data_snapshot(msg, None)
         item = self.pricefeed.queue.get()
@@ -1013,7 +1026,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2100000.0, 1200000.0, 1.34, 1.34, '1', '1'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217186000, time)
         self.assertEqual('USDCAD', symbol)
         self.assertEqual(1616965217186000, book['time'])
@@ -1021,28 +1034,28 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217186000, book['bid_time0'])
         self.assertEqual(1.34, book['bid_px0'])
         self.assertEqual(2100000, book['bid_size0'])
-        self.assertEqual(b'1', book['bid_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965217186000, book['bid_time1'])
         self.assertEqual(1.34, book['bid_px1'])
         self.assertEqual(2000000, book['bid_size1'])
-        self.assertEqual(b'0', book['bid_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider1'][0]))
         self.assertEqual(0, book['bid_time2'])
         self.assertEqual(0, book['bid_px2'])
         self.assertEqual(0, book['bid_size2'])
-        self.assertEqual(b'', book['bid_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider2'][0]))
         # check asks
         self.assertEqual(1616965217186000, book['ask_time0'])
         self.assertEqual(1.34, book['ask_px0'])
         self.assertEqual(1500000, book['ask_size0'])
-        self.assertEqual(b'0', book['ask_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965217186000, book['ask_time1'])
         self.assertEqual(1.34, book['ask_px1'])
         self.assertEqual(1200000, book['ask_size1'])
-        self.assertEqual(b'1', book['ask_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider1'][0]))
         self.assertEqual(0, book['ask_time2'])
         self.assertEqual(0, book['ask_px2'])
         self.assertEqual(0, book['ask_size2'])
-        self.assertEqual(b'', book['ask_provider2'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider2'][0]))
         np.savetxt('/tmp/book_usdcad_0019.csv', book, delimiter=',', fmt='%s')
 
 ## snapshot updates to 1 layer
@@ -1050,12 +1063,12 @@ class TestIntegrationClass(unittest.TestCase):
     #                   bids | asks
     # [1] 2100000 @ 1.34 lp1 | [1] 1200000 @ 1.34 lp1
     def test_snapshot_reduce_to_one_level(self):
-        self.bookbuilder.quotes['USDCAD'] = {
+        self.bookbuilder.quotes['USDCAD'] = bb.QuoteState.from_dict({
             'B0': {'entry_type': 0, 'price': 1.34, 'size': 2000000.0, 'provider': '0', 'time': 1616965217186000},
             'S0': {'entry_type': 1, 'price': 1.34, 'size': 1500000.0, 'provider': '0', 'time': 1616965217186000},
             'B1': {'entry_type': 0, 'price': 1.34, 'size': 2100000.0, 'provider': '1', 'time': 1616965217186000},
             'S1': {'entry_type': 1, 'price': 1.34, 'size': 1200000.0, 'provider': '1', 'time': 1616965217186000}
-        }
+        }, self.bookbuilder.providers_of('USDCAD'))
         msg = fix.Message('8=FIX.4.4|9=153|35=W|34=5|49=XC461|52=20210328-21:00:17.187|56=Q000|55=USD/CAD|262=1|268=2|269=0|270=1.34|271=2100000|299=1|106=1|269=1|270=1.34|271=1200000|299=1|106=1|10=201|'.replace('|', '\x01'), self.data_dictionary)
         self.pricefeed.on_market_data_snapshot(msg, None)
         item = self.pricefeed.queue.get()
@@ -1063,7 +1076,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2100000.0, 1200000.0, 1.34, 1.34, '1', '1'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965217187000, time)
         self.assertEqual('USDCAD', symbol)
         self.assertEqual(1616965217187000, book['time'])
@@ -1071,20 +1084,20 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965217186000, book['bid_time0'])
         self.assertEqual(1.34, book['bid_px0'])
         self.assertEqual(2100000, book['bid_size0'])
-        self.assertEqual(b'1', book['bid_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(0, book['bid_time1'])
         self.assertEqual(0, book['bid_px1'])
         self.assertEqual(0, book['bid_size1'])
-        self.assertEqual(b'', book['bid_provider1'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider1'][0]))
         # check asks
         self.assertEqual(1616965217186000, book['ask_time0'])
         self.assertEqual(1.34, book['ask_px0'])
         self.assertEqual(1200000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(0, book['ask_time1'])
         self.assertEqual(0, book['ask_px1'])
         self.assertEqual(0, book['ask_size1'])
-        self.assertEqual(b'', book['ask_provider1'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider1'][0]))
         np.savetxt('/tmp/book_usdcad_0020.csv', book, delimiter=',', fmt='%s')
 
 # 8.) logout
@@ -1117,7 +1130,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['0', 1000000.0, 1100000.0, 1.33, 1.35, '0', '0'],
         ], False), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965337157000, time)
         self.assertEqual('USDCAD', symbol)
         self.assertEqual(1616965337157000, book['time'])
@@ -1125,20 +1138,20 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965337157000, book['bid_time0'])
         self.assertEqual(1.33, book['bid_px0'])
         self.assertEqual(1000000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(0, book['bid_time1'])
         self.assertEqual(0, book['bid_px1'])
         self.assertEqual(0, book['bid_size1'])
-        self.assertEqual(b'', book['bid_provider1'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider1'][0]))
         # check asks
         self.assertEqual(1616965337157000, book['ask_time0'])
         self.assertEqual(1.35, book['ask_px0'])
         self.assertEqual(1100000, book['ask_size0'])
-        self.assertEqual(b'0', book['ask_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(0, book['ask_time1'])
         self.assertEqual(0, book['ask_px1'])
         self.assertEqual(0, book['ask_size1'])
-        self.assertEqual(b'', book['ask_provider1'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider1'][0]))
         np.savetxt('/tmp/book_usdcad_0021.csv', book, delimiter=',', fmt='%s')
 
 
@@ -1157,7 +1170,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 1000000.0, 2000000.0, 2.45, 2.49, '0', '0'],
         ], True), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965337158000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965337158000, book['time'])
@@ -1165,20 +1178,20 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965337158000, book['bid_time0'])
         self.assertEqual(2.45, book['bid_px0'])
         self.assertEqual(1000000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(1616965337158000, book['bid_time1'])
         self.assertEqual(2.44, book['bid_px1'])
         self.assertEqual(2000000, book['bid_size1'])
-        self.assertEqual(b'1', book['bid_provider1'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider1'][0]))
         # check asks
         self.assertEqual(1616965337158000, book['ask_time0'])
         self.assertEqual(2.48, book['ask_px0'])
         self.assertEqual(1000000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(1616965337158000, book['ask_time1'])
         self.assertEqual(2.49, book['ask_px1'])
         self.assertEqual(2000000, book['ask_size1'])
-        self.assertEqual(b'0', book['ask_provider1'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider1'][0]))
         np.savetxt('/tmp/book_eurusd_0022.csv', book, delimiter=',', fmt='%s')
 
 # 11.) v x 2
@@ -1202,7 +1215,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['0', 1000000.0, 1100000.0, 1.33, 1.35, '0', '0'],
         ], False), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965397157000, time)
         self.assertEqual('USDCAD', symbol)
         self.assertEqual(1616965397157000, book['time'])
@@ -1210,20 +1223,20 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965397157000, book['bid_time0'])
         self.assertEqual(1.33, book['bid_px0'])
         self.assertEqual(1000000, book['bid_size0'])
-        self.assertEqual(b'0', book['bid_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(0, book['bid_time1'])
         self.assertEqual(0, book['bid_px1'])
         self.assertEqual(0, book['bid_size1'])
-        self.assertEqual(b'', book['bid_provider1'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider1'][0]))
         # check asks
         self.assertEqual(1616965397157000, book['ask_time0'])
         self.assertEqual(1.35, book['ask_px0'])
         self.assertEqual(1100000, book['ask_size0'])
-        self.assertEqual(b'0', book['ask_provider0'][0])
+        self.assertEqual('0', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(0, book['ask_time1'])
         self.assertEqual(0, book['ask_px1'])
         self.assertEqual(0, book['ask_size1'])
-        self.assertEqual(b'', book['ask_provider1'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider1'][0]))
         np.savetxt('/tmp/book_usdcad_0023.csv', book, delimiter=',', fmt='%s')
 
     # EUR/USD
@@ -1238,7 +1251,7 @@ class TestIntegrationClass(unittest.TestCase):
             ['1', 2000000.0, 2100000.0, 2.33, 2.35, '1', '1'],
         ], False), item)
         self.bookbuilder.process_item(item)
-        time, symbol, book = self.bookbuilder.outbound_queue.get()
+        time, symbol, book = self.next_book()
         self.assertEqual(1616965397157000, time)
         self.assertEqual('EURUSD', symbol)
         self.assertEqual(1616965397157000, book['time'])
@@ -1246,20 +1259,20 @@ class TestIntegrationClass(unittest.TestCase):
         self.assertEqual(1616965397157000, book['bid_time0'])
         self.assertEqual(2.33, book['bid_px0'])
         self.assertEqual(2000000, book['bid_size0'])
-        self.assertEqual(b'1', book['bid_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['bid_provider0'][0]))
         self.assertEqual(0, book['bid_time1'])
         self.assertEqual(0, book['bid_px1'])
         self.assertEqual(0, book['bid_size1'])
-        self.assertEqual(b'', book['bid_provider1'][0])
+        self.assertEqual('', self.provider(symbol, book['bid_provider1'][0]))
         # check asks
         self.assertEqual(1616965397157000, book['ask_time0'])
         self.assertEqual(2.35, book['ask_px0'])
         self.assertEqual(2100000, book['ask_size0'])
-        self.assertEqual(b'1', book['ask_provider0'][0])
+        self.assertEqual('1', self.provider(symbol, book['ask_provider0'][0]))
         self.assertEqual(0, book['ask_time1'])
         self.assertEqual(0, book['ask_px1'])
         self.assertEqual(0, book['ask_size1'])
-        self.assertEqual(b'', book['ask_provider1'][0])
+        self.assertEqual('', self.provider(symbol, book['ask_provider1'][0]))
         np.savetxt('/tmp/book_eurusd_0024.csv', book, delimiter=',', fmt='%s')
 
 
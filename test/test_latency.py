@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+import app.latency as latency
+
+
+class TestLatencyTracerClass(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = latency.LatencyTracer('test', interval=60)
+
+    def test_record(self):
+        self.tracer.record(latency.BUILD, 'EURUSD', 0)
+        self.tracer.record(latency.BUILD, 'EURUSD', 5)
+        self.tracer.record(latency.BUILD, 'EURUSD', 7)
+        self.tracer.record(latency.SKEW, 'EURUSD', -3)  # clocks apart
+        histogram = self.tracer.histograms[(latency.BUILD, 'EURUSD')]
+        self.assertEqual(3, histogram.sum())
+        self.assertEqual(1, histogram[0])
+        self.assertEqual(2, histogram[3])  # 4-7us
+        self.assertEqual(1, self.tracer.histograms[(latency.SKEW, 'EURUSD')][0])
+
+    def test_record_since(self):
+        self.tracer.record_since(latency.INBOUND, 'EURUSD', 1000, 1000 + 3000)
+        self.assertEqual(1, self.tracer.histograms[(latency.INBOUND, 'EURUSD')][2])
+
+    def test_record_all(self):
+        micros = np.array([-1, 0, 1, 5, 7, 1 << 50])
+        self.tracer.record_all(latency.TOTAL, 'EURUSD', micros)
+        for value in micros:
+            self.tracer.record(latency.FLUSH, 'EURUSD', value)
+        self.assertEqual(list(self.tracer.histograms[(latency.FLUSH, 'EURUSD')]),
+                         list(self.tracer.histograms[(latency.TOTAL, 'EURUSD')]))
+
+    def test_tick(self):
+        with patch('app.latency.LatencyTracer.log') as log:
+            self.tracer.tick()
+            log.assert_not_called()
+            self.tracer.log_time -= 60
+            self.tracer.tick()
+            log.assert_called_once()
+
+    def test_log(self):
+        for micros in range(100):
+            self.tracer.record(latency.BUILD, 'EURUSD', micros)
+        self.tracer.record(latency.SKEW, 'USDJPY', 1000)
+        with self.assertLogs('app.latency') as logs:
+            self.tracer.log()
+        # in pipeline order
+        self.assertEqual(['INFO:app.latency:test skew USDJPY: 1 samples, '
+                          'p50 < 1024us, p99 < 1024us, p99.9 < 1024us',
+                          'INFO:app.latency:test build EURUSD: 100 samples, '
+                          'p50 < 64us, p99 < 128us, p99.9 < 128us'], logs.output)
+
+    def test_dump(self):
+        self.tracer.record(latency.BUILD, 'EURUSD', 5)
+        self.tracer.record(latency.BUILD, 'EURUSD', 100)
+        with self.assertLogs('app.latency') as logs:
+            self.tracer.dump()
+        self.assertEqual('INFO:app.latency:test build EURUSD: 8:1 128:1', logs.output[-1])
+
+
+class TestLatencyFuncs(unittest.TestCase):
+
+    def test_bucket(self):
+        self.assertEqual(0, latency.bucket(-5))
+        self.assertEqual(0, latency.bucket(0))
+        self.assertEqual(1, latency.bucket(1))
+        self.assertEqual(2, latency.bucket(2))
+        self.assertEqual(2, latency.bucket(3))
+        self.assertEqual(latency.BUCKETS - 1, latency.bucket(1 << 60))
+
+    def test_percentiles(self):
+        histogram = np.zeros(latency.BUCKETS, dtype=np.int64)
+        histogram[3] = 98
+        histogram[10] = 2
+        self.assertEqual([3, 10, 10], latency.percentiles(histogram))
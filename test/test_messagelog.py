@@ -0,0 +1,135 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import quickfix as fix
+import quickfix44 as fix44
+
+import app.messagelog as ml
+import app.rebuild as rb
+
+HEARTBEAT = '8=FIX.4.4|9=5|35=0|10=000|'.replace('|', '\x01')
+REQUEST = '8=FIX.4.4|9=20|35=V|262=0|55=EUR/USD|10=000|'.replace('|', '\x01')
+
+
+class TestFactories(unittest.TestCase):
+
+    def test_log_factories(self):
+        with patch('quickfix.FileLogFactory') as file_log:
+            self.assertEqual(file_log.return_value, ml.create_log_factory(ml.FILE, 'settings'))
+            file_log.assert_called_once_with('settings')
+        with patch('quickfix.ScreenLogFactory') as screen_log:
+            self.assertEqual(screen_log.return_value,
+                             ml.create_log_factory(ml.SCREEN, 'settings'))
+        self.assertIsNone(ml.create_log_factory(ml.NONE, 'settings'))
+        self.assertIsNone(ml.create_log_factory(ml.ASYNC, 'settings'))
+        self.assertRaises(ValueError, ml.create_log_factory, 'syslog', 'settings')
+
+    def test_store_factories(self):
+        with patch('quickfix.FileStoreFactory') as file_store:
+            self.assertEqual(file_store.return_value,
+                             ml.create_store_factory(ml.FILE, 'settings'))
+            file_store.assert_called_once_with('settings')
+        self.assertIsInstance(ml.create_store_factory(ml.MEMORY, 'settings'),
+                              fix.MemoryStoreFactory)
+        self.assertIsInstance(ml.create_store_factory(ml.NULL, 'settings'),
+                              fix.NullStoreFactory)
+        self.assertRaises(ValueError, ml.create_store_factory, 'mysql', 'settings')
+
+
+class TestAsyncMessageLogClass(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'logs', 'messages.bin')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        message_log = ml.AsyncMessageLog(self.filename)
+        with patch('time.time_ns', side_effect=[10, 20]) as _:
+            message_log.outgoing(REQUEST)
+            message_log.incoming(HEARTBEAT)
+        message_log.close()
+        self.assertEqual(2, message_log.logged)
+        self.assertEqual([(ml.OUTGOING, 10, REQUEST), (ml.INCOMING, 20, HEARTBEAT)],
+                         list(ml.read_message_log(self.filename)))
+
+    def test_quickfix_message(self):
+        message_log = ml.AsyncMessageLog(self.filename)
+        heartbeat = fix44.Heartbeat()
+        message_log.incoming(heartbeat)
+        message_log.close()
+        self.assertEqual([heartbeat.toString()],
+                         [message for _, _, message in ml.read_message_log(self.filename)])
+
+    def test_appends(self):
+        for message in (HEARTBEAT, REQUEST):
+            message_log = ml.AsyncMessageLog(self.filename)
+            message_log.incoming(message)
+            message_log.close()
+        self.assertEqual([HEARTBEAT, REQUEST],
+                         [message for _, _, message in ml.read_message_log(self.filename)])
+
+    def test_full_buffer_drops(self):
+        message_log = ml.AsyncMessageLog(self.filename, buffer_size=1)
+        with patch.object(message_log.buffer, 'put_nowait', side_effect=ml.Full) as _:
+            message_log.incoming(HEARTBEAT)
+        message_log.incoming(REQUEST)
+        message_log.close()
+        self.assertEqual(1, message_log.dropped)
+        self.assertEqual([REQUEST],
+                         [message for _, _, message in ml.read_message_log(self.filename)])
+
+    def test_partial_record(self):
+        message_log = ml.AsyncMessageLog(self.filename)
+        message_log.incoming(HEARTBEAT)
+        message_log.incoming(REQUEST)
+        message_log.close()
+        with open(self.filename, 'rb+') as log:
+            log.truncate(os.path.getsize(self.filename) - 1)
+        self.assertEqual([HEARTBEAT],
+                         [message for _, _, message in ml.read_message_log(self.filename)])
+
+    def test_not_a_message_log(self):
+        with open(os.path.join(self.directory.name, 'other'), 'wb') as other:
+            other.write(b'nonsense')
+        self.assertRaises(ValueError, list,
+                          ml.read_message_log(os.path.join(self.directory.name, 'other')))
+
+    def test_empty_file(self):
+        filename = os.path.join(self.directory.name, 'empty')
+        open(filename, 'wb').close()
+        self.assertRaises(ValueError, list, ml.read_message_log(filename))
+
+
+class TestToFileLog(unittest.TestCase):
+
+    def test_file_log_time(self):
+        self.assertEqual('20151109-20:20:33.240123', ml.file_log_time(1447100433240123456))
+
+    def test_to_file_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'messages.bin')
+            file_log = os.path.join(directory, 'messages.log')
+            message_log = ml.AsyncMessageLog(filename)
+            with patch('time.time_ns', side_effect=[1447100433240123456, 1447200000000000000]):
+                message_log.outgoing(REQUEST)
+                message_log.incoming(HEARTBEAT)
+            message_log.close()
+            self.assertEqual(2, ml.to_file_log(filename, file_log))
+            with open(file_log) as log:
+                self.assertEqual(['20151109-20:20:33.240123 : ' + REQUEST + '\n',
+                                  '20151111-00:00:00.000000 : ' + HEARTBEAT + '\n'],
+                                 log.readlines())
+            # readable by rebuild, a chunk per day, following the request
+            chunks = rb.scan_log(file_log)
+            self.assertEqual(['20151109-20:20:33.240123', '20151111-00:00:00.000000'],
+                             [chunk[0] for chunk in chunks])
+            self.assertEqual({'0': 'EUR/USD'}, chunks[1][4])
+
+
+if __name__ == '__main__':
+    unittest.main()
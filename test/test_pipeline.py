@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from threading import Event
+from unittest.mock import patch
+
+import app.bookbuilder as bb
+import app.filewriter as fw
+import app.pipeline as pl
+
+
+class TestSingleProcessPipelineClass(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.shutdown_event = Event()
+        self.pipeline = pl.SingleProcessPipeline(
+            self.shutdown_event,
+            builder_options={'max_levels': 2},
+            writer_options={'cache_size': 2, 'block_size': 4, 'file_path': self.directory.name,
+                            'layout': fw.RAW})
+
+    def tearDown(self):
+        if self.pipeline.writer.is_alive():
+            self.pipeline.consumer_shutdown_event.set()
+            self.pipeline.writer.join()
+        self.directory.cleanup()
+
+    def test_put(self):
+        with patch('app.bookbuilder.BookBuilder.process_item') as process_item:
+            self.pipeline.put((1, 'EURUSD', [], False))
+            process_item.assert_called_once_with((1, 'EURUSD', [], False))
+
+    def test_put_publishes_book(self):
+        self.pipeline.put((1, 'EURUSD', [['0', 100.0, 200.0, 1.23, 2.34, 'a', 'a']], False))
+        self.assertEqual(bb.PROVIDERS, self.pipeline.books.get_nowait()[1])
+        time, symbol, book = self.pipeline.books.get_nowait()
+        self.assertEqual((1, 'EURUSD', 1.23), (time, symbol, book['bid_px0'][0]))
+
+    def test_shutdown(self):
+        self.pipeline.start()
+        for i in range(1, 6):
+            self.pipeline.put((i, 'EURUSD', [['0', 100.0 * i, 200.0, 1.23, 2.34, 'lp', 'lp']],
+                               False))
+        self.shutdown_event.set()
+        self.pipeline.shutdown()
+        self.assertFalse(self.pipeline.writer.is_alive())
+        self.assertTrue(self.pipeline.consumer_shutdown_event.is_set())
+        filename = os.path.join(self.directory.name, '1970-01-01', 'EURUSD.bin')
+        books = fw.read_books(filename)
+        self.assertEqual([1, 2, 3, 4, 5], list(books['time']))
+        self.assertEqual(['', 'lp'], fw.read_providers(filename))
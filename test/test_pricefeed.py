@@ -1,3 +1,4 @@
+import datetime
 import unittest
 from unittest.mock import Mock, patch, call
 
@@ -81,6 +82,14 @@ class TestPriceFeedClass(unittest.TestCase):
             self.pricefeed.run()
             shutdown.assert_called()
 
+    def test_run_closes_message_log(self):
+        self.fix_adapter.isStopped = Mock(side_effect=[True])
+        self.pricefeed.set_fix_adapter(self.fix_adapter)
+        self.pricefeed.message_log = Mock()
+        with patch("app.pricefeed.PriceFeed.shutdown") as _:
+            self.pricefeed.run()
+        self.pricefeed.message_log.close.assert_called_once()
+
 # shutdown
     def test_shutdown(self):
         self.fix_adapter.isStopped = Mock(side_effect=[False])
@@ -98,6 +107,42 @@ class TestPriceFeedClass(unittest.TestCase):
         self.assertEqual((self.fix_mass_quote, 1),
                          self.pricefeed.handlers["i"].call_args[0])
 
+    def test_from_app_traced(self):
+        tracer = Mock()
+        self.pricefeed.tracer = tracer
+        self.pricefeed.active_subscriptions["0"] = "EURUSD"
+        self.pricefeed.active_subscriptions["1"] = "USDJPY"
+        with patch('app.pricefeed.monotonic_ns', side_effect=[1000, 5000, 6000]) as _:
+            with patch('app.pricefeed.time_ns', return_value=1447100433250000000) as _:
+                self.pricefeed.from_app(self.fix_mass_quote_quotesets, None)
+        # each quote set carries the stamps of its receipt and its put
+        self.assertEqual([(1000, 5000), (1000, 6000)],
+                         [args[0][0][4] for args in self.queue.put.call_args_list])
+        self.assertEqual(1447100433240000, self.queue.put.call_args[0][0][0])
+        self.assertEqual([call('skew', 'EURUSD', 10000), call('skew', 'USDJPY', 10000)],
+                         tracer.record.call_args_list)
+        self.assertEqual([call('decode', 'EURUSD', 1000, 5000),
+                          call('decode', 'USDJPY', 1000, 6000)],
+                         tracer.record_since.call_args_list)
+
+    def test_from_app_message_log(self):
+        self.pricefeed.message_log = Mock()
+        self.pricefeed.handlers["i"] = Mock()
+        self.pricefeed.from_app(self.fix_mass_quote, 1)
+        self.pricefeed.message_log.incoming.assert_called_once_with(self.fix_mass_quote)
+
+    def test_to_app_message_log(self):
+        self.pricefeed.message_log = Mock()
+        message = fix44.MassQuoteAcknowledgement()
+        self.pricefeed.to_app(message, 1)
+        self.pricefeed.message_log.outgoing.assert_called_once_with(message)
+
+    def test_from_admin_message_log(self):
+        self.pricefeed.message_log = Mock()
+        heartbeat = fix44.Heartbeat()
+        self.pricefeed.from_admin(heartbeat, 1)
+        self.pricefeed.message_log.incoming.assert_called_once_with(heartbeat)
+
     def test_from_app_market_data_snapshot(self):
         self.pricefeed.handlers["W"] = Mock()
         self.pricefeed.from_app(self.fix_market_data_snapshot, 1)
@@ -280,6 +325,26 @@ class TestPriceFeedClass(unittest.TestCase):
             msg = mock_session.sendToTarget.call_args[0]
             self.assertEqual('1', msg[0].getField(117))
 
+    def test_on_mass_quote_raw_decoder(self):
+        with patch('app.pricefeed.PriceFeed.send_ack') as send_ack:
+            self.pricefeed.raw_decoder = True
+            self.pricefeed.active_subscriptions["0"] = "EURUSD"
+            self.pricefeed.active_subscriptions["1"] = "AUDCAD"
+            self.pricefeed.on_mass_quote(self.fix_mass_quote_quotesets, None)
+            calls = [
+                call((1447100433240000, 'EURUSD', [['0', 1000000.0, 1000000.0, 1.51218, 1.51223, '1', '1']], False)),
+                call((1447100433240000, 'AUDCAD', [['0', 2000000.0, 2000000.0, 2.51218, 2.51223, '2', '2']], False))
+            ]
+            self.pricefeed.queue.put.assert_has_calls(calls)
+            send_ack.assert_not_called()
+
+    def test_on_mass_quote_raw_decoder_missing_subscription(self):
+        with patch('app.pricefeed.PriceFeed.send_ack') as send_ack:
+            self.pricefeed.raw_decoder = True
+            self.pricefeed.on_mass_quote(self.fix_mass_quote, None)
+            self.pricefeed.queue.put.assert_not_called()
+            send_ack.assert_not_called()
+
 class TestPriceFeedFunctions(unittest.TestCase):
 
     def test_create_market_data_request(self):
@@ -338,3 +403,84 @@ class TestPriceFeedFunctions(unittest.TestCase):
         quote_set.addGroup(quote_entry)
         res = pf.process_quote_set(quote_set, pxm44.MassQuote.NoQuoteSets.NoQuoteEntries())
         self.assertEqual([['QuoteEntryID', 100.0, 200.0, 1.23, 2.34, None, None]], res)
+
+    def test_sending_time_to_timestamp(self):
+        self.assertEqual(1447100433000000, pf.sending_time_to_timestamp('20151109-20:20:33'))
+        self.assertEqual(1447100433240000, pf.sending_time_to_timestamp('20151109-20:20:33.240'))
+        self.assertEqual(1447100433240123,
+                         pf.sending_time_to_timestamp('20151109-20:20:33.240123'))
+        # nanoseconds are truncated
+        self.assertEqual(1447100433240123,
+                         pf.sending_time_to_timestamp('20151109-20:20:33.240123999'))
+
+    def test_sending_time_to_timestamp_matches_strptime(self):
+        def strptime(sending_time):
+            strp_format = '%Y%m%d-%H:%M:%S.%f' if len(sending_time) > 17 else '%Y%m%d-%H:%M:%S'
+            return int(1e6*datetime.datetime.strptime(sending_time, strp_format)
+                       .replace(tzinfo=datetime.timezone.utc).timestamp())
+        parser = pf.SendingTimeParser()
+        start = datetime.datetime(2021, 3, 28, 23, 59, 58, 999000)
+        for i in range(3000):
+            stamp = start + datetime.timedelta(microseconds=997 * i)
+            for fraction in ('', '.%03i' % (stamp.microsecond // 1000),
+                             '.%06i' % stamp.microsecond, '.%i' % (stamp.microsecond % 10)):
+                sending_time = stamp.strftime('%Y%m%d-%H:%M:%S') + fraction
+                self.assertEqual(strptime(sending_time), parser.to_timestamp(sending_time))
+
+    def test_sending_time_to_timestamp_invalid(self):
+        parser = pf.SendingTimeParser()
+        for sending_time in ('20151109-20:20:33.', '20151109-20:20:33,240',
+                             '20151109-20:20:33.1234567890', '20151109-20:20:33.24x',
+                             '20151309-20:20:33', '20151109-24:00:00', '20151109 20:20:33',
+                             '2015110-20:20:33', '20210328-21:00:00.1_2',
+                             '20210328-21:00:00. 12', '20210328-21:00:00.+12',
+                             '20210328-21:00:00.123456xyz', '20210328-21:00:0_',
+                             '2021032_-21:00:00', '20210328-+1:00:00', '20210328-21:00:00.\u0661'):
+            with self.subTest(sending_time=sending_time):
+                self.assertRaises(ValueError, parser.to_timestamp, sending_time)
+
+
+class TestRawDecoderEquivalence(unittest.TestCase):
+    """decode_mass_quote must match process_quote_set for every MassQuote we test with"""
+
+    MESSAGES = [
+        # test_pricefeed.py
+        "8=FIX.4.4|9=135|35=i|34=2|49=XCxxx|52=20151109-20:20:33.240|56=Q01|117=1|296=1|302=0|295=1|299=0|106=1|134=1000000|135=1000000|188=1.51218|190=1.51223|10=235|",
+        "8=FIX.4.4|9=201|35=i|34=2|49=XCxxx|52=20151109-20:20:33.240|56=Q01|296=2|302=0|295=1|299=0|106=1|134=1000000|135=1000000|188=1.51218|190=1.51223|302=1|295=1|299=0|106=2|134=2000000|135=2000000|188=2.51218|190=2.51223|10=208|",
+        # test_integration.py
+        "8=FIX.4.4|9=184|35=i|34=6|49=XC461|52=20210328-21:00:17.157|56=Q000|117=1|296=1|302=0|295=2|299=0|106=0|134=1100000|135=2200000|188=2.47|190=2.49|299=1|106=1|134=1100000|135=2200000|188=2.46|190=2.48|10=245|",
+        "8=FIX.4.4|9=304|35=i|34=6|49=XC461|52=20210328-21:00:17.159|56=Q000|117=1|296=2|302=0|295=2|299=0|106=1|134=1200000|135=1200000|188=2.46|190=2.47|299=1|106=0|134=2300000|135=2300000|188=2.45|190=2.48|302=1|295=2|299=0|106=0|134=2200000|135=1100000|188=1.47|190=1.49|299=1|106=1|134=2200000|135=1100000|188=1.46|190=1.49|10=117|",
+        "8=FIX.4.4|9=91|35=i|34=6|49=XC461|52=20210328-21:00:17.160|56=Q000|296=1|302=0|295=1|299=0|106=1|188=2.44|10=0|",
+        "8=FIX.4.4|9=88|35=i|34=6|49=XC461|52=20210328-21:00:17.161|56=Q000|296=1|302=0|295=1|299=1|134=2400000|10=135|",
+        "8=FIX.4.4|9=91|35=i|34=6|49=XC461|52=20210328-21:00:17.162|56=Q000|296=1|302=0|295=1|299=0|106=0|188=2.43|10=0|",
+        "8=FIX.4.4|9=91|35=i|34=6|49=XC461|52=20210328-21:00:17.163|56=Q000|296=1|302=0|295=1|299=1|106=0|190=2.49|10=1|",
+        "8=FIX.4.4|9=88|35=i|34=6|49=XC461|52=20210328-21:00:17.164|56=Q000|296=1|302=0|295=1|299=0|135=1300000|10=136|",
+        "8=FIX.4.4|9=91|35=i|34=6|49=XC461|52=20210328-21:00:17.165|56=Q000|296=1|302=0|295=1|299=1|106=1|190=2.46|10=1|",
+        "8=FIX.4.4|9=124|35=i|34=6|49=XC461|52=20210328-21:02:17.157|56=Q000|296=1|302=1|295=1|299=0|106=0|134=1000000|135=1100000|188=1.33|190=1.35|10=33|",
+        "8=FIX.4.4|9=124|35=i|34=6|49=XC461|52=20210328-21:03:17.157|56=Q000|296=1|302=0|295=1|299=0|106=0|134=1000000|135=1100000|188=1.33|190=1.35|10=33|",
+        "8=FIX.4.4|9=124|35=i|34=6|49=XC461|52=20210328-21:03:17.157|56=Q000|296=1|302=1|295=1|299=1|106=1|134=2000000|135=2100000|188=2.33|190=2.35|10=40|",
+        # delete entries
+        "8=FIX.4.4|9=96|35=i|34=6|49=XC461|52=20210328-21:03:17.157|56=Q000|296=1|302=1|295=2|299=0|134=-1|299=1|135=-1|10=223|",
+    ]
+
+    def setUp(self):
+        self.data_dictionary = fix.DataDictionary()
+        self.data_dictionary.readFromURL("spec/pxm44.xml")
+        self.pricefeed = pf.PriceFeed(Mock(), Mock(), [])
+
+    def assert_equivalent(self, message):
+        expected = list(self.pricefeed.iter_quote_sets(message))
+        res = pf.decode_mass_quote(message.toString())
+        self.assertEqual(expected, res)
+
+    def test_messages(self):
+        for fix_string in self.MESSAGES:
+            with self.subTest(fix_string=fix_string):
+                self.assert_equivalent(fix.Message(fix_string.replace("|", "\x01"),
+                                                   self.data_dictionary))
+
+    def test_large_message(self):
+        # re-use the 9 quote set message from TestPriceFeedClass
+        fixtures = TestPriceFeedClass()
+        fixtures.setUp()
+        self.assert_equivalent(fixtures.fix_mass_quote_large)
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import app.rawfile as rf
+
+
+class TestRawFileClass(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'key.bin')
+        self.dtype = np.dtype([('time', 'uint64'), ('bid_px0', 'float64'), ('bid_provider0', 'S1')])
+        self.rows = np.array([(i, i / 10, b'a') for i in range(1, 6)], dtype=self.dtype)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_create(self):
+        raw_file = rf.RawFile.create(self.filename, self.dtype, '2021-03-28', 4)
+        self.assertEqual(0, raw_file.rows)
+        self.assertEqual(4, raw_file.capacity)
+        self.assertEqual(0, raw_file.header_size % rf.PAGE_SIZE)
+        self.assertEqual(raw_file.header_size + 4 * self.dtype.itemsize,
+                         os.path.getsize(self.filename))
+        raw_file.close()
+        header = rf.read_header(self.filename)
+        self.assertEqual(self.dtype, header['dtype'])
+        self.assertEqual('2021-03-28', header['date'])
+        self.assertEqual(0, header['rows'])
+
+    def test_append(self):
+        raw_file = rf.RawFile.create(self.filename, self.dtype, block_size=4)
+        self.assertEqual(2, raw_file.append(self.rows[:2]))
+        # readers only see committed rows
+        self.assertEqual([1, 2], list(rf.open_books(self.filename)['time']))
+        self.assertEqual(5, raw_file.append(self.rows[2:]))
+        self.assertEqual(8, raw_file.capacity)
+        raw_file.close()
+        books = rf.open_books(self.filename)
+        self.assertEqual(self.rows.tobytes(), books.tobytes())
+
+    def test_reopen(self):
+        raw_file = rf.RawFile.create(self.filename, self.dtype, block_size=4)
+        raw_file.append(self.rows[:3])
+        raw_file.close()
+        raw_file = rf.RawFile(self.filename, block_size=4)
+        self.assertEqual(3, raw_file.rows)
+        self.assertEqual(5, raw_file.append(self.rows[3:]))
+        raw_file.close()
+        self.assertEqual(list(range(1, 6)), list(rf.open_books(self.filename)['time']))
+
+    def test_set_providers(self):
+        raw_file = rf.RawFile.create(self.filename, self.dtype, block_size=4)
+        self.assertEqual([], rf.read_header(self.filename)['providers'])
+        raw_file.set_providers(('', 'lp1'))
+        self.assertEqual(['', 'lp1'], rf.read_header(self.filename)['providers'])
+        raw_file.set_providers(('', 'lp1', 'a much longer provider'))
+        raw_file.append(self.rows)
+        raw_file.close()
+        raw_file = rf.RawFile(self.filename, block_size=4)
+        self.assertEqual(['', 'lp1', 'a much longer provider'], raw_file.providers)
+        raw_file.close()
+        self.assertEqual(self.rows.tobytes(), rf.open_books(self.filename).tobytes())
+
+    def test_set_providers_keeps_codes(self):
+        raw_file = rf.RawFile.create(self.filename, self.dtype, block_size=4)
+        raw_file.set_providers(('', 'lp1', 'lp2'))
+        self.assertRaises(ValueError, raw_file.set_providers, ('', 'lp2'))
+        self.assertRaises(ValueError, raw_file.set_providers, ('', 'lp2', 'lp1'))
+        raw_file.close()
+        self.assertEqual(['', 'lp1', 'lp2'], rf.read_header(self.filename)['providers'])
+
+    def test_set_providers_grows_header(self):
+        raw_file = rf.RawFile.create(self.filename, self.dtype, block_size=4)
+        raw_file.append(self.rows[:3])
+        header_size = raw_file.header_size
+        reader = rf.open_books(self.filename)
+        # more names than fit in the header
+        names = [''] + ['provider %04i' % i for i in range(1000)]
+        self.assertGreater(len(''.join(names)), header_size)
+        raw_file.set_providers(names)
+        self.assertGreater(raw_file.header_size, header_size)
+        self.assertEqual(0, raw_file.header_size % rf.PAGE_SIZE)
+        self.assertEqual(names, rf.read_header(self.filename)['providers'])
+        self.assertEqual(self.rows[:3].tobytes(), rf.open_books(self.filename).tobytes())
+        # readers of the old file are unaffected
+        self.assertEqual(self.rows[:3].tobytes(), reader.tobytes())
+        raw_file.append(self.rows[3:])
+        raw_file.close()
+        raw_file = rf.RawFile(self.filename, block_size=4)
+        self.assertEqual(names, raw_file.providers)
+        raw_file.close()
+        self.assertEqual(self.rows.tobytes(), rf.open_books(self.filename).tobytes())
+        self.assertEqual(['key.bin'], os.listdir(self.directory.name))
+
+    def test_open_books_empty(self):
+        rf.RawFile.create(self.filename, self.dtype).close()
+        books = rf.open_books(self.filename)
+        self.assertEqual(0, len(books))
+        self.assertEqual(self.dtype, books.dtype)
+
+    def test_read_header_not_raw_file(self):
+        with open(self.filename, 'wb') as raw_file:
+            raw_file.write(b'\x00' * 64)
+        self.assertRaises(ValueError, rf.read_header, self.filename)
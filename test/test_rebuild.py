@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import quickfix as fix
+
+import app.filewriter as fw
+import app.rebuild as rb
+
+
+def fix_line(log_time, fields):
+    """A FileLog line of a message of fields, e.g. ['35=i', ...]"""
+    body = '\x01'.join(fields) + '\x01'
+    raw = '8=FIX.4.4\x019=%i\x01' % len(body) + body
+    raw += '10=%03i\x01' % (sum(raw.encode()) % 256)
+    return ('%s : %s\n' % (log_time, raw)).encode()
+
+
+def request(log_time, md_req_id, symbol):
+    return fix_line(log_time, ['35=V', '34=2', '49=MARK', '52=%s' % log_time[:21], '56=MINIFIX',
+                               '146=1', '55=%s' % symbol, '262=%s' % md_req_id, '263=1',
+                               '264=0'])
+
+
+def mass_quote(log_time, quote_set_id, entry_id, bid):
+    return fix_line(log_time, ['35=i', '34=3', '49=MINIFIX', '52=%s' % log_time[:21],
+                               '56=MARK', '117=1', '296=1', '302=%s' % quote_set_id, '295=1',
+                               '299=%s' % entry_id, '106=1', '134=1000000', '135=1000000',
+                               '188=%s' % bid, '190=1.3'])
+
+
+def reject(log_time, md_req_id):
+    return fix_line(log_time, ['35=Y', '34=4', '49=MINIFIX', '52=%s' % log_time[:21],
+                               '56=MARK', '58=symbol not found', '262=%s' % md_req_id])
+
+
+LOG = [
+    request('20210101-23:59:58.000000000', '0', 'EUR/USD'),
+    request('20210101-23:59:58.000000000', '1', 'XAU/USD'),
+    reject('20210101-23:59:58.000000000', '1'),
+    mass_quote('20210101-23:59:59.000000000', '0', '0', '1.1'),
+    mass_quote('20210102-00:00:01.000000000', '0', '1', '1.2'),
+    mass_quote('20210102-00:00:02.000000000', '0', '0', '1.15'),
+]
+
+
+class TestRebuildFuncs(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.directory.name, 'FIX.4.4-MARK-MINIFIX.messages.current.log')
+        with open(self.log, 'wb') as log:
+            log.write(b''.join(LOG))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_find_logs(self):
+        self.assertEqual([self.log], rb.find_logs([self.directory.name]))
+        self.assertEqual(['other.log'], rb.find_logs(['other.log']))
+
+    def test_scan_log(self):
+        first, second = rb.scan_log(self.log)
+        day_one = sum(len(line) for line in LOG[:4])
+        self.assertEqual(('20210101-23:59:58.000000000', self.log, 0, day_one, {}), first)
+        # the reject cancelled XAU/USD
+        self.assertEqual(('20210102-00:00:01.000000000', self.log, day_one,
+                          os.path.getsize(self.log), {'0': 'EUR/USD'}), second)
+
+    def test_decode_chunk(self):
+        directory = os.path.join(self.directory.name, 'work')
+        chunk = rb.scan_log(self.log)[1]
+        self.assertEqual(2, rb.decode_chunk((3, chunk, directory, 'spec/pxm44.xml')))
+        self.assertEqual(['00000003.cap'], os.listdir(os.path.join(directory, 'EURUSD')))
+
+    def test_rebuild(self):
+        path = os.path.join(self.directory.name, 'books')
+        results = rb.rebuild([self.directory.name], builder_options={'max_levels': 2},
+                             writer_options={'file_path': path, 'layout': fw.RAW,
+                                             'cache_size': 2, 'block_size': 4},
+                             processes=1)
+        self.assertEqual({'EURUSD': (3, 3)}, results)
+        first = fw.read_books(os.path.join(path, '2021-01-01', 'EURUSD.bin'))
+        second = fw.read_books(os.path.join(path, '2021-01-02', 'EURUSD.bin'))
+        self.assertEqual([1.1], list(first['bid_px0']))
+        # quotes carry over from the previous day
+        self.assertEqual([[1.2, 1.1], [1.2, 1.15]],
+                         [list(book) for book in zip(second['bid_px0'], second['bid_px1'])])
+
+    def test_rebuild_replaces_existing_files(self):
+        path = os.path.join(self.directory.name, 'books')
+        for layout in (fw.RAW, fw.COLUMNS):
+            with self.subTest(layout=layout):
+                writer_options = {'file_path': path, 'layout': layout,
+                                  'cache_size': 2, 'block_size': 4}
+                for _ in range(2):
+                    rb.rebuild([self.log], builder_options={'max_levels': 2},
+                               writer_options=writer_options, processes=1)
+                filename = os.path.join(path, '2021-01-02', 'EURUSD' + fw.EXTENSIONS[layout])
+                self.assertEqual(2, len(fw.read_books(filename)))
+                # deeper books over the old ones
+                rb.rebuild([self.log], builder_options={'max_levels': 3},
+                           writer_options=writer_options, processes=1)
+                books = fw.read_books(filename)
+                self.assertEqual(2, len(books))
+                self.assertIn('bid_px2', books.dtype.names)
+                self.assertEqual([[1.2, 1.1], [1.2, 1.15]],
+                                 [list(book) for book in zip(books['bid_px0'], books['bid_px1'])])
+        # no scratch directories left behind
+        self.assertEqual(['2021-01-01', '2021-01-02'], sorted(os.listdir(path)))
+
+    def test_rebuild_needs_file_path(self):
+        self.assertRaises(ValueError, rb.rebuild, [self.log], writer_options={})
+
+
+class TestLogFeedClass(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = Mock()
+        data_dictionary = fix.DataDictionary()
+        data_dictionary.readFromURL('spec/pxm44.xml')
+        self.feed = rb.LogFeed(self.queue, {}, data_dictionary)
+
+    def test_on_line(self):
+        self.feed.on_line(LOG[0])
+        self.assertEqual({'0': 'EURUSD'}, self.feed.active_subscriptions)
+        self.feed.on_line(LOG[3])
+        self.queue.put.assert_called_once_with(
+            (1609545599000000, 'EURUSD', [['0', 1000000.0, 1000000.0, 1.1, 1.3, '1', '1']],
+             False))
+
+    def test_on_line_ignored(self):
+        self.feed.on_line(fix_line('20210101-23:59:58.000000000',
+                                   ['35=A', '34=1', '49=MARK', '52=20210101-23:59:58',
+                                    '56=MINIFIX', '98=0', '108=30']))
+        self.queue.put.assert_not_called()
@@ -0,0 +1,97 @@
+import sys
+import unittest
+import pickle
+
+from queue import Empty, Full
+
+if sys.version_info >= (3, 8):
+    from app.ringbuffer import RingBuffer
+
+
+@unittest.skipIf(sys.version_info < (3, 8), 'multiprocessing.shared_memory needs Python 3.8')
+class TestRingBufferClass(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = RingBuffer(slots=4, slot_entries=2, poll_interval=0.001, spin=0,
+                               put_timeout=0.01)
+        self.item = (1616965217157000, 'EURUSD', [
+            ['0', 1000000.0, 2000000.0, 2.47, 2.49, '0', '1'],
+        ], False)
+
+    def tearDown(self):
+        self.ring.close()
+        self.ring.unlink()
+
+    def test_put_get(self):
+        self.ring.put(self.item)
+        self.assertEqual(1, self.ring.qsize())
+        self.assertEqual(self.item, self.ring.get())
+        self.assertTrue(self.ring.empty())
+
+    def test_put_get_missing_fields(self):
+        item = (1616965217160000, 'EURUSD', [
+            ['0', None, None, 2.44, None, '1', None],
+            ['1', -1.0, None, None, None, None, None],
+            ['2', None, 1300000.0, None, None, None, ''],
+        ], True)
+        self.ring.put(item)
+        self.assertEqual(item, self.ring.get())
+
+    def test_put_get_no_entries(self):
+        item = (1616965217160000, 'EURUSD', [], True)
+        self.ring.put(item)
+        self.assertEqual(item, self.ring.get())
+
+    def test_put_get_multiple_slots(self):
+        item = (1616965217160000, 'EURUSD', [
+            [str(i), 1000000.0, 1000000.0, 1.0 + i, 2.0 + i, '0', '0'] for i in range(5)
+        ], False)
+        self.ring.put(item)
+        self.assertEqual(3, self.ring.qsize())
+        self.assertEqual(item, self.ring.get())
+        self.assertEqual(0, self.ring.qsize())
+
+    def test_wrap_around(self):
+        for i in range(10):
+            item = (i, 'EURUSD', [[str(i), 1.0, 1.0, 1.0, 1.0, '0', '0']] * 3, False)
+            self.ring.put(item)
+            self.assertEqual(item, self.ring.get())
+
+    def test_get_empty(self):
+        self.assertRaises(Empty, self.ring.get, block=False)
+        self.assertRaises(Empty, self.ring.get, block=True, timeout=0.01)
+        self.assertRaises(Empty, self.ring.get_nowait)
+
+    def test_put_full(self):
+        for _ in range(4):
+            self.ring.put(self.item)
+        self.assertRaises(Full, self.ring.put, self.item, block=False)
+        self.assertRaises(Full, self.ring.put, self.item, timeout=0.01)
+        # a consumer that has gone away does not block put() forever
+        with self.assertLogs('app.ringbuffer', 'ERROR'):
+            self.assertRaises(Full, self.ring.put, self.item)
+        self.ring.get()
+        self.ring.put(self.item, block=False)
+
+    def test_put_too_large(self):
+        item = (1, 'EURUSD', [['0', 1.0, 1.0, 1.0, 1.0, '0', '0']] * 9, False)
+        self.assertRaises(ValueError, self.ring.put, item)
+
+    def test_put_field_too_wide(self):
+        item = (1, 'EURUSD', [['0', 1.0, 1.0, 1.0, 1.0, 'x' * 17, '0']], False)
+        self.assertRaises(ValueError, self.ring.put, item)
+
+    def test_attach_by_name(self):
+        other = pickle.loads(pickle.dumps(self.ring))
+        self.assertEqual(self.ring.name, other.name)
+        self.assertEqual(0.01, other.put_timeout)
+        self.ring.put(self.item)
+        self.assertEqual(self.item, other.get())
+        self.assertTrue(self.ring.empty())
+        other.close()
+
+    def test_close_join_thread(self):
+        ring = RingBuffer(slots=1, slot_entries=1)
+        ring.close()
+        ring.join_thread()
+        ring.unlink()
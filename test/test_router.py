@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import Mock
+
+import app.bookbuilder as bb
+import app.filewriter as fw
+import app.router as router
+
+
+class TestSymbolRouterClass(unittest.TestCase):
+
+    def setUp(self):
+        self.queues = [Mock(), Mock()]
+        self.router = router.SymbolRouter(self.queues, ['EURUSD', 'USDCAD', 'GBPUSD'])
+
+    def test_shard_subscriptions(self):
+        self.assertEqual(0, self.router.shard('EURUSD'))
+        self.assertEqual(1, self.router.shard('USDCAD'))
+        self.assertEqual(0, self.router.shard('GBPUSD'))
+
+    def test_shard_unknown_symbol(self):
+        shard = self.router.shard('AUDUSD')
+        self.assertEqual(router.shard_of('AUDUSD', 2), shard)
+        self.assertEqual(shard, self.router.shards['AUDUSD'])
+
+    def test_put(self):
+        self.router.put((1, 'USDCAD', [], False))
+        self.router.put((2, 'EURUSD', [], True))
+        self.router.put((3, 'USDCAD', [], False))
+        self.assertEqual([1, 3], [args[0][0][0] for args in self.queues[1].put.call_args_list])
+        self.assertEqual([2], [args[0][0][0] for args in self.queues[0].put.call_args_list])
+
+    def test_shard_of_stable(self):
+        # same answer in every process, unlike hash()
+        self.assertEqual(3, router.shard_of('EURUSD', 4))
+        for shards in range(1, 8):
+            self.assertTrue(0 <= router.shard_of('USDJPY', shards) < shards)
+
+
+class TestBookRouterClass(unittest.TestCase):
+
+    def setUp(self):
+        self.queues = [Mock(), Mock()]
+        self.router = router.BookRouter(self.queues, ['EURUSD', 'USDCAD'])
+
+    def items(self, shard):
+        return [args[0][0] for args in self.queues[shard].put.call_args_list]
+
+    def test_put(self):
+        self.router.put((1, bb.PROVIDERS, ('USDCAD', ('', 'a'))))
+        self.router.put((1, 'USDCAD', 'book1'))
+        self.router.put((2, 'EURUSD', 'book2'))
+        self.assertEqual([(1, fw.CLOCK, None), (1, bb.PROVIDERS, ('USDCAD', ('', 'a'))),
+                          (1, 'USDCAD', 'book1')], self.items(1))
+        self.assertEqual([(1, fw.CLOCK, None), (2, 'EURUSD', 'book2')], self.items(0))
+
+    def test_put_traced(self):
+        self.router.put((1, 'USDCAD', 'book1', (1, 2, 3, 4)))
+        self.assertEqual((1, 'USDCAD', 'book1', (1, 2, 3, 4)), self.items(1)[-1])
+
+    def test_put_new_day(self):
+        self.router.put((1, 'EURUSD', 'book1'))
+        self.router.put((router.DAY + 1, 'EURUSD', 'book2'))
+        self.router.put((router.DAY + 2, 'EURUSD', 'book3'))
+        # every shard hears of the new day, once
+        self.assertEqual([(1, fw.CLOCK, None), (router.DAY + 1, fw.CLOCK, None)], self.items(1))
+        self.assertEqual(5, len(self.items(0)))
+
+
+class TestAllEventsClass(unittest.TestCase):
+
+    def test_is_set(self):
+        events = [Mock(), Mock()]
+        events[0].is_set = Mock(return_value=True)
+        events[1].is_set = Mock(return_value=False)
+        all_events = router.AllEvents(events)
+        self.assertFalse(all_events.is_set())
+        events[1].is_set = Mock(return_value=True)
+        self.assertTrue(all_events.is_set())
@@ -0,0 +1,146 @@
+import unittest
+from unittest.mock import Mock, patch
+
+import quickfix as fix
+import quickfix44 as fix44
+
+import app.pricefeed as pf
+import app.pxm44 as pxm44
+import app.simulator as sim
+
+
+class TestSimulatorClass(unittest.TestCase):
+
+    def setUp(self):
+        self.shutdown_event = Mock()
+        self.simulator = sim.Simulator(self.shutdown_event, ['EUR/USD', 'USD/JPY', 'GBP/USD'],
+                                       quote_sets=2, entries=3, providers=2, ack_every=2,
+                                       seed=1)
+
+    def market_data_request(self, md_req_id, symbol):
+        return pf.create_market_data_request(md_req_id, symbol)
+
+    def subscribe(self, *symbols):
+        with patch('quickfix.Session') as session:
+            for i, symbol in enumerate(symbols):
+                self.simulator.on_market_data_request(self.market_data_request(str(i), symbol),
+                                                      'session')
+        return session
+
+    def test_on_logon(self):
+        self.simulator.on_logon('session')
+        self.assertEqual('session', self.simulator.session_id)
+
+    def test_on_logout(self):
+        self.simulator.on_logon('session')
+        self.subscribe('EUR/USD')
+        self.simulator.outstanding['1'] = 0.0
+        self.simulator.on_logout('session')
+        self.assertIsNone(self.simulator.session_id)
+        self.assertEqual([], self.simulator.streams)
+        self.assertEqual({}, self.simulator.outstanding)
+
+    def test_from_app_market_data_request(self):
+        with patch('app.simulator.Simulator.on_market_data_request') as handler:
+            self.simulator.handlers[fix.MsgType_MarketDataRequest] = handler
+            message = self.market_data_request('0', 'EUR/USD')
+            self.simulator.from_app(message, 'session')
+            handler.assert_called_once_with(message, 'session')
+
+    def test_on_market_data_request(self):
+        session = self.subscribe('EUR/USD')
+        snapshot, session_id = session.sendToTarget.call_args[0]
+        self.assertEqual('session', session_id)
+        self.assertEqual('W', snapshot.getHeader().getField(35))
+        self.assertEqual(('0', 'EUR/USD'), (snapshot.getField(262), snapshot.getField(55)))
+        self.assertEqual('6', snapshot.getField(268))  # a bid and an offer per entry
+        self.assertEqual([('0', self.simulator.markets['EUR/USD'])], self.simulator.streams)
+
+    def test_on_market_data_request_unknown_symbol(self):
+        session = self.subscribe('XAU/USD')
+        reject = session.sendToTarget.call_args[0][0]
+        self.assertEqual('Y', reject.getHeader().getField(35))
+        self.assertEqual('0', reject.getField(262))
+        self.assertEqual([], self.simulator.streams)
+
+    def test_send_mass_quote(self):
+        self.subscribe('EUR/USD', 'USD/JPY', 'GBP/USD')
+        with patch('quickfix.Session') as session:
+            self.simulator.send_mass_quote()
+            self.simulator.send_mass_quote()
+            first, second = [args[0][0] for args in session.sendToTarget.call_args_list]
+        quote_set = pxm44.MassQuote.NoQuoteSets()
+        # quote sets round robin over the subscriptions
+        self.assertEqual(['0', '1'], quote_set_ids(first, quote_set))
+        self.assertEqual(['2', '0'], quote_set_ids(second, quote_set))
+        # every second message asks for acknowledgement
+        self.assertFalse(first.isSetField(117))
+        self.assertEqual('2', second.getField(117))
+        self.assertEqual(['2'], list(self.simulator.outstanding))
+        self.assertEqual(2, self.simulator.sent)
+
+    def test_on_mass_quote_ack(self):
+        self.simulator.outstanding['2'] = 0.0
+        ack = fix44.MassQuoteAcknowledgement()
+        ack.setField(fix.QuoteID('2'))
+        self.simulator.on_mass_quote_ack(ack, 'session')
+        self.assertEqual({}, self.simulator.outstanding)
+        self.assertEqual(1, self.simulator.acks)
+
+    def test_on_mass_quote_ack_unexpected(self):
+        ack = fix44.MassQuoteAcknowledgement()
+        ack.setField(fix.QuoteID('3'))
+        with self.assertLogs('app.simulator', 'WARNING'):
+            self.simulator.on_mass_quote_ack(ack, 'session')
+        self.assertEqual(0, self.simulator.acks)
+
+    def test_shutdown(self):
+        self.simulator.fix_adapter = Mock()
+        self.simulator.fix_adapter.isStopped = Mock(return_value=False)
+        self.simulator.shutdown()
+        self.simulator.fix_adapter.stop.assert_called_once()
+        self.shutdown_event.set.assert_called_once()
+
+
+class TestSimulatorFuncs(unittest.TestCase):
+
+    def test_make_symbols(self):
+        self.assertEqual(['EUR/USD', 'EUR/JPY', 'EUR/GBP'], sim.make_symbols(3))
+        self.assertEqual(380, len(set(sim.make_symbols(380))))
+        self.assertRaises(ValueError, sim.make_symbols, 381)
+
+    def test_market_tick(self):
+        market = sim.Market('USD/JPY', 4, 3, sim.random.Random(1))
+        for _ in range(100):
+            market.tick()
+            self.assertEqual(['0', '1', '2', '3'], [entry[0] for entry in market.entries])
+            self.assertEqual(['0', '1', '2', '0'], [entry[1] for entry in market.entries])
+            for entry in market.entries:
+                self.assertLess(entry[4], entry[5])
+            # deeper entries are quoted wider
+            bids = [entry[4] for entry in market.entries]
+            self.assertEqual(sorted(bids, reverse=True), bids)
+
+    def test_create_mass_quote(self):
+        entries = [['0', '1', 1000000, 2000000, 1.2345, 1.2347]]
+        message = sim.create_mass_quote([('5', entries)], '7')
+        self.assertEqual('7', message.getField(117))
+        quote_set = pxm44.MassQuote.NoQuoteSets()
+        message.getGroup(1, quote_set)
+        self.assertEqual('5', quote_set.getField(302))
+        # as decoded by the price feed
+        self.assertEqual([['0', 1000000.0, 2000000.0, 1.2345, 1.2347, '1', '1']],
+                         pf.process_quote_set(quote_set,
+                                              pxm44.MassQuote.NoQuoteSets.NoQuoteEntries()))
+
+    def test_create_market_data_request_reject(self):
+        message = sim.create_market_data_request_reject('3', 'symbol not found')
+        self.assertEqual(('3', 'symbol not found'), (message.getField(262), message.getField(58)))
+
+
+def quote_set_ids(message, quote_set):
+    ids = []
+    for i in range(int(message.getField(296))):
+        message.getGroup(1 + i, quote_set)
+        ids.append(quote_set.getField(302))
+    return ids